@@ -9,14 +9,21 @@ Changes from original:
   - Added participant roster with group distribution.
   - Preserved all original layout patterns.
   - Added agent pipeline health check.
+  - Health monitor lists tables from the configured storage backend
+    (Sheets, SQLite or in-memory) instead of opening the spreadsheet.
 """
 
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from database_manager import get_gspread_client, fetch_agent_interaction_summary
-
-SHEET_KEY = "1UqWkZKJdT2CQkZn5-MhEzpSRHsKE4qAeA17H0BOnK60"
+from agent_engine import engine_stats
+from response_cache import get_response_cache
+from session_checkpoints import checkpoint_stats
+from database_manager import (
+    get_storage, fetch_agent_interaction_summary,
+    flush_event_logs, get_event_logger, pending_event_logs, read_sheet,
+    sheets_quota_stats,
+)
 
 KNOWN_SHEETS = [
     "Participants",
@@ -33,25 +40,49 @@ def show_admin_portal():
     st.caption("System health, participant management, and data integrity monitoring")
 
     try:
-        client = get_gspread_client()
-        sh     = client.open_by_key(SHEET_KEY)
+        storage = get_storage()
 
         # ── System health ──────────────────────────────────────────────────────
         st.markdown("### 🛡️ Database Health Monitor")
+        queued = pending_event_logs()
+        if queued:
+            st.caption(
+                "⏳ Rows queued for write-behind: "
+                + ", ".join(f"{k}: {v}" for k, v in queued.items())
+            )
+            # Explicit sync only — flushing blocks on Sheets round-trips
+            if st.button("🔄 Sync now", key="admin_sync"):
+                written = flush_event_logs()
+                st.success(f"Synced {written} row(s).")
+        if storage.name == "sheets":
+            # Only the Sheets backend queues rows in the write-behind logger
+            logger_stats = get_event_logger().stats
+            if logger_stats["spilled"] or logger_stats["dropped"]:
+                st.caption(
+                    f"💾 Write-behind overflow — spilled to disk: "
+                    f"{logger_stats['spilled']}, dropped: {logger_stats['dropped']}"
+                )
+            quota = sheets_quota_stats()
+            st.caption(
+                f"📶 Sheets API — calls: {quota['calls']}, "
+                f"throttled: {quota['throttled']}, retries: {quota['retries']}, "
+                f"dropped: {quota['dropped']}"
+                + (f" (last error: {quota['last_error']})" if quota["last_error"] else "")
+            )
+        else:
+            st.caption(f"🗄️ Storage backend: {storage.name}")
         health_cols = st.columns(len(KNOWN_SHEETS))
-        sheet_names = [ws.title for ws in sh.worksheets()]
+        tables      = set(storage.tables())
 
         for i, sheet_name in enumerate(KNOWN_SHEETS):
             with health_cols[i]:
-                if sheet_name in sheet_names:
+                if sheet_name in tables:
                     try:
-                        ws      = sh.worksheet(sheet_name)
-                        n_rows  = max(ws.row_count - 1, 0)   # exclude header
-                        records = len(ws.get_all_records())
+                        records = len(read_sheet(sheet_name))
                         st.metric(
                             sheet_name,
                             f"{records} rows",
-                            help=f"Sheet exists ✅ ({n_rows} allocated rows)",
+                            help="Sheet exists ✅",
                         )
                     except Exception:
                         st.metric(sheet_name, "⚠️ Error")
@@ -73,13 +104,50 @@ def show_admin_portal():
                       key=summary["tap_distribution"].get))
         a5.metric("Triadic Fluency",   summary["rupak_sessions"],
                   help="Students who achieved all-three-level representation")
+        engine = engine_stats()
+        if engine:
+            st.caption(
+                f"🔌 Agent engine — in flight: {engine['in_flight']}/"
+                f"{engine['max_in_flight']} (peak {engine['peak_in_flight']}), "
+                f"queued: {engine['queued']} (peak {engine['peak_queued']}), "
+                f"completed: {engine['completed']}, failed: {engine['failed']}, "
+                f"timeouts: {engine['timeouts']}, rejected: {engine['rejected']}, "
+                f"avg wait {engine['avg_wait_ms']} ms / run {engine['avg_run_ms']} ms, "
+                f"connections: {engine['connections']} "
+                f"({engine['idle_connections']} idle, "
+                f"{engine['pool_utilisation']:.0%} of pool), "
+                f"breaker: {engine['breaker']['state']} "
+                f"(opened {engine['breaker']['opened']}×, "
+                f"shed {engine['breaker']['shed']})"
+            )
+        cache = get_response_cache()
+        if cache.agents:
+            cached = cache.stats()
+            st.caption(
+                f"💾 Response cache ({', '.join(sorted(cache.agents))}) — "
+                f"hit rate: {cached['total']['hit_rate']:.0%} "
+                f"({cached['total']['hits']} hits, "
+                f"{cached['total']['disk_hits']} from disk, "
+                f"{cached['total']['misses']} misses), "
+                f"entries: {cached['entries']}"
+            )
+        checkpoints = checkpoint_stats()
+        if checkpoints:
+            st.caption(
+                f"📌 Session checkpoints — queued: {checkpoints['queued']}, "
+                f"written: {checkpoints['written']}, "
+                f"unchanged: {checkpoints['unchanged']}, "
+                f"restored: {checkpoints['restored']}, "
+                f"pending: {checkpoints['pending']}, errors: {checkpoints['errors']} "
+                f"(retried: {checkpoints['retried']})"
+            )
 
         st.markdown("---")
 
         # ── Participant roster ─────────────────────────────────────────────────
         st.markdown("### 👥 Participant Roster")
         try:
-            part_df = pd.DataFrame(sh.worksheet("Participants").get_all_records())
+            part_df = read_sheet("Participants")
             if not part_df.empty:
                 col1, col2 = st.columns(2)
                 with col1:
@@ -112,7 +180,7 @@ def show_admin_portal():
         # ── Recent activity ────────────────────────────────────────────────────
         st.markdown("### 🕐 Recent Activity (Temporal Traces)")
         try:
-            trace_df = pd.DataFrame(sh.worksheet("Temporal_Traces").get_all_records())
+            trace_df = read_sheet("Temporal_Traces")
             if not trace_df.empty:
                 st.metric("Total Interaction Events", len(trace_df))
                 st.dataframe(
@@ -0,0 +1,376 @@
+"""
+agent_engine.py — MMALE Agent Call Engine
+==========================================
+Runs every OpenAI chat request made by the agents on one asyncio event loop
+in a dedicated background thread.
+
+Original: call_agent made a blocking HTTP call on the Streamlit script thread
+with no limit on how many ran at once across sessions, so a class of 40
+pressing Send together produced a burst of concurrent requests and a
+rate-limit storm. Now:
+
+  - requests are coroutines on the engine loop (AsyncOpenAI, one pooled
+    client per API key), so waiting replies cost no threads;
+  - an asyncio.Semaphore caps requests in flight (AGENT_MAX_IN_FLIGHT);
+    the rest queue in arrival order and give up with AgentEngineBusy after
+    AGENT_QUEUE_TIMEOUT_SECS;
+  - every request has an overall deadline (AGENT_REQUEST_TIMEOUT_SECS,
+    streams included) and fails with AgentTimeout when it passes; a
+    caller's `deadline` is fixed when the request is submitted, so time
+    spent queued for a slot comes out of the same budget;
+  - engine_stats() reports queue depth, in-flight count, peaks, timeouts,
+    average wait / latency and HTTP connection-pool use for the admin
+    dashboard;
+  - CircuitBreaker tracks the primary model's recent error rate so callers
+    can shed load to a fallback model (see agents.py, RESILIENCE).
+
+Streamlit scripts use it synchronously:
+
+    future = get_agent_engine().submit(api_key, model=..., messages=...)
+    response = future.result()                       # ChatCompletion
+
+    for delta in get_agent_engine().stream(api_key, model=..., messages=...):
+        ...                                          # text as it arrives
+
+This module has no Streamlit dependency.
+"""
+
+import queue
+import asyncio
+import threading
+import time
+from collections import deque
+
+from config import (
+    AGENT_MAX_IN_FLIGHT, AGENT_QUEUE_TIMEOUT_SECS, AGENT_REQUEST_TIMEOUT_SECS,
+    BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_ERROR_RATE, BREAKER_COOLDOWN_SECS,
+)
+
+ENGINE_MAX_CONNECTIONS  = 64      # HTTP connections per API key
+ENGINE_MAX_KEEPALIVE    = 32      # idle connections kept warm
+ENGINE_KEEPALIVE_SECS   = 120.0
+ENGINE_CONNECT_TIMEOUT  = 10.0
+
+_DONE = object()                  # end-of-stream marker
+
+
+class AgentEngineBusy(RuntimeError):
+    """No request slot became free within AGENT_QUEUE_TIMEOUT_SECS."""
+
+
+class AgentTimeout(TimeoutError):
+    """A request did not finish within AGENT_REQUEST_TIMEOUT_SECS."""
+
+
+class AgentEngine:
+    """Event-loop thread plus in-flight limiter for OpenAI chat requests."""
+
+    def __init__(self, max_in_flight=AGENT_MAX_IN_FLIGHT,
+                 request_timeout=AGENT_REQUEST_TIMEOUT_SECS,
+                 queue_timeout=AGENT_QUEUE_TIMEOUT_SECS):
+        self.max_in_flight   = max_in_flight
+        self.request_timeout = request_timeout
+        self.queue_timeout   = queue_timeout
+        self._clients   = {}                       # api_key -> AsyncOpenAI (loop thread only)
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._lock      = threading.Lock()
+        self._stats     = {
+            "submitted": 0, "completed": 0, "failed": 0,
+            "timeouts": 0, "rejected": 0, "cancelled": 0,
+            "queued": 0, "peak_queued": 0,
+            "in_flight": 0, "peak_in_flight": 0,
+            "wait_secs": 0.0, "run_secs": 0.0,
+        }
+        self._loop   = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="agent-engine", daemon=True,
+        )
+        self._thread.start()
+
+    # ── Public API (any thread) ────────────────────────────────────────────────
+
+    def submit(self, api_key, deadline=None, **request):
+        """
+        Schedules one chat completion; returns a concurrent.futures.Future
+        resolving to the ChatCompletion (or raising its error). `deadline`
+        (seconds from now) bounds queue wait plus request together.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._run(api_key, request, expires=self._expires(deadline)),
+            self._loop,
+        )
+
+    def complete(self, api_key, deadline=None, **request):
+        """submit() and wait for the result."""
+        return self.submit(api_key, deadline, **request).result()
+
+    def stream(self, api_key, deadline=None, **request):
+        """
+        Yields the reply text of a streamed chat completion as it arrives.
+        Closing the generator early cancels the request.
+        """
+        deltas = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(api_key, request, deltas, self._expires(deadline)),
+            self._loop,
+        )
+        try:
+            while True:
+                item = deltas.get()
+                if item is _DONE:
+                    break
+                yield item
+            future.result()                # re-raises the request's error
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stats(self):
+        """Counters plus average queue wait and run time in milliseconds."""
+        with self._lock:
+            stats = dict(self._stats)
+        finished = stats["completed"] + stats["failed"] + stats["timeouts"]
+        started  = finished + stats["in_flight"]
+        stats["avg_wait_ms"] = round(1000 * stats.pop("wait_secs") / max(started, 1))
+        stats["avg_run_ms"]  = round(1000 * stats.pop("run_secs") / max(finished, 1))
+        stats["max_in_flight"] = self.max_in_flight
+        stats["clients"] = len(self._clients)
+        stats.update(self._pool_stats())
+        return stats
+
+    def _pool_stats(self):
+        """
+        Connection-pool use of the per-key clients' HTTP transports:
+          connections / idle_connections — open and idle pooled connections
+          pool_utilisation               — busy connections / pool capacity
+        """
+        open_conns = idle_conns = 0
+        for client in list(self._clients.values()):
+            transport = getattr(getattr(client, "_client", None), "_transport", None)
+            pool = getattr(transport, "_pool", None)
+            for conn in list(getattr(pool, "connections", [])):
+                open_conns += 1
+                idle_conns += bool(conn.is_idle())
+        capacity = ENGINE_MAX_CONNECTIONS * max(len(self._clients), 1)
+        return {
+            "connections":      open_conns,
+            "idle_connections": idle_conns,
+            "pool_utilisation": round((open_conns - idle_conns) / capacity, 3),
+        }
+
+    @staticmethod
+    def _expires(deadline):
+        # Absolute (monotonic) deadline, fixed on the caller's thread
+        return None if deadline is None else time.monotonic() + deadline
+
+    # ── Engine loop ────────────────────────────────────────────────────────────
+
+    def _count(self, **changes):
+        with self._lock:
+            for key, delta in changes.items():
+                self._stats[key] += delta
+            self._stats["peak_queued"] = max(
+                self._stats["peak_queued"], self._stats["queued"])
+            self._stats["peak_in_flight"] = max(
+                self._stats["peak_in_flight"], self._stats["in_flight"])
+
+    def _client(self, api_key):
+        client = self._clients.get(api_key)
+        if client is None:
+            from openai import (
+                AsyncOpenAI, DefaultAsyncHttpxClient, DEFAULT_CONNECTION_LIMITS,
+                Timeout,
+            )
+            # Limits class of whichever HTTP package this openai release uses
+            # (httpx or httpx2), so the engine imports neither directly
+            Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+            client = self._clients[api_key] = AsyncOpenAI(
+                api_key     = api_key,
+                max_retries = 0,          # retries are the caller's policy
+                http_client = DefaultAsyncHttpxClient(
+                    limits  = Limits(
+                        max_connections           = ENGINE_MAX_CONNECTIONS,
+                        max_keepalive_connections = ENGINE_MAX_KEEPALIVE,
+                        keepalive_expiry          = ENGINE_KEEPALIVE_SECS,
+                    ),
+                    # the engine deadline (wait_for) is what ends a request
+                    timeout = Timeout(self.request_timeout + 5,
+                                      connect=ENGINE_CONNECT_TIMEOUT),
+                ),
+            )
+        return client
+
+    async def _run(self, api_key, request, deltas=None, expires=None):
+        queued_at = time.monotonic()
+        self._count(submitted=1, queued=1)
+        wait = self.queue_timeout
+        if expires is not None:
+            wait = max(min(wait, expires - queued_at), 0)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), wait)
+        except asyncio.TimeoutError:
+            if deltas is not None:
+                deltas.put(_DONE)
+            self._count(queued=-1, rejected=1)     # never ran
+            if wait < self.queue_timeout:          # the caller's deadline ran out
+                raise AgentTimeout(
+                    f"agent request deadline passed after {wait:.0f}s queued"
+                ) from None
+            raise AgentEngineBusy(
+                f"no agent request slot free after {self.queue_timeout:.0f}s"
+            ) from None
+        except asyncio.CancelledError:
+            self._count(queued=-1, cancelled=1)
+            raise
+
+        started = time.monotonic()
+        self._count(queued=-1, in_flight=1, wait_secs=started - queued_at)
+        timeout = self.request_timeout
+        if expires is not None:                    # only the time left
+            timeout = max(min(timeout, expires - started), 0)
+        outcome = "failed"
+        try:
+            result = await asyncio.wait_for(
+                self._request(api_key, request, deltas), timeout
+            )
+            outcome = "completed"
+            return result
+        except asyncio.TimeoutError:
+            outcome = "timeouts"
+            raise AgentTimeout(
+                f"agent request exceeded {timeout:.0f}s"
+            ) from None
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            self._semaphore.release()
+            self._count(in_flight=-1, run_secs=time.monotonic() - started,
+                        **{outcome: 1})
+            if deltas is not None:
+                deltas.put(_DONE)
+
+    async def _request(self, api_key, request, deltas):
+        client = self._client(api_key)
+        if deltas is None:
+            return await client.chat.completions.create(**request)
+        chunks = await client.chat.completions.create(stream=True, **request)
+        async for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                deltas.put(chunk.choices[0].delta.content)
+        return None
+
+
+def is_service_up(exc) -> bool:
+    """
+    True only for a 4xx API answer other than 429: the request was at fault,
+    the service responded. Anything else (5xx, 429, timeouts, network, and
+    local errors such as a missing package) counts against the breaker.
+    """
+    import openai
+
+    return (isinstance(exc, openai.APIStatusError)
+            and 400 <= exc.status_code < 500 and exc.status_code != 429)
+
+
+def is_retryable(exc) -> bool:
+    """True for errors a later attempt may not hit (timeouts, 429, 5xx, network)."""
+    import openai
+
+    return isinstance(exc, (
+        AgentTimeout, openai.APITimeoutError, openai.APIConnectionError,
+        openai.RateLimitError, openai.InternalServerError,
+    ))
+
+
+class CircuitBreaker:
+    """
+    Error-rate breaker over the last `window` calls.
+      closed    — calls allowed; opens at `error_rate` over >= `min_calls`
+      open      — allow() is False for `cooldown` seconds (load is shed)
+      half_open — one probe allowed; success closes, failure re-opens
+    Outcomes of calls that were already running when it opened are ignored.
+    """
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 error_rate=BREAKER_ERROR_RATE, cooldown=BREAKER_COOLDOWN_SECS):
+        self.min_calls  = min_calls
+        self.error_rate = error_rate
+        self.cooldown   = cooldown
+        self.state      = "closed"
+        self._outcomes  = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._lock      = threading.Lock()
+        self._stats     = {"opened": 0, "shed": 0}
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.cooldown:
+                self._stats["shed"] += 1
+                return False
+            # Let one probe through; the next one waits another cooldown
+            self.state, self._opened_at = "half_open", now
+            return True
+
+    def record(self, ok: bool):
+        with self._lock:
+            if self.state == "open":
+                return                   # started before it opened
+            if self.state == "half_open":
+                if ok:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self.state, self._opened_at = "open", time.monotonic()
+                    self._stats["opened"] += 1
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate):
+                self.state, self._opened_at = "open", time.monotonic()
+                self._stats["opened"] += 1
+                self._outcomes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                **self._stats,
+                "state":      self.state,
+                "error_rate": round(self._outcomes.count(False) / max(calls, 1), 3),
+            }
+
+
+_ENGINE      = None
+_BREAKER     = CircuitBreaker()
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_agent_engine() -> AgentEngine:
+    """The process-wide engine (loop thread started on first use)."""
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                _ENGINE = AgentEngine()
+    return _ENGINE
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Breaker for the primary agent model (shared by every session)."""
+    return _BREAKER
+
+
+def engine_stats() -> dict:
+    """
+    Queue/in-flight metrics of the engine plus the breaker state
+    ({} before the first request).
+    """
+    if _ENGINE is None:
+        return {}
+    return {**_ENGINE.stats(), "breaker": _BREAKER.stats()}
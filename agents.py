@@ -32,8 +32,56 @@ with Floridi's (2025) artificial agency criteria: interactivity
 response generation with redirect protocols), and adaptability
 (bilingual responsiveness and scaffold escalation based on detected
 epistemic state)."
+
+PERFORMANCE:
+  Opening turns of agents enabled in config.RESPONSE_CACHE_AGENTS are
+  served from response_cache when an identical request was answered
+  before; such results carry cached=True.
+  Each AGENTS entry carries a generation profile (model, max_tokens,
+  temperature, deadline_secs) that config.GROUPS may override per group;
+  generation_profile() resolves it for call_agent and call_agent_vision.
+  Every agent turn has a latency budget (its profile's deadline_secs):
+  transient errors are retried with jitter, the fallback model answers when
+  the budget is at risk or the circuit breaker is open, and results say
+  when they were degraded — call_agent no longer raises on API failures.
+  Agent requests run on agent_engine's event loop thread, which shares
+  one pooled AsyncOpenAI client per API key, caps requests in flight across
+  all sessions and enforces request deadlines; engine_stats() also reports
+  connection-pool utilisation.
+  call_agent(..., stream=True) returns an AgentStream that yields reply
+  text as tokens arrive, with signal codes held back and removed even when
+  they are split across chunks.
+  build_agent_context() keeps each request within a per-agent token
+  budget: signal codes stripped, recent turns verbatim, older turns folded
+  into a cached rolling summary that is refreshed in the background.
+  System prompts come from SYSTEM_PROMPTS, built once per (agent, language)
+  with config.inject_language: sessions share one message object, every
+  request sends a byte-identical prefix, and each turn logs its prompt hash.
+  parse_signals() extracts every signal and the display text in one
+  compiled-regex pass, returning a __slots__ Signals record; each
+  session's ChatTranscript stores message display text once, at append.
 """
 
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import (
+    LANGUAGE_INSTRUCTION, inject_language,
+    AGENT_MAX_RETRIES, AGENT_RETRY_BASE_SECS, get_group_config, normalise_group,
+    AGENT_FALLBACK_MODEL, AGENT_FALLBACK_RESERVE_SECS,
+)
+from agent_engine import (
+    AgentEngineBusy, AgentTimeout, get_agent_engine, get_circuit_breaker,
+    is_retryable, is_service_up,
+)
+from response_cache import get_response_cache
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # AGENT 1: SAATHI — Diagnostic & Misconception Detection (UNCHANGED)
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -391,64 +439,29 @@ explicitly name what they have achieved across all six agents.
 # SIGNAL DETECTORS
 # ═══════════════════════════════════════════════════════════════════════════════
 
+# The detect_* functions are kept for callers that need one field; they all
+# read parse_signals(), which scans the reply once (see SIGNAL PARSER below).
+
 def detect_tap_level(ai_response: str):
-    signals = {
-        "[TAP_LEVEL_5_DETECTED]": "TAP_5",
-        "[TAP_LEVEL_4_DETECTED]": "TAP_4",
-        "[TAP_LEVEL_3_DETECTED]": "TAP_3",
-        "[TAP_LEVEL_2_DETECTED]": "TAP_2",
-        "[TAP_LEVEL_1_DETECTED]": "TAP_1",
-    }
-    for signal, level in signals.items():
-        if signal in ai_response:
-            return level
-    return None
+    return parse_signals(ai_response).tap_level
 
 def detect_rep_level(ai_response: str):
-    signals = {
-        "[TRIADIC_FLUENCY_DETECTED]":      "TRIADIC",
-        "[BIADIC_REPRESENTATION_DETECTED]": "BIADIC",
-        "[MONADIC_CONFINEMENT_DETECTED]":   "MONADIC",
-    }
-    for signal, level in signals.items():
-        if signal in ai_response:
-            return level
-    return None
+    return parse_signals(ai_response).rep_level
 
 def detect_hypothesis_quality(ai_response: str):
     """New: detects Khoji hypothesis and question quality signals."""
-    if "[HYPOTHESIS_FORMED]"    in ai_response: return "HYPOTHESIS"
-    if "[QUESTION_QUALITY_3]"   in ai_response: return "Q3"
-    if "[QUESTION_QUALITY_2]"   in ai_response: return "Q2"
-    if "[QUESTION_QUALITY_1]"   in ai_response: return "Q1"
-    return None
+    return parse_signals(ai_response).hypothesis_level
 
 def detect_evidence_quality(ai_response: str):
     """New: detects Praman evidence quality signals."""
-    if "[EVIDENCE_QUALITY_3]" in ai_response: return "EQ3"
-    if "[EVIDENCE_QUALITY_2]" in ai_response: return "EQ2"
-    if "[EVIDENCE_QUALITY_1]" in ai_response: return "EQ1"
-    return None
+    return parse_signals(ai_response).evidence_level
 
 def detect_communication_level(ai_response: str):
     """New: detects Sandesh communication completion signals."""
-    if "[COMMUNICATION_COMPLETE]" in ai_response: return "COMPLETE"
-    if "[COMMUNICATION_PARTIAL]"  in ai_response: return "PARTIAL"
-    return None
+    return parse_signals(ai_response).comm_level
 
 def detect_redirect(ai_response: str):
-    redirects = {
-        "[REDIRECT_TO_KHOJI]":   "KHOJI",
-        "[REDIRECT_TO_PRAMAN]":  "PRAMAN",
-        "[REDIRECT_TO_TARKA]":   "TARKA",
-        "[REDIRECT_TO_RUPAK]":   "RUPAK",
-        "[REDIRECT_TO_SAATHI]":  "SAATHI",
-        "[REDIRECT_TO_SANDESH]": "SANDESH",
-    }
-    for signal, target in redirects.items():
-        if signal in ai_response:
-            return target
-    return None
+    return parse_signals(ai_response).redirect
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # AGENT REGISTRY — Full six-agent ecology
@@ -465,6 +478,8 @@ AGENTS = {
         "system_prompt": SAATHI_SYSTEM_PROMPT,
         "instrument":    "Four-Tier Diagnostic",
         "db_log_type":   "SAATHI_CHAT",
+        "generation":    {"model": "gpt-4o", "max_tokens": 400,
+                          "temperature": 1.0, "deadline_secs": 25},
         "sequence":      1,
         "unlock_after":  None,
     },
@@ -478,6 +493,8 @@ AGENTS = {
         "system_prompt": KHOJI_SYSTEM_PROMPT,
         "instrument":    "Question Quality & Hypothesis Rubric",
         "db_log_type":   "KHOJI_CHAT",
+        "generation":    {"model": "gpt-4o", "max_tokens": 500,
+                          "temperature": 1.0, "deadline_secs": 30},
         "sequence":      2,
         "unlock_after":  "SAATHI",
     },
@@ -491,6 +508,8 @@ AGENTS = {
         "system_prompt": PRAMAN_SYSTEM_PROMPT,
         "instrument":    "Evidence Quality Scale (EQ1–EQ3)",
         "db_log_type":   "PRAMAN_CHAT",
+        "generation":    {"model": "gpt-4o", "max_tokens": 500,
+                          "temperature": 1.0, "deadline_secs": 30},
         "sequence":      3,
         "unlock_after":  "KHOJI",
     },
@@ -504,6 +523,8 @@ AGENTS = {
         "system_prompt": TARKA_SYSTEM_PROMPT,
         "instrument":    "Toulmin Argumentation Pattern (TAP)",
         "db_log_type":   "TARKA_CHAT",
+        "generation":    {"model": "gpt-4o", "max_tokens": 600,
+                          "temperature": 1.0, "deadline_secs": 40},
         "sequence":      4,
         "unlock_after":  "PRAMAN",
     },
@@ -517,6 +538,8 @@ AGENTS = {
         "system_prompt": RUPAK_SYSTEM_PROMPT,
         "instrument":    "Representational Fluency Assessment",
         "db_log_type":   "RUPAK_CHAT",
+        "generation":    {"model": "gpt-4o", "max_tokens": 1000,
+                          "temperature": 1.0, "deadline_secs": 45},
         "sequence":      5,
         "unlock_after":  "TARKA",
     },
@@ -530,6 +553,8 @@ AGENTS = {
         "system_prompt": SANDESH_SYSTEM_PROMPT,
         "instrument":    "Science Communication Rubric",
         "db_log_type":   "SANDESH_CHAT",
+        "generation":    {"model": "gpt-4o", "max_tokens": 1000,
+                          "temperature": 1.0, "deadline_secs": 45},
         "sequence":      6,
         "unlock_after":  "RUPAK",
     },
@@ -538,6 +563,29 @@ AGENTS = {
 # Ordered sequence for UI display and unlock gate logic
 AGENT_SEQUENCE = ["SAATHI", "KHOJI", "PRAMAN", "TARKA", "RUPAK", "SANDESH"]
 
+# ── Generation profiles ────────────────────────────────────────────────────────
+# Original: every agent was hard-coded to gpt-4o with no max_tokens (vision
+# alone set 1000), so short Saathi probes paid the same latency as Sandesh
+# syntheses. Each AGENTS entry now carries "generation": model, max_tokens,
+# temperature (1.0 = the API default used before) and deadline_secs (the
+# turn's latency budget, see RESILIENCE). A research group may override any
+# of these per agent via config.GROUPS[group]["generation"][agent_key].
+# max_tokens leaves room for the signal codes agents emit at the end.
+
+def generation_profile(agent_key: str, group: str = None) -> dict:
+    """AGENTS[agent_key]["generation"] with the group's overrides applied."""
+    profile = dict(AGENTS[agent_key]["generation"])
+    if group:
+        overrides = get_group_config(normalise_group(group)).get("generation", {})
+        profile.update(overrides.get(agent_key, {}))
+    return profile
+
+
+def _generation_request(profile: dict) -> dict:
+    """Chat-completion parameters of a profile (deadline_secs excluded)."""
+    return {k: profile[k] for k in ("model", "max_tokens", "temperature")
+            if profile.get(k) is not None}
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # AGENT INITIALISER — Updated for all six agents
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -592,10 +640,360 @@ def initialise_agent(agent_key: str, context: dict) -> list:
     }
 
     opening = openings.get(agent_key, f"Namaste! Let us explore {topic}.")
-    return [
-        {"role": "system",    "content": agent["system_prompt"]},
+    return ChatTranscript([
+        system_message(agent_key, context.get("lang", "en")),
         {"role": "assistant", "content": opening},
+    ])
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SYSTEM PROMPT REGISTRY
+# ═══════════════════════════════════════════════════════════════════════════════
+# Original: initialise_agent copied the bare system prompt into every
+# session's message list and inject_language was never applied. Now every
+# (agent, language) prompt is built once at import and sessions hold a
+# reference to the same message dict. Identical bytes on every request let the
+# provider reuse its cached prompt prefix, and the short content hash logged
+# with each turn records exactly which prompt produced it.
+# The registry messages are shared — never mutate them.
+
+PROMPT_LANGUAGES = tuple(LANGUAGE_INSTRUCTION)
+
+
+def _prompt_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+SYSTEM_PROMPTS = {}   # (agent_key, lang) -> {"role": "system", "content": ...}
+PROMPT_HASHES  = {}   # prompt text -> hash
+for _key, _agent in AGENTS.items():
+    for _lang in PROMPT_LANGUAGES:
+        _text = inject_language(_agent["system_prompt"], _lang)
+        SYSTEM_PROMPTS[(_key, _lang)] = {"role": "system", "content": _text}
+        PROMPT_HASHES[_text] = _prompt_hash(_text)
+del _key, _agent, _lang, _text
+
+
+def system_message(agent_key: str, lang: str = "en") -> dict:
+    """Shared system message for this agent and language (English fallback)."""
+    return SYSTEM_PROMPTS.get((agent_key, lang)) or SYSTEM_PROMPTS[(agent_key, "en")]
+
+
+def prompt_hash(messages: list) -> str:
+    """Hash of the system prompt at the head of `messages` ('' if none)."""
+    if not messages or messages[0].get("role") != "system":
+        return ""
+    text = messages[0].get("content", "")
+    if not isinstance(text, str):
+        return ""
+    return PROMPT_HASHES.get(text) or _prompt_hash(text)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONVERSATION CONTEXT BUDGET
+# ═══════════════════════════════════════════════════════════════════════════════
+# Original: the whole history — long assistant turns and signal codes
+# included — was re-sent on every turn, so latency and cost grew with the
+# conversation. Now the request is the system prompt, a rolling summary of
+# older turns and the most recent turns verbatim, within a per-agent token
+# budget. Summaries are cached by a hash of the turns they cover; a new one is
+# generated only when the window slides, and then from the previous summary
+# plus the newly folded turns. After a slide the verbatim window is cut to
+# CONTEXT_RECENT_SHARE of the budget, so the next few turns reuse the summary.
+# Summaries never block a turn: a slide submits the summary request to the
+# engine (with its own SUMMARY_DEADLINE_SECS) and this turn goes out with the
+# previous summary, or none, plus the most recent turns that fit. A later
+# turn picks the new summary up from the cache.
+
+CONTEXT_TOKEN_BUDGET = {
+    "SAATHI": 4000, "KHOJI": 4000, "PRAMAN": 4000,
+    "TARKA":  5000, "RUPAK": 6000, "SANDESH": 5000,
+}
+CONTEXT_DEFAULT_BUDGET  = 4000
+CONTEXT_RECENT_SHARE    = 0.6     # verbatim share of the budget after a slide
+CONTEXT_IMAGE_TOKENS    = 800     # estimate per image part (vision turns)
+SUMMARY_MODEL           = "gpt-4o-mini"
+SUMMARY_MAX_TOKENS      = 300
+SUMMARY_CACHE_SIZE      = 512
+SUMMARY_DEADLINE_SECS   = 30.0
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a tutoring dialogue between a "
+    "chemistry student and an AI tutor. Merge the previous summary with the "
+    "new turns into at most 150 words. Keep the student's claims, "
+    "misconceptions, evidence and reasoning in their own terms, what the "
+    "tutor has already asked, and any agreed next step. Do not evaluate."
+)
+
+_SUMMARY_CACHE    = OrderedDict()   # prefix hash -> summary text
+_SUMMARY_INFLIGHT = set()           # prefix hashes being summarised
+_SUMMARY_LOCK     = threading.Lock()
+_ENCODER       = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count via tiktoken when installed, else ~4 characters per token."""
+    global _ENCODER
+    if _ENCODER is None:
+        try:
+            import tiktoken
+            _ENCODER = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _ENCODER = False
+    if _ENCODER:
+        return len(_ENCODER.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return " ".join(
+            p.get("text", "") for p in content
+            if isinstance(p, dict) and p.get("type") == "text"
+        )
+    return str(content)
+
+
+def _strip_signals(message: dict) -> dict:
+    """Copy of `message` with signal codes removed from its text."""
+    def clean(text):
+        return _SIGNAL_RE.sub("", text)
+
+    content = message.get("content", "")
+    if isinstance(content, list):
+        content = [
+            {**p, "text": clean(p.get("text", ""))}
+            if isinstance(p, dict) and p.get("type") == "text" else p
+            for p in content
+        ]
+    else:
+        content = clean(str(content))
+    return {**message, "content": content}
+
+
+def _message_tokens(message: dict) -> int:
+    content = message.get("content", "")
+    images  = sum(
+        1 for p in content
+        if isinstance(p, dict) and p.get("type") == "image_url"
+    ) if isinstance(content, list) else 0
+    return 4 + estimate_tokens(_message_text(message)) + images * CONTEXT_IMAGE_TOKENS
+
+
+def _prefix_keys(system: list, history: list) -> list:
+    """keys[i] identifies (system, history[:i]); chained so it is O(n)."""
+    digest = hashlib.sha1(json.dumps(
+        [_message_text(m) for m in system], ensure_ascii=False
+    ).encode("utf-8"))
+    keys = [digest.hexdigest()]
+    for message in history:
+        digest.update(json.dumps(
+            [message.get("role"), _message_text(message)], ensure_ascii=False
+        ).encode("utf-8"))
+        keys.append(digest.hexdigest())
+    return keys
+
+
+def _summarise_later(key: str, previous: str, turns: list, api_key: str):
+    """Submits a summary of `turns` to the engine; the result lands in the cache."""
+    with _SUMMARY_LOCK:
+        if key in _SUMMARY_INFLIGHT or key in _SUMMARY_CACHE:
+            return
+        _SUMMARY_INFLIGHT.add(key)
+    transcript = "\n".join(
+        f"{'Student' if m.get('role') == 'user' else 'Tutor'}: {_message_text(m)}"
+        for m in turns
+    )
+
+    def store(future):
+        try:
+            summary = future.result().choices[0].message.content.strip()
+        except Exception:
+            summary = None         # retried when a later turn slides again
+        with _SUMMARY_LOCK:
+            _SUMMARY_INFLIGHT.discard(key)
+            if summary:
+                _SUMMARY_CACHE[key] = summary
+                while len(_SUMMARY_CACHE) > SUMMARY_CACHE_SIZE:
+                    _SUMMARY_CACHE.popitem(last=False)
+
+    try:
+        future = get_agent_engine().submit(
+            api_key,
+            deadline   = SUMMARY_DEADLINE_SECS,
+            model      = SUMMARY_MODEL,
+            max_tokens = SUMMARY_MAX_TOKENS,
+            messages   = [
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content":
+                    f"Previous summary:\n{previous or '(none)'}\n\n"
+                    f"New turns:\n{transcript}"},
+            ],
+        )
+    except Exception:
+        with _SUMMARY_LOCK:
+            _SUMMARY_INFLIGHT.discard(key)
+        return
+    future.add_done_callback(store)
+
+
+def build_agent_context(agent_key: str, messages: list, api_key: str) -> list:
+    """
+    Returns the messages to send for this turn: system prompt, optional
+    summary of older turns, then the most recent turns verbatim — all with
+    signal codes stripped and within the agent's token budget.
+    """
+    if not messages:
+        return messages
+    budget  = CONTEXT_TOKEN_BUDGET.get(agent_key, CONTEXT_DEFAULT_BUDGET)
+    system  = [messages[0]] if messages[0].get("role") == "system" else []
+    history = [
+        _strip_signals(m) for m in messages[len(system):]
+        if m.get("content") != DEGRADED_REPLY     # never show the model our apology
     ]
+    costs   = [_message_tokens(m) for m in history]
+    available = max(budget - sum(_message_tokens(m) for m in system), 1000)
+    if sum(costs) <= available:
+        return system + history
+
+    keys   = _prefix_keys(system, history)
+    window = available - SUMMARY_MAX_TOKENS - 20
+
+    # Latest fold point that already has a summary
+    with _SUMMARY_LOCK:
+        cached = next(
+            (i for i in range(len(history) - 1, 0, -1) if keys[i] in _SUMMARY_CACHE),
+            0,
+        )
+        summary = _SUMMARY_CACHE.get(keys[cached], "") if cached else ""
+        if cached:
+            _SUMMARY_CACHE.move_to_end(keys[cached])
+
+    fold = cached
+    if not cached or sum(costs[cached:]) > window:
+        # Slide: fold until the verbatim turns fit the recent share
+        target, fold, tail = window * CONTEXT_RECENT_SHARE, len(history) - 1, costs[-1]
+        while fold > cached and tail + costs[fold - 1] <= target:
+            fold -= 1
+            tail += costs[fold]
+        fold = max(fold, cached + 1)
+        _summarise_later(keys[fold], summary, history[cached:fold], api_key)
+        # Meanwhile: the previous summary (if any) and the newest turns that fit
+        limit = window if cached else available
+        fold, tail = len(history) - 1, costs[-1]
+        while fold > cached and tail + costs[fold - 1] <= limit:
+            fold -= 1
+            tail += costs[fold]
+        if not cached:
+            return system + history[fold:]
+
+    summary_message = {
+        "role": "system",
+        "content": f"Summary of the earlier conversation:\n{summary}",
+    }
+    return system + [summary_message] + history[fold:]
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RESILIENCE — deadlines, retries, fallback model, circuit breaker
+# ═══════════════════════════════════════════════════════════════════════════════
+# Original: no timeout, retry or fallback; a slow API left students waiting
+# indefinitely and an exception crashed the page mid-turn. Now each turn has
+# a latency budget. The primary model gets up to AGENT_MAX_RETRIES jittered
+# retries on transient errors while AGENT_FALLBACK_RESERVE_SECS of the budget
+# remain; after that (or while the breaker sheds load) the fallback model
+# answers. If that fails too the student gets DEGRADED_REPLY. Replies are
+# always streamed from the API, so a turn that has started showing text is
+# never retried — it is marked "interrupted" instead. The budget is one
+# absolute deadline: time queued in the engine counts against it. When the
+# engine queue itself is saturated (AgentEngineBusy) the fallback would wait
+# in the same queue, so the student gets DEGRADED_REPLY straight away.
+#
+# degraded_reason: None | "circuit_open" | "error" | "deadline"
+#                  (fallback model answered) | "interrupted" | "busy"
+#                  | "unavailable"
+
+DEGRADED_REPLY = (
+    "I could not reach the tutor service just now. Please send your message "
+    "again in a moment.\n\n"
+    "अहिले ट्युटर सेवासँग जोडिन सकिएन। केही क्षणपछि आफ्नो सन्देश फेरि पठाउनुहोस्।"
+)
+
+
+def _resilient_deltas(deadline_secs: float, api_key: str, info: dict, **request):
+    """
+    Yields reply text for one agent turn within `deadline_secs`, filling
+    `info` with model / attempts / degraded / degraded_reason.
+    """
+    engine, breaker = get_agent_engine(), get_circuit_breaker()
+    deadline = time.monotonic() + deadline_secs
+    info.update(model=request["model"], attempts=0,
+                degraded=False, degraded_reason=None)
+
+    reason = "circuit_open"
+    if breaker.allow():
+        reason = "deadline"
+        for attempt in range(AGENT_MAX_RETRIES + 1):
+            if attempt and not breaker.allow():
+                reason = "circuit_open"           # failures opened it: stop retrying
+                break
+            budget = deadline - time.monotonic() - AGENT_FALLBACK_RESERVE_SECS
+            if budget < 1:
+                break
+            info["attempts"] += 1
+            started = False
+            try:
+                for delta in engine.stream(api_key, deadline=budget, **request):
+                    started = True
+                    yield delta
+            except AgentEngineBusy:
+                # Our own queue is full, not the API: no breaker record, and
+                # no fallback request queued behind the same backlog
+                info.update(model=None, degraded=True, degraded_reason="busy")
+                yield DEGRADED_REPLY
+                return
+            except Exception as exc:
+                retryable = is_retryable(exc)
+                breaker.record(is_service_up(exc))
+                if started:
+                    info.update(degraded=True, degraded_reason="interrupted")
+                    return
+                reason = "deadline" if isinstance(exc, AgentTimeout) else "error"
+                pause = AGENT_RETRY_BASE_SECS * 2 ** attempt * random.uniform(0.5, 1.0)
+                if (not retryable or time.monotonic() + pause
+                        > deadline - AGENT_FALLBACK_RESERVE_SECS):
+                    break
+                time.sleep(pause)
+            else:
+                breaker.record(True)
+                return
+
+    info.update(model=AGENT_FALLBACK_MODEL, degraded=True, degraded_reason=reason)
+    started = False
+    try:
+        for delta in engine.stream(
+            api_key,
+            deadline = max(deadline - time.monotonic(), AGENT_FALLBACK_RESERVE_SECS),
+            **{**request, "model": AGENT_FALLBACK_MODEL},
+        ):
+            started = True
+            yield delta
+    except Exception:
+        if started:
+            info["degraded_reason"] = "interrupted"
+        else:
+            info.update(model=None, degraded_reason="unavailable")
+            yield DEGRADED_REPLY
+
+
+def resilient_complete(profile: dict, api_key: str, messages: list, **extra):
+    """
+    Whole reply text plus the info dict from _resilient_deltas, generated
+    with a generation_profile() (extra parameters override it).
+    """
+    info = {}
+    request = {**_generation_request(profile), "messages": messages, **extra}
+    content = "".join(_resilient_deltas(profile["deadline_secs"], api_key,
+                                        info, **request))
+    return content, info
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # UNIFIED CALL FUNCTION — Updated for all six agents
@@ -618,11 +1016,225 @@ ALL_SIGNAL_CODES = [
     "[REDIRECT_TO_SAATHI]", "[REDIRECT_TO_SANDESH]",
 ]
 
-def call_agent(agent_key: str, messages: list, api_key: str) -> dict:
+# ═══════════════════════════════════════════════════════════════════════════════
+# SIGNAL PARSER
+# ═══════════════════════════════════════════════════════════════════════════════
+# Original: six detect_* functions each scanned the reply for their codes and
+# the display text took 24 sequential str.replace passes — repeated for every
+# history message on every rerun. Now one compiled alternation finds every
+# code in a single pass, recording each signal while it removes it.
+# When several codes of one kind appear, the earlier entry in a field's list
+# wins (the priority the detect_* functions always used).
+
+SIGNAL_FIELDS = {
+    "tap_level": [
+        ("[TAP_LEVEL_5_DETECTED]", "TAP_5"), ("[TAP_LEVEL_4_DETECTED]", "TAP_4"),
+        ("[TAP_LEVEL_3_DETECTED]", "TAP_3"), ("[TAP_LEVEL_2_DETECTED]", "TAP_2"),
+        ("[TAP_LEVEL_1_DETECTED]", "TAP_1"),
+    ],
+    "rep_level": [
+        ("[TRIADIC_FLUENCY_DETECTED]",       "TRIADIC"),
+        ("[BIADIC_REPRESENTATION_DETECTED]", "BIADIC"),
+        ("[MONADIC_CONFINEMENT_DETECTED]",   "MONADIC"),
+    ],
+    "hypothesis_level": [
+        ("[HYPOTHESIS_FORMED]", "HYPOTHESIS"), ("[QUESTION_QUALITY_3]", "Q3"),
+        ("[QUESTION_QUALITY_2]", "Q2"),        ("[QUESTION_QUALITY_1]", "Q1"),
+    ],
+    "evidence_level": [
+        ("[EVIDENCE_QUALITY_3]", "EQ3"), ("[EVIDENCE_QUALITY_2]", "EQ2"),
+        ("[EVIDENCE_QUALITY_1]", "EQ1"),
+    ],
+    "comm_level": [
+        ("[COMMUNICATION_COMPLETE]", "COMPLETE"),
+        ("[COMMUNICATION_PARTIAL]",  "PARTIAL"),
+    ],
+    "redirect": [
+        ("[REDIRECT_TO_KHOJI]",  "KHOJI"),  ("[REDIRECT_TO_PRAMAN]",  "PRAMAN"),
+        ("[REDIRECT_TO_TARKA]",  "TARKA"),  ("[REDIRECT_TO_RUPAK]",   "RUPAK"),
+        ("[REDIRECT_TO_SAATHI]", "SAATHI"), ("[REDIRECT_TO_SANDESH]", "SANDESH"),
+    ],
+}
+
+# code -> (field, value, rank); lower rank wins within a field
+_SIGNAL_INDEX = {
+    code: (field, value, rank)
+    for field, entries in SIGNAL_FIELDS.items()
+    for rank, (code, value) in enumerate(entries)
+}
+# Longest first so no code can shadow a longer one sharing its prefix
+_SIGNAL_RE = re.compile("|".join(
+    re.escape(code) for code in sorted(ALL_SIGNAL_CODES, key=len, reverse=True)
+))
+
+
+class Signals:
+    """Everything call_agent reports about one reply, from a single scan."""
+
+    __slots__ = (
+        "content", "display", "tap_level", "rep_level", "hypothesis_level",
+        "evidence_level", "comm_level", "redirect",
+        "mastery", "triadic", "comm_complete",
+    )
+
+    def __init__(self, content: str):
+        self.content = content
+        self.tap_level = self.rep_level = self.hypothesis_level = None
+        self.evidence_level = self.comm_level = self.redirect = None
+        self.mastery = False
+        ranks = {}
+
+        def record(match):
+            code = match.group(0)
+            if code == "[MASTERY_DETECTED]":
+                self.mastery = True
+            else:
+                field, value, rank = _SIGNAL_INDEX[code]
+                if rank < ranks.get(field, len(SIGNAL_FIELDS[field])):
+                    ranks[field] = rank
+                    setattr(self, field, value)
+            return ""
+
+        self.display       = _SIGNAL_RE.sub(record, content).strip()
+        self.triadic       = self.rep_level == "TRIADIC"
+        self.comm_complete = self.comm_level == "COMPLETE"
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__[2:]
+            if getattr(self, name)
+        )
+        return f"Signals({fields})"
+
+
+def parse_signals(content) -> Signals:
+    """Scans a reply once for every signal code (None/non-str → empty)."""
+    return Signals(content if isinstance(content, str) else str(content or ""))
+
+
+def display_text(content) -> str:
+    """Chat-bubble text for a message's content (str or multimodal parts)."""
+    if isinstance(content, list):
+        content = " ".join(
+            p.get("text", "") for p in content
+            if isinstance(p, dict) and p.get("type") == "text"
+        )
+    return parse_signals(content).display
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CHAT TRANSCRIPT
+# ═══════════════════════════════════════════════════════════════════════════════
+# Original: every Streamlit rerun walked the whole history, flattening
+# multimodal content and stripping signal codes from each message again, so
+# long Tarka/Rupak sessions slowed every keystroke. A ChatTranscript is the
+# session's message list (still a plain list of API message dicts, so it is
+# sent, sliced and serialised as before) that also stores each message's
+# display text, computed once when the message is added.
+
+class ChatTranscript(list):
+    """Agent message list that keeps a display-ready copy of each message."""
+
+    def __init__(self, messages=()):
+        super().__init__(messages)
+        self._display = [display_text(m.get("content", "")) for m in self]
+        self._summary = None              # (start, end, lines) of earlier_summary
+
+    def _sync(self):
+        # Mutations other than append/extend/pop/clear rebuild on next read
+        if len(self._display) != len(self):
+            self._display = [display_text(m.get("content", "")) for m in self]
+
+    def append(self, message):
+        super().append(message)
+        self._display.append(display_text(message.get("content", "")))
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def pop(self, index=-1):
+        message = super().pop(index)
+        if len(self._display) == len(self) + 1:
+            self._display.pop(index)
+        self._summary = None
+        return message
+
+    def clear(self):
+        super().clear()
+        self._display, self._summary = [], None
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._display, self._summary = [], None
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._display, self._summary = [], None
+
+    def insert(self, index, message):
+        super().insert(index, message)
+        self._display, self._summary = [], None
+
+    def __reduce_ex__(self, protocol):
+        # pickle/deepcopy rebuild from the messages (display text recomputed)
+        return (ChatTranscript, (list(self),))
+
+    def display_rows(self, start: int = 1) -> list:
+        """[(role, display text)] from `start` (1 skips the system prompt)."""
+        self._sync()
+        return [(m["role"], text) for m, text in
+                zip(self[start:], self._display[start:])]
+
+    def earlier_summary(self, end: int, start: int = 1,
+                        snippet_chars: int = 90) -> str:
+        """
+        Markdown digest of messages [start:end]: one line per student message
+        (first line, truncated). Cached on the transcript; when the window
+        moves forward only the newly hidden messages are summarised.
+        """
+        cached = self._summary
+        if not cached or cached[0] != start or cached[1] > end:
+            cached = (start, start, [])
+        if cached[1] < end:
+            self._sync()
+            lines = list(cached[2])
+            for m, text in zip(self[cached[1]:end], self._display[cached[1]:end]):
+                if m["role"] != "user":
+                    continue
+                first = (text.strip().splitlines() or [""])[0]
+                if len(first) > snippet_chars:
+                    first = first[:snippet_chars].rstrip() + "…"
+                lines.append(f"- {first}" if first else "- …")
+            cached = (start, end, lines)
+        self._summary = cached
+        return "\n".join(cached[2])
+
+
+def as_transcript(messages):
+    """`messages` as a ChatTranscript (converted once; None stays None)."""
+    if messages is None or isinstance(messages, ChatTranscript):
+        return messages
+    return ChatTranscript(messages)
+
+
+def call_agent(agent_key: str, messages: list, api_key: str,
+               stream: bool = False, module_id: str = "",
+               group: str = None) -> dict:
     """
     Calls OpenAI API for the specified agent.
     Returns a structured result dict with all detected signals.
 
+    stream=True returns an AgentStream instead: iterate it for display text
+    as it arrives, then read .result for the same dict.
+
+    module_id scopes the response cache (opening turns only, opt-in per
+    agent via config.RESPONSE_CACHE_AGENTS). group selects that research
+    group's generation-profile overrides (config.GROUPS).
+
     Result keys:
       content          (str)       — raw AI response
       display_content  (str)       — response with signal codes stripped
@@ -635,29 +1247,151 @@ def call_agent(agent_key: str, messages: list, api_key: str) -> dict:
       mastery          (bool)      — MASTERY_DETECTED
       triadic          (bool)      — TRIADIC_FLUENCY_DETECTED
       comm_complete    (bool)      — COMMUNICATION_COMPLETE
+      prompt_hash      (str)       — SYSTEM_PROMPTS hash of the prompt used
+      cached           (bool)      — served from the response cache
+      model            (str|None)  — model that answered (None if none did)
+      degraded         (bool)      — fallback model, interrupted or unavailable
+      degraded_reason  (str|None)  — see RESILIENCE above
     """
-    from openai import OpenAI
-    client  = OpenAI(api_key=api_key)
-    resp    = client.chat.completions.create(
-        model    = "gpt-4o",
-        messages = messages,
+    if stream:
+        return AgentStream(agent_key, messages, api_key, module_id, group)
+    profile   = generation_profile(agent_key, group)
+    prompt_id = prompt_hash(messages)
+    cache     = get_response_cache()
+    cache_key = cache.key(agent_key, module_id, messages, prompt_id,
+                          profile["model"])
+    if cache_key:
+        content = cache.get(agent_key, cache_key)
+        if content is not None:
+            return _agent_result(content, prompt_id, cached=True,
+                                 info={"model": profile["model"]})
+
+    content, info = resilient_complete(
+        profile, api_key, build_agent_context(agent_key, messages, api_key),
     )
-    content = resp.choices[0].message.content
+    if cache_key and content and not info["degraded"]:
+        cache.put(agent_key, cache_key, content)
+    return _agent_result(content, prompt_id, info=info)
 
-    display = content
-    for code in ALL_SIGNAL_CODES:
-        display = display.replace(code, "")
 
+def _agent_result(content: str, prompt_id: str = "", cached: bool = False,
+                  info: dict = None) -> dict:
+    """The call_agent result dict for a complete reply."""
+    signals = parse_signals(content)
     return {
         "content":          content,
-        "display_content":  display.strip(),
-        "tap_level":        detect_tap_level(content),
-        "rep_level":        detect_rep_level(content),
-        "hypothesis_level": detect_hypothesis_quality(content),
-        "evidence_level":   detect_evidence_quality(content),
-        "comm_level":       detect_communication_level(content),
-        "redirect":         detect_redirect(content),
-        "mastery":          "[MASTERY_DETECTED]"         in content,
-        "triadic":          "[TRIADIC_FLUENCY_DETECTED]" in content,
-        "comm_complete":    "[COMMUNICATION_COMPLETE]"   in content,
+        "display_content":  signals.display,
+        "tap_level":        signals.tap_level,
+        "rep_level":        signals.rep_level,
+        "hypothesis_level": signals.hypothesis_level,
+        "evidence_level":   signals.evidence_level,
+        "comm_level":       signals.comm_level,
+        "redirect":         signals.redirect,
+        "mastery":          signals.mastery,
+        "triadic":          signals.triadic,
+        "comm_complete":    signals.comm_complete,
+        "prompt_hash":      prompt_id,
+        "cached":           cached,
+        "model":            (info or {}).get("model"),
+        "degraded":         (info or {}).get("degraded", False),
+        "degraded_reason":  (info or {}).get("degraded_reason"),
     }
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# STREAMING REPLIES
+# ═══════════════════════════════════════════════════════════════════════════════
+# Students see tokens as they arrive instead of a spinner for the whole reply.
+# Signal codes must never reach the chat bubble, but a code can be split
+# across chunks ("[TAP_LE" + "VEL_3_DETECTED]"), so the filter holds back any
+# tail that could still become a code until the next chunk decides it.
+
+class SignalStreamFilter:
+    """
+    Removes signal codes from streamed text across chunk boundaries, using
+    the same _SIGNAL_RE as Signals so the bubble matches the final display.
+    """
+
+    def __init__(self):
+        self.detected = []          # codes seen so far, in order
+        self._pending = ""
+        # Every proper prefix of every code, for the hold-back check
+        self._prefixes = {c[:i] for c in ALL_SIGNAL_CODES for i in range(1, len(c))}
+
+    def feed(self, text: str) -> str:
+        """Adds a chunk; returns the text that is now safe to display."""
+        self._pending += text
+        # Codes hold a single "[": only an unclosed tail from the last one
+        # can still grow into a code, so keep it until it closes or diverges.
+        hold  = 0
+        start = self._pending.rfind("[")
+        if start != -1 and self._pending[start:] in self._prefixes:
+            hold = len(self._pending) - start
+        ready = self._pending[:len(self._pending) - hold]
+        self._pending = self._pending[len(ready):]
+        return self._release(ready)
+
+    def finish(self) -> str:
+        """Flushes whatever is left at the end of the stream."""
+        rest, self._pending = self._pending, ""
+        return self._release(rest)
+
+    def _release(self, text: str) -> str:
+        def record(match):
+            self.detected.append(match.group(0))
+            return ""
+        return _SIGNAL_RE.sub(record, text)
+
+
+class AgentStream:
+    """
+    Iterable of display text for one agent reply (signal codes removed).
+    After iteration, .content is the raw reply and .result the same dict
+    call_agent returns without streaming.
+    """
+
+    def __init__(self, agent_key: str, messages: list, api_key: str,
+                 module_id: str = "", group: str = None):
+        self.agent_key = agent_key
+        self.messages  = messages
+        self.api_key   = api_key
+        self.module_id = module_id
+        self.profile   = generation_profile(agent_key, group)
+        self.content   = ""
+        self.result    = None
+        self.filter    = SignalStreamFilter()
+
+    def __iter__(self):
+        prompt_id = prompt_hash(self.messages)
+        cache     = get_response_cache()
+        cache_key = cache.key(self.agent_key, self.module_id, self.messages,
+                              prompt_id, self.profile["model"])
+        if cache_key:
+            cached = cache.get(self.agent_key, cache_key)
+            if cached is not None:
+                self.content = cached
+                self.result  = _agent_result(cached, prompt_id, cached=True,
+                                             info={"model": self.profile["model"]})
+                yield self.result["display_content"]
+                return
+
+        self.info = {}
+        deltas = _resilient_deltas(
+            self.profile["deadline_secs"], self.api_key, self.info,
+            **_generation_request(self.profile),
+            messages = build_agent_context(self.agent_key, self.messages,
+                                           self.api_key),
+        )
+        parts = []
+        for delta in deltas:
+            parts.append(delta)
+            text = self.filter.feed(delta)
+            if text:
+                yield text
+        tail = self.filter.finish()
+        if tail:
+            yield tail
+        self.content = "".join(parts)
+        self.result  = _agent_result(self.content, prompt_id, info=self.info)
+        if cache_key and self.content and not self.info["degraded"]:
+            cache.put(self.agent_key, cache_key, self.content)
@@ -5,6 +5,12 @@ Central configuration for:
   1. Research group definitions and agent access rules
   2. Trilingual language management (English / Nepali / Korean)
   3. Group-aware agent unlock logic
+  4. Storage backend selection (Sheets / SQLite / in-memory)
+  5. Agent engine limits (concurrent requests, queue and request timeouts)
+     and retries, fallback model, circuit breaker
+  6. Opt-in agent response cache
+  7. Chat history window (turns rendered per rerun)
+  8. Session checkpoints (resume a student's session after a reload)
 
 RESEARCH GROUPS:
   CON   — Control group: no AI agents, standard instruction only
@@ -22,11 +28,18 @@ LANGUAGE POLICY:
   via their system prompts.
 """
 
+import os
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # RESEARCH GROUP CONFIGURATION
 # ═══════════════════════════════════════════════════════════════════════════════
 
 # Group codes used throughout the system
+#
+# "generation" optionally overrides an agent's generation profile for this
+# group (agents.AGENTS[...]["generation"]), e.g. a cheaper, faster model for
+# a latency-sensitive agent:
+#     "generation": {"SAATHI": {"model": "gpt-4o-mini", "deadline_secs": 15}}
 GROUPS = {
     "CON": {
         "label":        "Control Group (CON)",
@@ -34,6 +47,7 @@ GROUPS = {
         "agents":       [],          # empty = no agent access
         "multimodal":   False,
         "color":        "#d62728",
+        "generation":   {},
     },
     "SA": {
         "label":        "Single Agent (SA)",
@@ -41,6 +55,7 @@ GROUPS = {
         "agents":       ["SAATHI"],
         "multimodal":   False,
         "color":        "#ff7f0e",
+        "generation":   {},
     },
     "MA": {
         "label":        "Multiple Agents (MA)",
@@ -48,6 +63,7 @@ GROUPS = {
         "agents":       ["SAATHI", "TARKA", "RUPAK"],
         "multimodal":   False,
         "color":        "#1f77b4",
+        "generation":   {},
     },
     "MMALE": {
         "label":        "Full MMALE Ecology",
@@ -55,6 +71,7 @@ GROUPS = {
         "agents":       ["SAATHI", "KHOJI", "PRAMAN", "TARKA", "RUPAK", "SANDESH"],
         "multimodal":   True,
         "color":        "#2ca02c",
+        "generation":   {},
     },
 }
 
@@ -349,3 +366,92 @@ KOREAN_PRACTICE = {
     "RUPAK":   ("모델링",  "Johnstone 삼각형 탐색"),
     "SANDESH": ("소통",    "이중언어 과학 의사소통"),
 }
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# STORAGE BACKEND
+# ═══════════════════════════════════════════════════════════════════════════════
+# Where database_manager keeps research data:
+#   "sheets" — Google Sheets (production default)
+#   "sqlite" — one local SQLite file at STORAGE_SQLITE_PATH
+#   "memory" — in-process only; for tests, benchmarks and offline demos
+
+STORAGE_BACKEND     = os.environ.get("MMALE_STORAGE_BACKEND", "sheets").lower()
+STORAGE_SQLITE_PATH = os.environ.get(
+    "MMALE_STORAGE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 ".mmale_cache", "mmale.sqlite3"),
+)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# AGENT ENGINE
+# ═══════════════════════════════════════════════════════════════════════════════
+# Limits for agent_engine: how many OpenAI requests may run at once across all
+# sessions, how long a request may wait for a slot, and its overall deadline.
+
+AGENT_MAX_IN_FLIGHT        = int(os.environ.get("MMALE_AGENT_MAX_IN_FLIGHT", 16))
+AGENT_QUEUE_TIMEOUT_SECS   = float(os.environ.get("MMALE_AGENT_QUEUE_TIMEOUT", 60))
+AGENT_REQUEST_TIMEOUT_SECS = float(os.environ.get("MMALE_AGENT_REQUEST_TIMEOUT", 90))
+
+# Per-agent latency budgets live in the agents' generation profiles
+# (agents.AGENTS[...]["generation"]["deadline_secs"]); retries and the
+# fallback model must fit inside them.
+AGENT_MAX_RETRIES           = 2       # retries of the primary model per turn
+AGENT_RETRY_BASE_SECS       = 1.0     # jittered exponential backoff base
+AGENT_FALLBACK_MODEL        = os.environ.get("MMALE_AGENT_FALLBACK_MODEL", "gpt-4o-mini")
+AGENT_FALLBACK_RESERVE_SECS = 12      # budget kept back for a fallback call
+
+# Circuit breaker on the primary model: opens when at least
+# BREAKER_MIN_CALLS of the last BREAKER_WINDOW calls exist and the error share
+# reaches BREAKER_ERROR_RATE; while open, turns go straight to the fallback
+# model. One probe call is let through every BREAKER_COOLDOWN_SECS.
+BREAKER_WINDOW        = 20
+BREAKER_MIN_CALLS     = 8
+BREAKER_ERROR_RATE    = 0.5
+BREAKER_COOLDOWN_SECS = 30
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# AGENT RESPONSE CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+# Opt-in per agent (see response_cache.py). Enable with a comma-separated list,
+# e.g. MMALE_RESPONSE_CACHE_AGENTS=SAATHI,KHOJI. Only the opening turns of a
+# conversation (at most RESPONSE_CACHE_LAST_N messages) are ever cached.
+
+_CACHED_AGENTS = {
+    a.strip().upper()
+    for a in os.environ.get("MMALE_RESPONSE_CACHE_AGENTS", "").split(",")
+    if a.strip()
+}
+RESPONSE_CACHE_AGENTS = {
+    agent: agent in _CACHED_AGENTS
+    for agent in ["SAATHI", "KHOJI", "PRAMAN", "TARKA", "RUPAK", "SANDESH"]
+}
+RESPONSE_CACHE_TTL_SECS    = float(os.environ.get("MMALE_RESPONSE_CACHE_TTL", 24 * 3600))
+RESPONSE_CACHE_MAX_ENTRIES = 2048
+RESPONSE_CACHE_LAST_N      = 2     # opening + the student's first reply
+RESPONSE_CACHE_PATH        = os.path.join(
+    os.path.dirname(STORAGE_SQLITE_PATH), "responses.sqlite3"
+)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CHAT HISTORY WINDOW
+# ═══════════════════════════════════════════════════════════════════════════════
+# Agent chats render only their last CHAT_WINDOW_TURNS turns (student message
+# + agent reply) on each rerun; earlier turns sit behind a summary block and
+# "load earlier turns" reveals them CHAT_WINDOW_TURNS at a time
+# (see mmale_components.render_chat_history).
+CHAT_WINDOW_TURNS = int(os.environ.get("MMALE_CHAT_WINDOW_TURNS", 6))
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SESSION CHECKPOINTS
+# ═══════════════════════════════════════════════════════════════════════════════
+# After each turn the student's session (active module, agent conversations,
+# turn counters, research levels, open forms) is written in the background to
+# a local SQLite store keyed by User_ID; login restores it (see
+# session_checkpoints.py). Checkpoints older than CHECKPOINT_TTL_SECS are
+# ignored and purged.
+CHECKPOINT_PATH = os.environ.get(
+    "MMALE_CHECKPOINT_PATH",
+    os.path.join(os.path.dirname(STORAGE_SQLITE_PATH), "sessions.sqlite3"),
+)
+CHECKPOINT_TTL_SECS = float(os.environ.get("MMALE_CHECKPOINT_TTL", 14 * 24 * 3600))
@@ -17,6 +17,50 @@ Changes from original:
   - fetch_agent_interaction_summary: new — returns cross-agent
     interaction counts and completion rates for the full paper
   - All original functions preserved and unchanged.
+  - WriteBehindLogger: new — Temporal_Traces, ArgLog and RepLog rows are
+    queued in memory and flushed by a background thread with one
+    append_rows call per sheet (size/time trigger); overflow spills to a
+    local SQLite file. The admin / researcher "Sync now" buttons call
+    flush_event_logs() to force a drain before export.
+  - SheetReplica: new — local SQLite copy of every research sheet, synced
+    incrementally by row offset in the background. read_sheet() and
+    query_replica() serve analytics from it instead of get_all_records().
+  - TailReader: new — remembers the header and last row consumed per
+    worksheet and fetches only the rows after it (one batch_get that also
+    re-checks the header and the anchor row); a truncation or header change
+    falls back to a full reload. The replica syncs through it, and
+    read_sheet() merges new rows of append-only sheets into the cached frame.
+  - SnapshotCache: new — process-wide parsed-DataFrame cache keyed by
+    (worksheet, data version) with a TTL; any log_*/save_* write through
+    this module bumps the sheet's version so the next read is fresh.
+  - ParticipantDirectory: new — hash index of Participants keyed by the
+    normalised User_ID; check_login() is a dictionary lookup.
+  - SheetsQuotaGuard: new — every worksheet call made through the registry
+    takes a token from a read or write bucket sized to the Sheets
+    per-minute quota (writes first), and 429/5xx responses are retried
+    with jittered exponential backoff; sheets_quota_stats() exposes the
+    throttle/retry/drop counters.
+  - WorksheetRegistry: new — every worksheet handle is resolved once per
+    spreadsheet session and sheets with a SHEET_HEADERS entry are created
+    once, under a lock; log writes no longer pay a sh.worksheet() lookup.
+  - Conversations: new sheet holding both sides of every agent chat turn,
+    written through the write-behind logger; fetch_chat_history() is an
+    indexed (User_ID, Module_ID, Agent) replica query instead of a scan
+    of Temporal_Traces. Each row carries the hash of the agent system
+    prompt that produced it (agents.SYSTEM_PROMPTS).
+  - AnswerKeyIndex: new — one shared Sub_Title → Correct_Answer map used
+    by log_assessment scoring and gap analysis; save_bulk_concepts updates
+    it in place.
+  - StorageBackend: new — every public function goes through get_storage(),
+    which returns SheetsBackend (this module) or the SQLite / in-memory
+    backends from storage_backends.py, chosen by config.STORAGE_BACKEND.
+  - LearnerState: new — each student's finished modules, agent completion,
+    best TAP / representational level and pending forms, built once at
+    login (load_learner_state) and updated by the log_* writers below.
+  - Session checkpoints: new — checkpoint_session() queues a compact copy of
+    the student's session after each turn (written in the background to
+    local SQLite, session_checkpoints.py); restore_session() brings it back
+    at login with one keyed read.
 
 Google Sheets structure required (add these two worksheets):
   ArgLog   — columns: Timestamp, User_ID, Group, Module_ID,
@@ -34,7 +78,23 @@ from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 import io
+import os
+import json
+import time
+import random
+import sqlite3
+import atexit
+import threading
 from datetime import datetime, timedelta
+from storage_backends import (
+    StorageBackend, SQLiteBackend, MemoryBackend, TABLE_SCHEMAS,
+    create_table, column_names as _column_names,
+    quote_identifier as _quote,
+)
+from learner_state import LearnerState, register, get_learner_state, forget
+from session_checkpoints import (
+    get_checkpoint_store, snapshot_session, restore_snapshot,
+)
 
 # ── Research constants ─────────────────────────────────────────────────────────
 
@@ -86,23 +146,1209 @@ def get_spreadsheet():
     client = get_gspread_client()
     return client.open_by_key(SHEET_KEY) if client else None
 
-# ── 2. Core login (UNCHANGED) ──────────────────────────────────────────────────
+# ── 1a. Quota guard & worksheet registry (NEW) ────────────────────────────────
+#
+# PERFORMANCE FIX:
+# Original: no throttling, so bursts from many sessions hit the Sheets
+# per-minute quota and the resulting 429s were swallowed (data lost).
+# Fix: read and write calls each take a token from their own bucket (refilled
+# at the per-minute quota); a read waits while any write is waiting for a
+# token, so logging wins over dashboards. 429 and 5xx responses are retried
+# with jittered exponential backoff; operations that run out of retries or
+# wait too long for a token are counted as dropped and re-raised.
+
+SHEETS_READS_PER_MINUTE  = int(os.environ.get("MMALE_SHEETS_READS_PER_MIN", 60))
+SHEETS_WRITES_PER_MINUTE = int(os.environ.get("MMALE_SHEETS_WRITES_PER_MIN", 60))
+SHEETS_MAX_RETRIES       = 5
+SHEETS_BACKOFF_BASE      = 1.0     # seconds; doubled per retry
+SHEETS_BACKOFF_MAX       = 32.0
+SHEETS_READ_WAIT_LIMIT   = 30.0    # seconds a read may queue for a token
+SHEETS_WRITE_WAIT_LIMIT  = 120.0   # seconds a write may queue for a token
+SHEETS_RETRY_STATUSES    = {429, 500, 502, 503, 504}
+
+SHEETS_READ_METHODS = {
+    "get_all_records", "get_all_values", "get_values", "get", "batch_get",
+    "col_values", "row_values", "acell", "cell", "find", "findall",
+}
+SHEETS_WRITE_METHODS = {
+    "append_row", "append_rows", "update", "batch_update", "update_cell",
+    "update_acell", "insert_row", "insert_rows", "delete_rows", "clear",
+}
 
-def check_login(user_id):
+
+class SheetsQuotaExceeded(Exception):
+    """A Sheets call waited longer than its limit for a quota token."""
+
+
+class TokenBucket:
+    """Refills `per_minute` tokens per minute, holding at most `burst`."""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate     = per_minute / 60.0
+        self.capacity = burst or max(1, per_minute // 6)
+        self._tokens  = float(self.capacity)
+        self._updated = time.monotonic()
+
+    def take(self):
+        """Takes a token; returns 0, or the seconds until one is available."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class SheetsQuotaGuard:
+    """Rate-limits and retries Sheets API calls for the whole process."""
+
+    def __init__(self, reads_per_minute=SHEETS_READS_PER_MINUTE,
+                 writes_per_minute=SHEETS_WRITES_PER_MINUTE):
+        self._buckets = {
+            "read":  TokenBucket(reads_per_minute),
+            "write": TokenBucket(writes_per_minute),
+        }
+        self._cond = threading.Condition()
+        self._writes_waiting = 0
+        self.stats = {
+            "calls": 0, "throttled": 0, "retries": 0, "dropped": 0,
+            "last_error": None,
+        }
+
+    def _acquire(self, kind):
+        limit = SHEETS_WRITE_WAIT_LIMIT if kind == "write" else SHEETS_READ_WAIT_LIMIT
+        deadline  = time.monotonic() + limit
+        throttled = False
+        with self._cond:
+            if kind == "write":
+                self._writes_waiting += 1
+            try:
+                while True:
+                    if kind == "read" and self._writes_waiting:
+                        wait = 0.1                     # let queued writes go first
+                    else:
+                        wait = self._buckets[kind].take()
+                        if not wait:
+                            return
+                    if not throttled:
+                        throttled = True
+                        self.stats["throttled"] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["dropped"] += 1
+                        raise SheetsQuotaExceeded(f"no {kind} quota within {limit:.0f}s")
+                    self._cond.wait(min(wait, remaining))
+            finally:
+                if kind == "write":
+                    self._writes_waiting -= 1
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _status(error):
+        code = getattr(error, "code", None)
+        if not isinstance(code, int) or code < 0:
+            code = getattr(getattr(error, "response", None), "status_code", None)
+        return code
+
+    def call(self, kind, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) as a `kind` ('read'/'write') Sheets call."""
+        for attempt in range(SHEETS_MAX_RETRIES + 1):
+            self._acquire(kind)
+            try:
+                result = fn(*args, **kwargs)
+                self.stats["calls"] += 1
+                return result
+            except gspread.exceptions.APIError as e:
+                self.stats["last_error"] = f"{kind}: {e}"
+                if self._status(e) not in SHEETS_RETRY_STATUSES:
+                    raise
+                if attempt == SHEETS_MAX_RETRIES:
+                    self.stats["dropped"] += 1
+                    raise
+                self.stats["retries"] += 1
+                delay = min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * 2 ** attempt)
+                time.sleep(random.uniform(delay / 2, delay))
+
+
+@st.cache_resource(show_spinner=False)
+def get_quota_guard():
+    """Process-wide Sheets quota guard shared by all sessions."""
+    return SheetsQuotaGuard()
+
+
+def sheets_quota_stats():
+    """Returns a copy of the quota guard's counters."""
+    return dict(get_quota_guard().stats)
+
+
+class GuardedWorksheet:
+    """Worksheet proxy that sends API calls through the quota guard."""
+
+    def __init__(self, worksheet, guard):
+        self._ws    = worksheet
+        self._guard = guard
+
+    def __getattr__(self, attr):
+        value = getattr(self._ws, attr)
+        if attr in SHEETS_READ_METHODS:
+            kind = "read"
+        elif attr in SHEETS_WRITE_METHODS:
+            kind = "write"
+        else:
+            return value
+        return lambda *a, **k: self._guard.call(kind, value, *a, **k)
+
+#
+# PERFORMANCE FIX:
+# Original: every log_* call did sh.worksheet(name) — one metadata round trip
+# before the actual write — and the ArgLog/RepLog/OpenResponse/
+# ReflectionSurvey writers also ran add_worksheet + header append_row on the
+# write path, where concurrent sessions could race to create the same sheet.
+# Fix: one sh.worksheets() call resolves every handle; sheets listed in
+# SHEET_HEADERS that are missing are created with their header row exactly
+# once, under a lock. A log write afterwards is exactly one API call.
+
+# Sheets created (with their header row) when missing
+SHEET_HEADERS = {
+    name: TABLE_SCHEMAS[name]
+    for name in ("ArgLog", "RepLog", "OpenResponse", "ReflectionSurvey",
+                 "Conversations")
+}
+
+# Initial grid size for bootstrapped sheets
+SHEET_BOOTSTRAP_ROWS = {"ReflectionSurvey": 1000}
+
+
+class WorksheetRegistry:
+    """Cached gspread Worksheet handles for one spreadsheet session."""
+
+    def __init__(self, spreadsheet, guard):
+        self._sh      = spreadsheet
+        self._guard   = guard
+        self._lock    = threading.Lock()
+        self._handles = {
+            ws.title: GuardedWorksheet(ws, guard)
+            for ws in guard.call("read", spreadsheet.worksheets)
+        }
+        with self._lock:
+            for name in SHEET_HEADERS:
+                if name not in self._handles:
+                    self._create(name)
+
+    def _create(self, name):
+        header = SHEET_HEADERS[name]
+        try:
+            ws = self._guard.call(
+                "write", self._sh.add_worksheet,
+                title=name, rows=SHEET_BOOTSTRAP_ROWS.get(name, 2000),
+                cols=len(header),
+            )
+        except gspread.exceptions.APIError:
+            # Another process created it first — use theirs
+            self._handles[name] = GuardedWorksheet(
+                self._guard.call("read", self._sh.worksheet, name), self._guard
+            )
+            return
+        ws = GuardedWorksheet(ws, self._guard)
+        ws.append_row(header)
+        self._handles[name] = ws
+
+    def titles(self):
+        return list(self._handles)
+
+    def get(self, name):
+        """
+        Returns the Worksheet for `name`. Sheets created outside this
+        process are resolved (once) on first request; raises
+        gspread.WorksheetNotFound if the sheet does not exist.
+        """
+        ws = self._handles.get(name)
+        if ws is not None:
+            return ws
+        with self._lock:
+            if name not in self._handles:
+                if name in SHEET_HEADERS:
+                    self._create(name)
+                else:
+                    self._handles[name] = GuardedWorksheet(
+                        self._guard.call("read", self._sh.worksheet, name),
+                        self._guard,
+                    )
+            return self._handles[name]
+
+
+@st.cache_resource(ttl=3600, show_spinner=False)
+def get_worksheet_registry():
+    """Registry bound to the cached spreadsheet (same hourly lifetime)."""
+    sh = get_spreadsheet()
+    return WorksheetRegistry(sh, get_quota_guard()) if sh else None
+
+
+def get_worksheet(name):
+    """
+    Cached, quota-guarded Worksheet handle for `name` — no API call after
+    the first.
+    """
+    registry = get_worksheet_registry()
+    if registry is None:
+        raise RuntimeError("Google Sheets client is not configured")
+    return registry.get(name)
+
+# ── 1b. Write-behind event logger (NEW) ────────────────────────────────────────
+#
+# PERFORMANCE FIX:
+# Original: every chat turn made 2–4 blocking append_row calls (trace, ArgLog,
+# RepLog) before st.rerun(). 40 students × several turns/minute exhausts the
+# Sheets write quota and adds seconds of latency to each turn.
+# Fix: rows for the high-volume, append-only trace sheets are queued in memory
+# per worksheet and a daemon thread writes each sheet's queue with ONE
+# append_rows call when it reaches WRITE_BEHIND_BATCH_SIZE rows or its oldest
+# row has waited WRITE_BEHIND_MAX_DELAY seconds.
+#
+# Assessment_Logs stays synchronous: render_modules reads it straight back to
+# decide which module is next, so it must be read-your-writes.
+
+WRITE_BEHIND_BATCH_SIZE  = 50      # rows per sheet that trigger an early flush
+WRITE_BEHIND_MAX_DELAY   = 5.0     # seconds a row may wait before flushing
+WRITE_BEHIND_MAX_PENDING = 5000    # per-sheet rows kept in memory; older rows spill
+
+
+class SpillStore:
+    """
+    Local SQLite overflow for write-behind rows (oldest first per sheet).
+    Rows wait here while Sheets is unreachable instead of being discarded.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spill ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, sheet TEXT, row TEXT)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def push(self, sheet_name, rows):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO spill (sheet, row) VALUES (?, ?)",
+                [(sheet_name, json.dumps(r, default=str)) for r in rows],
+            )
+            self._conn.commit()
+
+    def peek(self, sheet_name):
+        with self._lock:
+            return [json.loads(r) for (r,) in self._conn.execute(
+                "SELECT row FROM spill WHERE sheet = ? ORDER BY id", (sheet_name,)
+            )]
+
+    def head(self, sheet_name, limit):
+        """(last id, rows) for up to `limit` of the oldest spilled rows."""
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT id, row FROM spill WHERE sheet = ? ORDER BY id LIMIT ?",
+                (sheet_name, limit),
+            ).fetchall()
+        if not found:
+            return None, []
+        return found[-1][0], [json.loads(r) for _, r in found]
+
+    def discard(self, sheet_name, last_id):
+        """Deletes spilled rows up to `last_id` once they are written."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM spill WHERE sheet = ? AND id <= ?",
+                (sheet_name, last_id),
+            )
+            self._conn.commit()
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT sheet, count(*) FROM spill GROUP BY sheet"
+            ).fetchall())
+
+
+class WriteBehindLogger:
+    """
+    Per-worksheet in-memory row queue drained by a background thread.
+
+    enqueue() never touches the network. Rows from a failed flush are put
+    back at the front of their queue (order preserved) and retried on the
+    next cycle. Beyond WRITE_BEHIND_MAX_PENDING rows per sheet the oldest
+    spill to a local SQLite file and are written ahead of the in-memory
+    queue on the next drain; rows are dropped (and counted) only if that
+    spill fails too.
+    """
+
+    def __init__(self, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 max_delay=WRITE_BEHIND_MAX_DELAY,
+                 max_pending=WRITE_BEHIND_MAX_PENDING, spill_path=None):
+        self.batch_size  = batch_size
+        self.max_delay   = max_delay
+        self.max_pending = max_pending
+        self._queues     = {}     # sheet name -> list of rows
+        self._oldest     = {}     # sheet name -> monotonic time of oldest row
+        self._spilled    = {}     # sheet name -> rows waiting in the spill store
+        self._lock       = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake       = threading.Event()
+        self._stats = {
+            "rows_written": 0, "append_calls": 0, "errors": 0,
+            "spilled": 0, "dropped": 0, "last_error": None,
+        }
+        self._spill = None
+        if spill_path:
+            try:
+                self._spill = SpillStore(spill_path)
+                self._spilled = self._spill.counts()   # left by a previous run
+            except sqlite3.Error:
+                self._spill = None
+        self._thread = threading.Thread(
+            target=self._run, name="mmale-write-behind", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @property
+    def stats(self):
+        """Copy of the write / spill / error counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _note_written(self, rows):
+        with self._lock:
+            self._stats["rows_written"] += rows
+            self._stats["append_calls"] += 1
+
+    def _note_error(self, name, error):
+        with self._lock:
+            self._stats["errors"]    += 1
+            self._stats["last_error"] = f"{name}: {error}"
+
+    def enqueue(self, sheet_name, row):
+        with self._lock:
+            queue = self._queues.setdefault(sheet_name, [])
+            if not queue:
+                self._oldest[sheet_name] = time.monotonic()
+            queue.append(row)
+            overflow = len(queue) - self.max_pending
+            if overflow > 0:
+                spilled = queue[:overflow]
+                del queue[:overflow]
+                self._spill_rows(sheet_name, spilled)
+            full = len(queue) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _spill_rows(self, sheet_name, rows):
+        # caller holds self._lock
+        try:
+            if self._spill is None:
+                raise sqlite3.Error("no spill store")
+            self._spill.push(sheet_name, rows)
+            self._spilled[sheet_name] = self._spilled.get(sheet_name, 0) + len(rows)
+            self._stats["spilled"] += len(rows)
+        except sqlite3.Error:
+            self._stats["dropped"] += len(rows)
+
+    def queued(self, sheet_name):
+        """Copy of the rows still waiting to be written to `sheet_name`."""
+        with self._lock:
+            rows = list(self._queues.get(sheet_name, []))
+            spilled = self._spilled.get(sheet_name)
+        if spilled:
+            try:
+                rows = self._spill.peek(sheet_name) + rows
+            except sqlite3.Error:
+                pass
+        return rows
+
+    def pending(self):
+        """Returns {sheet_name: queued row count} (memory + spill) per sheet."""
+        with self._lock:
+            names = set(self._queues) | set(self._spilled)
+            counts = {
+                name: len(self._queues.get(name, [])) + self._spilled.get(name, 0)
+                for name in names
+            }
+        return {name: n for name, n in counts.items() if n}
+
+    def flush(self, sheet_name=None):
+        """Writes queued and spilled rows now (one sheet or all). Returns rows written."""
+        with self._lock:
+            names = [sheet_name] if sheet_name else list(
+                set(self._queues) | set(self._spilled))
+        return self._drain(names)
+
+    def _due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                name for name, q in self._queues.items()
+                if q and (len(q) >= self.batch_size
+                          or now - self._oldest.get(name, now) >= self.max_delay)
+            ]
+            # Rows spilled by an earlier run have no in-memory queue to trigger
+            return due + [n for n, c in self._spilled.items() if c and n not in due]
+
+    def _drain_spill(self, name):
+        """Writes spilled rows of `name` (oldest first). False if a write failed."""
+        written = 0
+        while True:
+            with self._lock:
+                if not self._spilled.get(name):
+                    break
+            try:
+                last_id, rows = self._spill.head(name, self.max_pending)
+            except sqlite3.Error:
+                break
+            if not rows:
+                with self._lock:
+                    self._spilled[name] = 0
+                break
+            try:
+                get_worksheet(name).append_rows(rows)
+                _note_write(name)
+            except Exception as e:
+                self._note_error(name, e)
+                return written, False
+            try:
+                self._spill.discard(name, last_id)
+            except sqlite3.Error:
+                pass
+            with self._lock:
+                self._spilled[name] = max(0, self._spilled[name] - len(rows))
+            written += len(rows)
+            self._note_written(len(rows))
+        return written, True
+
+    def _drain(self, names):
+        written = 0
+        with self._flush_lock:
+            for name in names:
+                # Spilled rows are older than anything queued: write them first
+                spilled, ok = self._drain_spill(name)
+                written += spilled
+                if not ok:
+                    continue
+                with self._lock:
+                    rows = self._queues.pop(name, [])
+                    self._oldest.pop(name, None)
+                if not rows:
+                    continue
+                try:
+                    get_worksheet(name).append_rows(rows)
+                    _note_write(name)
+                    written += len(rows)
+                    self._note_written(len(rows))
+                except Exception as e:
+                    self._note_error(name, e)
+                    with self._lock:
+                        self._queues[name] = rows + self._queues.get(name, [])
+                        self._oldest[name] = time.monotonic()
+        return written
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=min(1.0, self.max_delay))
+            self._wake.clear()
+            try:
+                self._drain(self._due())
+            except Exception:
+                pass   # never let the worker die; rows stay queued
+
+
+@st.cache_resource(show_spinner=False)
+def get_event_logger():
+    """Process-wide write-behind logger shared by all sessions."""
+    from config import STORAGE_SQLITE_PATH
+    return WriteBehindLogger(spill_path=os.path.join(
+        os.path.dirname(STORAGE_SQLITE_PATH), "write_behind_spill.sqlite3"))
+
+
+def flush_event_logs(sheet_name=None):
+    """
+    Forces queued trace rows to storage. Blocking (Sheets round-trips), so
+    call it from an explicit sync action or right before an export — not on
+    every rerun.
+    """
+    return get_storage().flush(sheet_name)
+
+
+def pending_event_logs():
+    """Returns {sheet_name: rows still queued in memory}."""
+    return get_storage().pending()
+
+# ── 1c. Local SQLite read replica (NEW) ────────────────────────────────────────
+#
+# PERFORMANCE FIX:
+# Original: every analytics view called get_all_records() on a whole sheet and
+# rebuilt a DataFrame on every rerun — the full study downloaded per click.
+# Fix: one SQLite file mirrors every research sheet. A daemon thread pulls
+# only the rows appended since the last sync (TailReader below, one API
+# call); reads run indexed SQL locally. Rows are keyed by sheet row number,
+# so re-syncing the same range is idempotent. If a sheet was truncated or its
+# header changed, its table is rebuilt and its generation incremented.
+#
+# Writes made by this process mark the sheet stale, and the next read syncs
+# that sheet first (read-your-writes for the student pages).
+
+REPLICA_PATH = os.environ.get(
+    "MMALE_REPLICA_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 ".mmale_cache", "replica.sqlite3"),
+)
+REPLICA_SYNC_INTERVAL = 30   # seconds between background sync passes
+
+REPLICA_SHEETS = [
+    "Participants",
+    "Instructional_Materials",
+    "Assessment_Logs",
+    "Temporal_Traces",
+    "ArgLog",
+    "RepLog",
+    "OpenResponse",
+    "ReflectionSurvey",
+    "Conversations",
+]
+
+def _column_letter(n):
+    """1 → 'A', 27 → 'AA'."""
+    return gspread.utils.rowcol_to_a1(1, max(n, 1))[:-1]
+
+
+# Sheets that only ever grow by appended rows: cached frames are extended
+# with the new rows instead of being rebuilt.
+APPEND_ONLY_SHEETS = {
+    "Temporal_Traces", "ArgLog", "RepLog", "Assessment_Logs",
+    "OpenResponse", "Conversations",
+}
+
+
+def _trim_row(row):
+    """Row without trailing empty cells (the API omits them)."""
+    row = list(row)
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+class TailReader:
+    """
+    Per-worksheet read cursor: the header and the last data row consumed.
+
+    read() requests the header row and the range from the last consumed row
+    onwards in one batch_get. If the header is unchanged and that row is
+    still in place, only the rows after it are returned; otherwise (first
+    read, truncation, rewritten rows or header change) the sheet is re-read
+    in full and the caller is told to reset.
+    """
+
+    def __init__(self):
+        self._state = {}    # sheet -> (header, rows consumed, last row or None)
+        self._lock  = threading.Lock()
+        self.stats  = {"tail_reads": 0, "full_reads": 0, "resets": 0}
+
+    def seed(self, name, header, consumed):
+        """Resumes from a persisted position; its last row is not known yet."""
+        with self._lock:
+            self._state.setdefault(name, (list(header), consumed, None))
+
+    def forget(self, name):
+        with self._lock:
+            self._state.pop(name, None)
+
+    def position(self, name):
+        """Data rows consumed so far for `name`, or None before the first read."""
+        state = self._state.get(name)
+        return None if state is None else state[1]
+
+    def read(self, name, ws):
+        """
+        Returns (reset, header, rows).
+
+        reset=False: `rows` are the data rows appended since the last read.
+        reset=True:  the sheet was read in full and `rows` is every data row
+                     (header is None if the sheet is empty).
+        """
+        with self._lock:
+            state = self._state.get(name)
+        if state is not None:
+            header, consumed, last = state
+            end_col = _column_letter(len(header))
+            head, tail = ws.batch_get(["1:1", f"A{consumed + 1}:{end_col}"])
+            expected = header if consumed == 0 else last
+            anchor   = _trim_row(tail[0]) if tail else None
+            if (_trim_row(head[0] if head else []) == _trim_row(header)
+                    and anchor is not None
+                    and (expected is None or anchor == _trim_row(expected))):
+                rows = [list(r) for r in tail[1:]]
+                with self._lock:
+                    self._state[name] = (
+                        header, consumed + len(rows),
+                        rows[-1] if rows else (last or tail[0]),
+                    )
+                    self.stats["tail_reads"] += 1
+                return False, header, rows
+            self.stats["resets"] += 1
+
+        values = ws.get_all_values()
+        with self._lock:
+            self.stats["full_reads"] += 1
+            if not values:
+                self._state.pop(name, None)
+                return True, None, []
+            header, rows = values[0], values[1:]
+            self._state[name] = (header, len(rows), rows[-1] if rows else header)
+        return True, header, rows
+
+
+@st.cache_resource(show_spinner=False)
+def get_tail_reader():
+    """Process-wide tail-read cursors shared by the replica and its callers."""
+    return TailReader()
+
+
+class SheetReplica:
+    """
+    SQLite mirror of the research spreadsheet.
+
+    Table per sheet: `_row` (sheet row number, PRIMARY KEY) + one column per
+    header cell. `_replica_meta` stores each sheet's header and how many data
+    rows have been copied, so a sync only requests rows after that offset.
+    """
+
+    def __init__(self, path=REPLICA_PATH, sheets=REPLICA_SHEETS,
+                 interval=REPLICA_SYNC_INTERVAL):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.sheets   = list(sheets)
+        self.interval = interval
+        self._conn    = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _replica_meta ("
+            "sheet TEXT PRIMARY KEY, header TEXT, row_offset INTEGER, "
+            "version INTEGER)"
+        )
+        self._conn.commit()
+        self._lock      = threading.RLock()
+        self._sync_locks = {}                # sheet -> lock held while syncing
+        self._stale     = set(self.sheets)   # sync each sheet once on first use
+        self._missing   = set()              # sheets not present in the spreadsheet
+        self._listeners = {}                 # sheet -> callbacks run after new rows
+        self._generations = {}               # sheet -> table rebuild counter
+        self._thread = threading.Thread(
+            target=self._run, name="mmale-replica-sync", daemon=True
+        )
+        self._thread.start()
+
+    # ── metadata ──────────────────────────────────────────────────────────────
+
+    def _meta(self, name):
+        row = self._conn.execute(
+            "SELECT header, row_offset, version FROM _replica_meta WHERE sheet = ?",
+            (name,),
+        ).fetchone()
+        if row is None:
+            return None, 0, 0
+        return json.loads(row[0]), row[1], row[2]
+
+    def _set_meta(self, name, header, offset, version):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO _replica_meta VALUES (?, ?, ?, ?)",
+            (name, json.dumps(header), offset, version),
+        )
+
+    def version(self, name):
+        """Increments whenever a sync adds rows to `name`."""
+        with self._lock:
+            return self._meta(name)[2]
+
+    def header(self, name):
+        """Header row last synced for `name`, or None."""
+        with self._lock:
+            return self._meta(name)[0]
+
+    def generation(self, name):
+        """Increments whenever `name` is rebuilt from a full read."""
+        return self._generations.get(name, 0)
+
+    def mark_stale(self, name):
+        self._stale.add(name)
+
+    def subscribe(self, name, callback):
+        """
+        Calls callback() (outside the sync lock) after a sync adds rows to
+        `name` or rebuilds it (check generation() to tell the two apart).
+        """
+        self._listeners.setdefault(name, []).append(callback)
+
+    def _notify(self, name):
+        for callback in self._listeners.get(name, []):
+            try:
+                callback()
+            except Exception:
+                pass
+
+    # ── sync ──────────────────────────────────────────────────────────────────
+
+    def _create_table(self, name, header):
+        create_table(self._conn, name, header)
+
+    def _insert(self, name, header, first_row, rows):
+        width = len(header)
+        params = [
+            [first_row + i] + gspread.utils.numericise_all(
+                (list(r) + [""] * width)[:width]
+            )
+            for i, r in enumerate(rows)
+        ]
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO {_quote(name)} VALUES "
+            f"({', '.join('?' * (width + 1))})",
+            params,
+        )
+
+    def _sync_lock(self, name):
+        with self._lock:
+            return self._sync_locks.setdefault(name, threading.Lock())
+
+    def sync(self, name):
+        """Copies rows appended to sheet `name` since the last sync."""
+        with self._sync_lock(name):
+            changed = self._sync(name)
+        if changed:
+            self._notify(name)
+        return changed
+
+    def _sync(self, name):
+        """Returns True if rows were added or the table was rebuilt."""
+        self._stale.discard(name)
+        try:
+            ws = get_worksheet(name)
+        except gspread.WorksheetNotFound:
+            self._missing.add(name)
+            return False
+        self._missing.discard(name)
+
+        reader = get_tail_reader()
+        with self._lock:
+            header, offset, version = self._meta(name)
+        if header is not None and reader.position(name) is None:
+            reader.seed(name, header, offset)    # resume the persisted copy
+        reset, new_header, rows = reader.read(name, ws)
+        if new_header is None:
+            return False                         # empty sheet
+
+        with self._lock:
+            if reset:
+                self._create_table(name, new_header)
+                self._generations[name] = self._generations.get(name, 0) + 1
+                offset = 0
+            elif not rows:
+                return False
+            if rows:
+                self._insert(name, new_header, offset + 2, rows)
+            self._set_meta(name, new_header, offset + len(rows), version + 1)
+            self._conn.commit()
+        return True
+
+    def sync_all(self):
+        for name in self.sheets:
+            try:
+                self.sync(name)
+            except Exception:
+                self._stale.add(name)   # retry on next read / pass
+
+    def _run(self):
+        while True:
+            self.sync_all()
+            time.sleep(self.interval)
+
+    # ── reads ─────────────────────────────────────────────────────────────────
+
+    def ensure_fresh(self, name):
+        if name not in self.sheets:          # first read of an extra sheet
+            self.sheets.append(name)
+            self._stale.add(name)
+        # Holding the sheet's sync lock also waits out a background sync
+        # that is mid-way through copying rows for this sheet.
+        changed = False
+        with self._sync_lock(name):
+            with self._lock:
+                never_synced = self._meta(name)[0] is None
+            if name in self._stale or (never_synced and name not in self._missing):
+                changed = self._sync(name)
+        if changed:
+            self._notify(name)
+        if name in self._missing:
+            raise gspread.WorksheetNotFound(name)
+
+    def frame(self, name):
+        """Whole sheet as a DataFrame (header columns, sheet row order)."""
+        return self.read_rows(name)[0]
+
+    def read_rows(self, name, cursor=None):
+        """
+        Returns (frame, cursor, incremental).
+
+        Pass the cursor of an earlier read to get only the rows added since
+        (incremental=True); if the table was rebuilt in between, or no
+        cursor is given, every row is returned (incremental=False).
+        """
+        self.ensure_fresh(name)
+        with self._lock:
+            header = self._meta(name)[0]
+            generation = self.generation(name)
+            if header is None:
+                return pd.DataFrame(), None, False
+            incremental = cursor is not None and cursor[0] == generation
+            after = cursor[1] if incremental else 0
+            df = pd.read_sql_query(
+                f"SELECT * FROM {_quote(name)} WHERE _row > ? ORDER BY _row",
+                self._conn, params=(after,),
+            )
+        last_row = int(df["_row"].iloc[-1]) if len(df) else after
+        return df.drop(columns=["_row"]), (generation, last_row), incremental
+
+    def query(self, sql, params=(), sheets=()):
+        """Runs SQL against the replica after refreshing any stale `sheets`."""
+        for name in sheets:
+            self.ensure_fresh(name)
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+
+@st.cache_resource(show_spinner=False)
+def get_replica():
+    """Process-wide SQLite replica; starts its background sync thread."""
+    return SheetReplica()
+
+
+def _load_sheet_frame(name, previous=None):
+    """
+    Loader for the snapshot cache: returns (frame, cursor). Given the
+    previous (frame, cursor) of an append-only sheet, only the rows added
+    since are read from the replica and appended to it.
+    """
     try:
-        sh = get_spreadsheet()
-        df = pd.DataFrame(sh.worksheet("Participants").get_all_records())
-        df["User_ID"] = df["User_ID"].astype(str).str.upper().str.strip()
-        user_id = str(user_id).upper().strip()
-        match = df[df["User_ID"] == user_id]
-        return match.iloc[0].to_dict() if not match.empty else None
-    except:
-        return None
+        if previous is not None and previous[1] is not None \
+                and name in APPEND_ONLY_SHEETS:
+            old_df, cursor = previous
+            new_df, cursor, incremental = get_replica().read_rows(name, cursor)
+            if incremental:
+                if new_df.empty:
+                    return old_df, cursor
+                return pd.concat([old_df, new_df], ignore_index=True), cursor
+            return new_df, cursor
+        df, cursor, _ = get_replica().read_rows(name)
+        return df, cursor
+    except gspread.WorksheetNotFound:
+        raise
+    except Exception:
+        return pd.DataFrame(get_worksheet(name).get_all_records()), None
 
-# ── 3. Google Drive integration (UNCHANGED) ────────────────────────────────────
 
-def upload_to_drive(uploaded_file):
+def read_sheet(name):
+    """
+    Returns worksheet `name` as a DataFrame.
+
+    Served from the process-wide snapshot cache (section 1d), which loads
+    from the local replica on a miss. Raises gspread.WorksheetNotFound if
+    the sheet does not exist. Falls back to a direct get_all_records() if
+    the replica is unavailable. Callers receive their own copy.
+    """
+    return get_storage().read_table(name)
+
+
+def query_replica(sql, params=(), sheets=()):
+    """Indexed SQL over the replica. `sheets` lists tables the query reads."""
+    return get_storage().query(sql, params, sheets)
+
+
+def _note_write(sheet_name):
+    """
+    Called after this process appends to a sheet: bumps its snapshot
+    version and marks the replica stale so the next read re-syncs it.
+    """
     try:
+        get_replica().mark_stale(sheet_name)
+        get_snapshot_cache().invalidate(sheet_name)
+    except Exception:
+        pass
+
+# ── 1d. Worksheet snapshot cache (NEW) ─────────────────────────────────────────
+#
+# PERFORMANCE FIX:
+# Only the client and spreadsheet handle were cached; sheet contents were
+# re-read per user, per page, per rerun. Now one parsed DataFrame per sheet is
+# shared by every session. An entry is valid while its data version —
+# (local write counter, replica version) — is unchanged and it is younger than
+# SNAPSHOT_TTL seconds. Writes via _note_write() bump the local counter.
+
+SNAPSHOT_TTL = float(os.environ.get("MMALE_SNAPSHOT_TTL", 60))   # seconds
+
+
+class SnapshotCache:
+    """Process-wide {worksheet: (data version, loaded_at, DataFrame, cursor)} cache."""
+
+    def __init__(self, ttl=SNAPSHOT_TTL):
+        self.ttl       = ttl
+        self._entries  = {}
+        self._writes   = {}     # sheet -> local write counter
+        self._lock     = threading.Lock()
+        self.stats     = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def data_version(self, name):
+        try:
+            replica_version = get_replica().version(name)
+        except Exception:
+            replica_version = None
+        return (self._writes.get(name, 0), replica_version)
+
+    def invalidate(self, name):
+        # The stale entry is kept (its version no longer matches) so the
+        # loader can extend it rather than rebuild it.
+        with self._lock:
+            self._writes[name] = self._writes.get(name, 0) + 1
+            self.stats["invalidations"] += 1
+
+    def get(self, name, loader):
+        """
+        Returns the cached frame for `name`. On a miss calls
+        loader(name, previous) -> (frame, cursor), where previous is the
+        stale entry's (frame, cursor) or None.
+        """
+        version = self.data_version(name)
+        writes  = version[0]
+        with self._lock:
+            entry = self._entries.get(name)
+            if (entry and entry[0] == version
+                    and time.monotonic() - entry[1] < self.ttl):
+                self.stats["hits"] += 1
+                return entry[2]
+            self.stats["misses"] += 1
+        df, cursor = loader(name, (entry[2], entry[3]) if entry else None)
+        # Replica version after loading (the load may have synced new rows);
+        # write counter from before, so a write during loading forces a miss.
+        with self._lock:
+            version = (writes, self.data_version(name)[1])
+            self._entries[name] = (version, time.monotonic(), df, cursor)
+        return df
+
+
+@st.cache_resource(show_spinner=False)
+def get_snapshot_cache():
+    """Process-wide worksheet snapshot cache shared by all sessions."""
+    return SnapshotCache()
+
+# ── 1e. Participant directory (NEW) ────────────────────────────────────────────
+#
+# PERFORMANCE FIX:
+# Original: check_login downloaded and pandas-filtered the whole Participants
+# sheet on every attempt — 40+ full reads as a class logs in.
+# Fix: {normalised User_ID: participant row} built once from the replica.
+# The replica's background sync notifies the directory when Participants
+# gains rows, and only those rows are indexed. Group aliases are resolved
+# once here (Group_Code) instead of on every page render.
+
+PARTICIPANT_MISS_REFRESH = 30   # seconds between on-demand syncs after a miss
+
+
+def _normalise_uid(user_id):
+    return str(user_id).upper().strip()
+
+
+class ParticipantDirectory:
+    """Hash index over the Participants sheet (via the local replica)."""
+
+    def __init__(self):
+        self._by_id     = {}
+        self._last_row  = 0        # highest replica _row already indexed
+        self._generation = None    # replica generation the index was built from
+        self._lock      = threading.Lock()
+        self._last_miss_sync = 0.0
+        replica = get_replica()
+        replica.subscribe("Participants", self.refresh)
+        replica.ensure_fresh("Participants")   # first load
+        self.refresh()
+
+    def refresh(self):
+        """Indexes Participants rows added since the last refresh."""
+        from config import normalise_group
+        with self._lock:
+            generation = get_replica().generation("Participants")
+            if generation != self._generation:   # sheet rebuilt — start over
+                self._by_id, self._last_row = {}, 0
+                self._generation = generation
+            try:
+                new_rows = get_replica().query(
+                    "SELECT * FROM Participants WHERE _row > ? ORDER BY _row",
+                    (self._last_row,),
+                )
+            except Exception:
+                return   # sheet not replicated yet
+            for record in new_rows.to_dict("records"):
+                self._last_row = max(self._last_row, int(record.pop("_row")))
+                record["User_ID"]    = _normalise_uid(record.get("User_ID"))
+                record["Group_Code"] = normalise_group(record.get("Group", "CON"))
+                self._by_id.setdefault(record["User_ID"], record)
+
+    def lookup(self, user_id):
+        """Returns a copy of the participant row, or None."""
+        record = self._by_id.get(_normalise_uid(user_id))
+        if record is None and (
+            time.monotonic() - self._last_miss_sync > PARTICIPANT_MISS_REFRESH
+        ):
+            # Unknown ID — maybe added since the last background sync
+            self._last_miss_sync = time.monotonic()
+            get_replica().sync("Participants")
+            record = self._by_id.get(_normalise_uid(user_id))
+        return dict(record) if record else None
+
+    def __len__(self):
+        return len(self._by_id)
+
+
+@st.cache_resource(show_spinner=False)
+def get_participant_directory():
+    """Process-wide participant index, loaded once per process."""
+    return ParticipantDirectory()
+
+# ── 1f. Answer-key index (NEW) ─────────────────────────────────────────────────
+#
+# PERFORMANCE FIX:
+# Original: every INITIAL/POST log_assessment re-read all of
+# Instructional_Materials to find one Correct_Answer, and the gap analysis
+# rebuilt the same map. Now one index holds Sub_Title → Correct_Answer. It is
+# refreshed incrementally from the replica and save_bulk_concepts adds the
+# new module in place; `version` increments on every change.
+
+class AnswerKeyIndex:
+    """Shared Instructional_Materials index (via the local replica)."""
+
+    def __init__(self):
+        self.version        = 0
+        self._by_sub_title  = {}    # str(Sub_Title) -> first module row
+        self._latest        = {}    # str(Sub_Title) -> last module row
+        self._last_row      = 0
+        self._generation    = None  # replica generation the index was built from
+        self._local_pending = []    # rows added in place, awaiting their sync
+        self._lock          = threading.Lock()
+        replica = get_replica()
+        replica.subscribe("Instructional_Materials", self.refresh)
+        replica.ensure_fresh("Instructional_Materials")
+        self.refresh()
+
+    def _add(self, record):
+        key = str(record.get("Sub_Title", ""))
+        self._by_sub_title.setdefault(key, record)
+        self._latest[key] = record
+        self.version += 1
+
+    @staticmethod
+    def _same_row(a, b):
+        return {k: str(v) for k, v in a.items()} == {k: str(v) for k, v in b.items()}
+
+    def refresh(self):
+        """Indexes module rows synced since the last refresh."""
+        with self._lock:
+            generation = get_replica().generation("Instructional_Materials")
+            if generation != self._generation:   # sheet rebuilt — start over
+                if self._generation is not None:
+                    self.version += 1
+                self._by_sub_title, self._latest = {}, {}
+                self._last_row, self._local_pending = 0, []
+                self._generation = generation
+            try:
+                new_rows = get_replica().query(
+                    "SELECT * FROM Instructional_Materials WHERE _row > ? "
+                    "ORDER BY _row",
+                    (self._last_row,),
+                )
+            except Exception:
+                return
+            for record in new_rows.to_dict("records"):
+                self._last_row = max(self._last_row, int(record.pop("_row")))
+                # Skip the synced copy of a row already added in place
+                match = next((p for p in self._local_pending
+                              if self._same_row(p, record)), None)
+                if match is not None:
+                    self._local_pending.remove(match)
+                    continue
+                self._add(record)
+
+    def add_module(self, row_values):
+        """In-place update after save_bulk_concepts appends `row_values`."""
+        header = get_replica().header("Instructional_Materials")
+        if not header:
+            return   # not indexed yet; the next sync picks the row up
+        record = dict(zip(_column_names(header), row_values))
+        with self._lock:
+            self._local_pending.append(record)
+            self._add(record)
+
+    def correct_answer(self, sub_title):
+        """Correct_Answer for a module, or None if the module is unknown."""
+        record = self._by_sub_title.get(str(sub_title))
+        return None if record is None else record.get("Correct_Answer")
+
+    def answer_map(self, last_wins=False):
+        """
+        {Sub_Title: Correct_Answer} as strings. First module row wins, like
+        correct_answer(); last_wins=True uses the latest row per Sub_Title.
+        """
+        rows = self._latest if last_wins else self._by_sub_title
+        return {k: str(v.get("Correct_Answer", "")) for k, v in rows.items()}
+
+
+@st.cache_resource(show_spinner=False)
+def get_answer_key_index():
+    """Process-wide answer-key index."""
+    return AnswerKeyIndex()
+
+# ── 1g. Storage backend selection (NEW) ────────────────────────────────────────
+#
+# Every public function below goes through get_storage(). SheetsBackend wraps
+# sections 1a–1f; config.STORAGE_BACKEND = "sqlite" or "memory" swaps in a
+# local store from storage_backends.py so all portals run unchanged offline
+# (load tests, benchmarks) or on a local database as the study grows.
+
+class SheetsBackend(StorageBackend):
+    """Google Sheets storage via the registry, write-behind, replica and caches."""
+
+    name = "sheets"
+
+    def append_event(self, table, row, deferred=False):
+        if deferred:
+            get_event_logger().enqueue(table, row)
+            return
+        get_worksheet(table).append_row(row)
+        _note_write(table)
+        if table == "Instructional_Materials":
+            get_answer_key_index().add_module(row)
+
+    def read_table(self, table):
+        return get_snapshot_cache().get(table, _load_sheet_frame).copy()
+
+    def query(self, sql, params=(), tables=()):
+        return get_replica().query(sql, params, tables)
+
+    def lookup_participant(self, user_id):
+        return get_participant_directory().lookup(user_id)
+
+    def answer_key(self, sub_title):
+        return get_answer_key_index().correct_answer(sub_title)
+
+    def answer_map(self, last_wins=False):
+        return get_answer_key_index().answer_map(last_wins)
+
+    def upload_file(self, uploaded_file):
         creds = get_creds()
         service = build("drive", "v3", credentials=creds)
         file_metadata = {
@@ -116,6 +1362,53 @@ def upload_to_drive(uploaded_file):
             body=file_metadata, media_body=media, fields="id, webViewLink"
         ).execute()
         return file.get("webViewLink")
+
+    def tables(self):
+        registry = get_worksheet_registry()
+        return registry.titles() if registry else []
+
+    def flush(self, table=None):
+        return get_event_logger().flush(table)
+
+    def pending(self):
+        return get_event_logger().pending()
+
+    def pending_rows(self, table):
+        return get_event_logger().queued(table)
+
+
+@st.cache_resource(show_spinner=False)
+def get_storage():
+    """Process-wide storage backend selected by config.STORAGE_BACKEND."""
+    from config import STORAGE_BACKEND, STORAGE_SQLITE_PATH
+    if STORAGE_BACKEND == "sheets":
+        return SheetsBackend()
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteBackend(STORAGE_SQLITE_PATH)
+    if STORAGE_BACKEND == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND!r}")
+
+# ── 2. Core login (INDEXED) ────────────────────────────────────────────────────
+
+def check_login(user_id):
+    """Participant lookup (a dictionary lookup on the Sheets backend)."""
+    from config import normalise_group
+    try:
+        record = get_storage().lookup_participant(user_id)
+        if record is None:
+            return None
+        record["User_ID"]    = _normalise_uid(record.get("User_ID"))
+        record["Group_Code"] = normalise_group(record.get("Group", "CON"))
+        return record
+    except:
+        return None
+
+# ── 3. File upload (Google Drive on the Sheets backend) ────────────────────────
+
+def upload_to_drive(uploaded_file):
+    try:
+        return get_storage().upload_file(uploaded_file)
     except Exception as e:
         st.error(f"Drive Error: {e}")
         return None
@@ -134,21 +1427,15 @@ def log_assessment(uid, group, module_id, t1, t2, t3, t4, status,
     an IndexError on values[0].
     """
     try:
-        sh = get_spreadsheet()
-        ws = sh.worksheet("Assessment_Logs")
-
         # Determine result — skip answer check for agent-completion events
         if status in AGENT_COMPLETION_STATUSES:
             result = "N/A"
         else:
             try:
-                m_ws = sh.worksheet("Instructional_Materials")
-                m_df = pd.DataFrame(m_ws.get_all_records())
-                matches = m_df[m_df["Sub_Title"] == module_id]["Correct_Answer"].values
-                if len(matches) == 0:
+                correct_ans = get_storage().answer_key(module_id)
+                if correct_ans is None:
                     result = "N/A"
                 else:
-                    correct_ans = matches[0]
                     check_val   = t5 if status == "POST" else t1
                     result      = (
                         "Correct"
@@ -168,26 +1455,34 @@ def log_assessment(uid, group, module_id, t1, t2, t3, t4, status,
             result,
             t5, t6,
         ]
-        ws.append_row(row)
+        get_storage().append_event("Assessment_Logs", row)
+        learner = get_learner_state(uid)
+        if learner is not None:
+            learner.record_assessment(
+                dict(zip(TABLE_SCHEMAS["Assessment_Logs"], row)))
         return True
 
     except Exception as e:
         st.error(f"Logging Error: {e}")
         return False
 
-# ── 5. Temporal trace logging (UNCHANGED) ─────────────────────────────────────
+# ── 5. Temporal trace logging (WRITE-BEHIND) ──────────────────────────────────
 
 def log_temporal_trace(uid, event, details):
-    """Stores every interaction for micro-genetic / epistemic move analysis."""
+    """
+    Stores every interaction for micro-genetic / epistemic move analysis.
+    Queued on the write-behind logger; flushed in batches (section 1b).
+    """
     try:
-        sh = get_spreadsheet()
-        ws = sh.worksheet("Temporal_Traces")
-        ws.append_row([
+        get_storage().append_event("Temporal_Traces", [
             get_nepal_time(),
             str(uid).upper(),
             event,
             details,
-        ])
+        ], deferred=True)
+        learner = get_learner_state(uid)
+        if learner is not None:
+            learner.record_event(event, details)
     except:
         pass
 
@@ -212,21 +1507,12 @@ def log_tap_event(uid, group, module_id, tap_level, turn_number,
         turn_number : Integer turn count within this Tarka session
         student_msg : Raw student message this turn
         agent_msg   : Raw Tarka AI response this turn
+
+    The row is a deferred append: on the Sheets backend it is queued on
+    the write-behind logger and written in a batch.
     """
     try:
-        sh = get_spreadsheet()
-
-        # Create ArgLog sheet if it does not exist
-        try:
-            ws = sh.worksheet("ArgLog")
-        except gspread.WorksheetNotFound:
-            ws = sh.add_worksheet(title="ArgLog", rows=2000, cols=8)
-            ws.append_row([
-                "Timestamp", "User_ID", "Group", "Module_ID",
-                "TAP_Level", "Turn_Number", "Student_Msg", "Agent_Msg",
-            ])
-
-        ws.append_row([
+        get_storage().append_event("ArgLog", [
             get_nepal_time(),
             str(uid).upper(),
             group,
@@ -235,7 +1521,10 @@ def log_tap_event(uid, group, module_id, tap_level, turn_number,
             turn_number,
             student_msg[:500],   # truncate for sheet cell limit
             agent_msg[:500],
-        ])
+        ], deferred=True)
+        learner = get_learner_state(uid)
+        if learner is not None:
+            learner.record_level(tap=tap_level)
         return True
     except Exception as e:
         st.error(f"TAP Log Error: {e}")
@@ -262,21 +1551,11 @@ def log_rep_event(uid, group, module_id, rep_level, turn_number,
         turn_number : Integer turn count within this Rupak session
         student_msg : Raw student message this turn
         agent_msg   : Raw Rupak AI response this turn
+
+    Queued on the write-behind logger like log_tap_event.
     """
     try:
-        sh = get_spreadsheet()
-
-        # Create RepLog sheet if it does not exist
-        try:
-            ws = sh.worksheet("RepLog")
-        except gspread.WorksheetNotFound:
-            ws = sh.add_worksheet(title="RepLog", rows=2000, cols=8)
-            ws.append_row([
-                "Timestamp", "User_ID", "Group", "Module_ID",
-                "Rep_Level", "Turn_Number", "Student_Msg", "Agent_Msg",
-            ])
-
-        ws.append_row([
+        get_storage().append_event("RepLog", [
             get_nepal_time(),
             str(uid).upper(),
             group,
@@ -285,7 +1564,10 @@ def log_rep_event(uid, group, module_id, rep_level, turn_number,
             turn_number,
             student_msg[:500],
             agent_msg[:500],
-        ])
+        ], deferred=True)
+        learner = get_learner_state(uid)
+        if learner is not None:
+            learner.record_level(rep=rep_level)
         return True
     except Exception as e:
         st.error(f"Rep Log Error: {e}")
@@ -319,29 +1601,29 @@ def fetch_performance_learning_gap(uid=None):
 
     Returns:
         pd.DataFrame or empty DataFrame on error.
+
+    Reads only INITIAL/POST rows (and one student's rows when uid is set)
+    from the local replica via the Status / User_ID indexes.
     """
     conf_map = {"Guessing": 1, "Unsure": 2, "Sure": 3, "Very Sure": 4}
 
     try:
-        sh = get_spreadsheet()
-        log_df  = pd.DataFrame(sh.worksheet("Assessment_Logs").get_all_records())
+        sql    = ("SELECT * FROM Assessment_Logs "
+                  "WHERE Status IN ('INITIAL', 'POST')")
+        params = ()
+        if uid:
+            sql   += " AND upper(User_ID) = ?"
+            params = (uid.upper(),)
+        log_df = query_replica(sql + " ORDER BY _row", params,
+                               sheets=["Assessment_Logs"])
 
         if log_df.empty:
             return pd.DataFrame()
 
-        if uid:
-            log_df = log_df[
-                log_df["User_ID"].astype(str).str.upper() == uid.upper()
-            ]
-
-        # Load correct answers for automated marking
-        m_df = pd.DataFrame(
-            sh.worksheet("Instructional_Materials").get_all_records()
-        )
-        correct_map = dict(zip(
-            m_df["Sub_Title"].astype(str),
-            m_df["Correct_Answer"].astype(str),
-        ))
+        # Correct answers for automated marking (shared answer-key index).
+        # A re-uploaded Sub_Title is scored against its latest row, as the
+        # original dict(zip(...)) over the whole sheet did.
+        correct_map = get_storage().answer_map(last_wins=True)
 
         records = []
         grouped = log_df.groupby(["User_ID", "Module_ID"])
@@ -405,6 +1687,8 @@ def fetch_agent_interaction_summary():
       rep_distribution (dict): {MONADIC: n, BIADIC: n, TRIADIC: n}
       mean_tap_turns   (float): avg turns to reach TAP_3+
       mean_rep_turns   (float): avg turns to reach TRIADIC
+
+    All counts are aggregate SQL over the local replica — no sheet download.
     """
     summary = {
         "saathi_sessions":  0,
@@ -418,59 +1702,40 @@ def fetch_agent_interaction_summary():
     }
 
     try:
-        sh = get_spreadsheet()
-        log_df = pd.DataFrame(sh.worksheet("Assessment_Logs").get_all_records())
-
-        if log_df.empty:
+        counts = query_replica(
+            "SELECT "
+            "COUNT(*) AS n_rows, "
+            "COUNT(DISTINCT CASE WHEN Status = 'POST' THEN User_ID END) AS saathi, "
+            "COUNT(DISTINCT CASE WHEN substr(Status, 1, 12) = 'TAP_COMPLETE' "
+            "      THEN User_ID END) AS tarka, "
+            "COUNT(DISTINCT CASE WHEN Status = 'TRIADIC_COMPLETE' "
+            "      THEN User_ID END) AS rupak "
+            "FROM Assessment_Logs",
+            sheets=["Assessment_Logs"],
+        ).iloc[0]
+
+        if not counts["n_rows"]:
             return summary
 
-        summary["saathi_sessions"] = len(
-            log_df[log_df["Status"] == "POST"]["User_ID"].unique()
-        )
-        tap_statuses = log_df["Status"].astype(str)
-        summary["tarka_sessions"] = len(
-            log_df[
-                tap_statuses.str.startswith("TAP_COMPLETE")
-            ]["User_ID"].unique()
-        )
-        summary["rupak_sessions"] = len(
-            log_df[
-                log_df["Status"] == "TRIADIC_COMPLETE"
-            ]["User_ID"].unique()
-        )
+        summary["saathi_sessions"] = int(counts["saathi"])
+        summary["tarka_sessions"]  = int(counts["tarka"])
+        summary["rupak_sessions"]  = int(counts["rupak"])
 
         # TAP level distribution from ArgLog
         try:
-            arg_df = pd.DataFrame(sh.worksheet("ArgLog").get_all_records())
-            if not arg_df.empty:
-                for level in ["TAP_1", "TAP_2", "TAP_3", "TAP_4", "TAP_5"]:
-                    summary["tap_distribution"][level] = int(
-                        (arg_df["TAP_Level"] == level).sum()
-                    )
-                # Mean turns to TAP_3+
-                high_tap = arg_df[
-                    arg_df["TAP_Level"].isin(["TAP_3", "TAP_4", "TAP_5"])
-                ]
-                if not high_tap.empty:
-                    summary["mean_tap_turns"] = round(
-                        high_tap.groupby("User_ID")["Turn_Number"].min().mean(), 1
-                    )
+            _fill_level_summary(
+                summary, "ArgLog", "TAP_Level", "tap_distribution",
+                "mean_tap_turns", ["TAP_3", "TAP_4", "TAP_5"],
+            )
         except Exception:
             pass
 
         # Representational level distribution from RepLog
         try:
-            rep_df = pd.DataFrame(sh.worksheet("RepLog").get_all_records())
-            if not rep_df.empty:
-                for level in ["MONADIC", "BIADIC", "TRIADIC"]:
-                    summary["rep_distribution"][level] = int(
-                        (rep_df["Rep_Level"] == level).sum()
-                    )
-                triadic_rows = rep_df[rep_df["Rep_Level"] == "TRIADIC"]
-                if not triadic_rows.empty:
-                    summary["mean_rep_turns"] = round(
-                        triadic_rows.groupby("User_ID")["Turn_Number"].min().mean(), 1
-                    )
+            _fill_level_summary(
+                summary, "RepLog", "Rep_Level", "rep_distribution",
+                "mean_rep_turns", ["TRIADIC"],
+            )
         except Exception:
             pass
 
@@ -480,55 +1745,134 @@ def fetch_agent_interaction_summary():
         st.error(f"Summary Error: {e}")
         return summary
 
-# ── 10. Chat history fetch (UNCHANGED) ────────────────────────────────────────
+def _fill_level_summary(summary, sheet, level_col, dist_key, mean_key,
+                        target_levels):
+    """Level frequencies + mean first turn reaching `target_levels`, in SQL."""
+    levels = query_replica(
+        f"SELECT {_quote(level_col)} AS level, COUNT(*) AS n "
+        f"FROM {_quote(sheet)} GROUP BY {_quote(level_col)}",
+        sheets=[sheet],
+    )
+    for level, n in zip(levels["level"], levels["n"]):
+        if level in summary[dist_key]:
+            summary[dist_key][level] = int(n)
+
+    marks = ", ".join("?" * len(target_levels))
+    mean_turns = query_replica(
+        f"SELECT AVG(first_turn) AS mean_turns FROM ("
+        f"  SELECT MIN(Turn_Number) AS first_turn FROM {_quote(sheet)} "
+        f"  WHERE {_quote(level_col)} IN ({marks}) GROUP BY User_ID)",
+        tuple(target_levels),
+    )["mean_turns"].iloc[0]
+    if pd.notna(mean_turns):
+        summary[mean_key] = round(float(mean_turns), 1)
+
+# ── 10. Conversation store (INDEXED) ──────────────────────────────────────────
+#
+# PERFORMANCE FIX:
+# Original: fetch_chat_history loaded all of Temporal_Traces, ran
+# str.contains(module_id) over every Details string, iterated with iterrows
+# and restored only the student side. Now every chat turn is also written
+# (both roles, in order) to the Conversations sheet and restoring a session
+# is one indexed (User_ID, Module_ID, Agent) query on the local replica plus
+# any of that student's rows still queued for write-behind.
+
+CONVERSATION_CONTENT_LIMIT = 45000   # stay under the 50k-char cell limit
 
-def fetch_chat_history(uid, module_id):
-    """Enables Socratic continuity by reloading previous messages on app reload."""
+
+def log_conversation_turn(uid, module_id, agent_key, turn, role, content,
+                          prompt_hash=""):
+    """
+    Queues one chat message (user or assistant) for the Conversations sheet.
+    prompt_hash identifies the agent system prompt in use (result["prompt_hash"]).
+    """
     try:
-        sh = get_spreadsheet()
-        df = pd.DataFrame(sh.worksheet("Temporal_Traces").get_all_records())
-        if df.empty:
-            return []
-        mask = (
-            (df["User_ID"].astype(str).str.upper() == uid.upper()) &
-            (df["Event"] == "CHAT_MSG") &
-            (df["Details"].str.contains(module_id, na=False))
-        )
-        filtered = df[mask]
-        history  = []
-        for _, row in filtered.iterrows():
-            content = (
-                row["Details"].split("| Content: ")[-1]
-                if "| Content: " in row["Details"]
-                else row["Details"]
-            )
-            history.append({"role": "user", "content": content})
-        return history
+        get_storage().append_event("Conversations", [
+            get_nepal_time(),
+            str(uid).upper(),
+            module_id,
+            agent_key,
+            turn,
+            role,
+            str(content)[:CONVERSATION_CONTENT_LIMIT],
+            prompt_hash,
+        ], deferred=True)
     except:
-        return []
+        pass
+
+
+def fetch_chat_history(uid, module_id, agent_key=None, since=None):
+    """
+    Enables Socratic continuity by reloading previous messages on app reload.
+
+    Returns [{"role": ..., "content": ...}, ...] in the order they were
+    logged, for one agent or (agent_key=None) every agent in the module.
+    `since` (a get_nepal_time() string) skips turns logged before it, e.g.
+    by an earlier attempt at the module. Images are not logged: a Rupak
+    image turn comes back as its text plus an "[image]" marker.
+    """
+    uid = str(uid).upper()
+    sql = ("SELECT Role, Content FROM Conversations "
+           "WHERE upper(User_ID) = ? AND Module_ID = ?")
+    params = [uid, module_id]
+    if agent_key:
+        sql += " AND Agent = ?"
+        params.append(agent_key)
+    if since:
+        sql += " AND Timestamp >= ?"
+        params.append(since)
+    try:
+        rows = query_replica(sql + " ORDER BY _row", params,
+                             sheets=["Conversations"])
+        history = [
+            {"role": str(role), "content": str(content)}
+            for role, content in zip(rows["Role"], rows["Content"])
+        ]
+    except Exception:
+        history = []
+
+    # Rows not yet flushed to Sheets are newer than anything in the replica
+    for row in get_storage().pending_rows("Conversations"):
+        row_uid, row_module, row_agent, role, content = (
+            row[1], row[2], row[3], row[5], row[6]
+        )
+        if (row_uid == uid and row_module == module_id
+                and (not agent_key or row_agent == agent_key)
+                and (not since or str(row[0]) >= since)):
+            history.append({"role": role, "content": content})
+    return history
+
+
+def fetch_attempt_history(uid, module_id, agent_key):
+    """
+    fetch_chat_history() limited to the current attempt at `module_id`: turns
+    since the module was (re)started in this session, or, after a reload
+    without a checkpoint, since its latest INITIAL diagnostic.
+    """
+    since = st.session_state.get("module_started_at")
+    if not since:
+        learner = get_learner_state(uid)
+        since = learner.attempt_started(module_id) if learner else None
+    return fetch_chat_history(uid, module_id, agent_key, since=since)
 
 # ── 11. Teacher tools (UNCHANGED) ─────────────────────────────────────────────
 
 def save_bulk_concepts(teacher_id, group, main_title, data):
     try:
-        sh = get_spreadsheet()
-        ws = sh.worksheet("Instructional_Materials")
         row = [
             datetime.now().strftime("%Y-%m-%d"), teacher_id, group, main_title,
             data["sub_title"], data["objectives"], data["file_link"],
             data["video_link"], data["q_text"], data["oa"], data["ob"],
             data["oc"], data["od"], data["correct"], data["socratic_tree"],
         ]
-        ws.append_row(row)
+        get_storage().append_event("Instructional_Materials", row)
         return True
     except:
         return False
 
 def save_assignment(teacher_id, group, title, desc, file_url):
     try:
-        sh = get_spreadsheet()
-        ws = sh.worksheet("Assignments")
-        ws.append_row([
+        get_storage().append_event("Assignments", [
             datetime.now().strftime("%Y-%m-%d"),
             teacher_id, group, title, desc, file_url,
         ])
@@ -564,20 +1908,8 @@ def log_open_response(uid: str, group: str, module_id: str,
         timestamp    : Nepal time string
     """
     try:
-        sh = get_spreadsheet()
-
-        try:
-            ws = sh.worksheet("OpenResponse")
-        except Exception:
-            ws = sh.add_worksheet(title="OpenResponse", rows=2000, cols=9)
-            ws.append_row([
-                "Timestamp", "User_ID", "Group", "Module_ID",
-                "Item_Num", "Phase", "Response_Text",
-                "Self_Rating", "Word_Count",
-            ])
-
         word_count = len(str(response_text).split())
-        ws.append_row([
+        get_storage().append_event("OpenResponse", [
             timestamp,
             str(uid).upper(),
             group,
@@ -613,20 +1945,7 @@ def log_reflection_survey(uid: str, group: str,
     open_comment            : free text reflection
     """
     try:
-        sh = get_spreadsheet()
-
-        try:
-            ws = sh.worksheet("ReflectionSurvey")
-        except Exception:
-            ws = sh.add_worksheet(title="ReflectionSurvey", rows=1000, cols=8)
-            ws.append_row([
-                "Timestamp", "User_ID", "Group",
-                "AI_Helped_Understanding_1to5",
-                "AI_Helped_Answering_1to5",
-                "Hardest_Agent", "Most_Useful_Agent", "Comment",
-            ])
-
-        ws.append_row([
+        get_storage().append_event("ReflectionSurvey", [
             timestamp,
             str(uid).upper(),
             group,
@@ -650,12 +1969,80 @@ def fetch_open_response_data(uid: str = None) -> "pd.DataFrame":
     """
     try:
         import pandas as pd
-        sh  = get_spreadsheet()
-        df  = pd.DataFrame(sh.worksheet("OpenResponse").get_all_records())
-        if df.empty:
-            return pd.DataFrame()
-        if uid:
-            df = df[df["User_ID"].astype(str).str.upper() == uid.upper()]
-        return df
+        if not uid:
+            return read_sheet("OpenResponse")
+        return query_replica(
+            "SELECT * FROM OpenResponse WHERE upper(User_ID) = ? ORDER BY _row",
+            (uid.upper(),), sheets=["OpenResponse"],
+        ).drop(columns=["_row"])
     except Exception:
         return __import__('pandas').DataFrame()
+
+
+# ── 12. Learner state (NEW) ───────────────────────────────────────────────────
+#
+# PERFORMANCE FIX:
+# Original: render_modules re-downloaded and filtered all of Assessment_Logs
+# on every rerun to find one student's finished modules, and agent
+# completion lived only in session state. Now the student's LearnerState
+# (learner_state.py) is built once at login from indexed per-student queries
+# and the log_* writers above keep it current.
+
+def load_learner_state(uid, group="", reload=False):
+    """
+    The student's LearnerState, built from storage on first use in this
+    process and shared by all of that student's sessions afterwards.
+    reload=True (at login) rebuilds it and replaces the registered state.
+    """
+    learner = None if reload else get_learner_state(uid)
+    if learner is None:
+        learner = register(LearnerState.load(uid, group, get_storage()),
+                           replace=reload)
+    return learner
+
+
+def forget_learner_state(uid):
+    """Drops the student's LearnerState from this process (logout)."""
+    forget(uid)
+
+
+def mark_agent_completed(uid, module_id, agent_key):
+    """
+    Marks an agent complete for the active module: in the student's
+    LearnerState and in st.session_state.agent_completed (a copy).
+    """
+    learner = get_learner_state(uid)
+    if learner is not None:
+        learner.mark_completed(module_id, agent_key)
+    completed = dict(st.session_state.get("agent_completed") or {})
+    completed[agent_key] = True
+    st.session_state.agent_completed = completed
+
+
+# ── 13. Session checkpoints (NEW) ─────────────────────────────────────────────
+#
+# PERFORMANCE FIX:
+# Original: a browser refresh lost the whole session and each agent
+# conversation was rebuilt separately by fetch_chat_history on the next visit.
+# Now the portals checkpoint the session after every turn (queued; a
+# background thread writes it to local SQLite) and login restores it in one
+# keyed read, so fetch_chat_history is only needed without a checkpoint.
+
+def checkpoint_session(uid):
+    """Queues a checkpoint of this student's session (written asynchronously)."""
+    try:
+        get_checkpoint_store().save(uid, snapshot_session(st.session_state))
+    except Exception:
+        pass
+
+
+def restore_session(uid):
+    """Restores the student's latest checkpoint into st.session_state."""
+    try:
+        snapshot = get_checkpoint_store().load(uid)
+    except Exception:
+        return False
+    if not snapshot:
+        return False
+    restore_snapshot(st.session_state, snapshot)
+    return True
@@ -0,0 +1,235 @@
+"""
+learner_state.py — MMALE Per-Student Learner State
+===================================================
+What one student has done so far, built once at login and kept current by
+the log writers in database_manager.
+
+Original: render_modules downloaded and pandas-filtered the whole
+Assessment_Logs sheet on every rerun to find this student's finished
+modules, the progress dashboard queried it again, and agent completion
+lived only in st.session_state.agent_completed (lost on reload). Now:
+
+  - LearnerState.load() reads this student's rows with the indexed
+    upper(User_ID) lookups (Assessment_Logs, ArgLog, RepLog and the
+    KHOJI/PRAMAN completion events in Temporal_Traces);
+  - log_assessment / log_tap_event / log_rep_event / log_temporal_trace
+    update the registered state incrementally (record_* methods);
+  - student pages read finished modules, per-agent completion, best
+    TAP / representational level and pending Tier 5-6 forms from it.
+    Reads return copies; completion changes go through mark_completed().
+
+One state per student per process (register / get_learner_state), shared
+by every session of that student. Each login rebuilds it and replaces the
+registered one, so rows written by another process, or edited in the sheet,
+are picked up the next time the student logs in. Logout drops the entry
+(forget), and at most LEARNER_STATE_CAPACITY states are kept, least recently
+used evicted first; an evicted student is simply reloaded on next use.
+
+This module has no Streamlit dependency.
+"""
+
+import threading
+from collections import OrderedDict
+
+from storage_backends import TABLE_SCHEMAS
+
+ASSESSMENT_COLUMNS = TABLE_SCHEMAS["Assessment_Logs"]
+# Header as written in the sheet (any case / spacing) -> schema column
+_ASSESSMENT_KEYS = {c.lower().replace(" ", "_"): c for c in ASSESSMENT_COLUMNS}
+
+LEARNER_STATE_CAPACITY = 500      # registered students kept per process
+
+TAP_ORDER = ["TAP_1", "TAP_2", "TAP_3", "TAP_4", "TAP_5"]
+REP_ORDER = ["MONADIC", "BIADIC", "TRIADIC"]
+
+# Assessment_Logs statuses that complete an agent for their module
+COMPLETION_STATUSES = {
+    "POST":             "SAATHI",     # Tier 5-6 revision after Saathi mastery
+    "TRIADIC_COMPLETE": "RUPAK",
+    "ECOLOGY_COMPLETE": "SANDESH",
+}
+# Temporal_Traces events that complete an agent (Details: "Topic:<module>|...")
+COMPLETION_EVENTS = {
+    "KHOJI_COMPLETE":  "KHOJI",
+    "PRAMAN_COMPLETE": "PRAMAN",
+}
+
+
+def _higher(current, new, order):
+    if new not in order:
+        return current
+    if current not in order or order.index(new) > order.index(current):
+        return new
+    return current
+
+
+def _assessment_row(row):
+    """`row` keyed by the Assessment_Logs schema columns (others dropped)."""
+    values = {}
+    for key, value in row.items():
+        column = _ASSESSMENT_KEYS.get(str(key).strip().lower().replace(" ", "_"))
+        if column and column not in values:
+            values[column] = value
+    return {column: values.get(column, "") for column in ASSESSMENT_COLUMNS}
+
+
+def _event_topic(details):
+    for part in str(details).split("|"):
+        if part.startswith("Topic:"):
+            return part[len("Topic:"):].strip()
+    return ""
+
+
+class LearnerState:
+    """Finished modules, agent completion and best levels of one student."""
+
+    def __init__(self, uid, group=""):
+        self.uid         = str(uid).upper().strip()
+        self.group       = group
+        self.assessments = []        # this student's Assessment_Logs rows (schema keys)
+        self.started     = []        # modules with an INITIAL row, in order
+        self.finished    = set()     # modules with a POST row
+        self.completed   = {}        # module -> {agent: True}
+        self.best_tap    = None
+        self.best_rep    = None
+        self._lock       = threading.RLock()
+
+    # ── Loading ────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def load(cls, uid, group, storage):
+        """Builds the state from `storage` (a storage_backends.StorageBackend)."""
+        state  = cls(uid, group)
+        params = (state.uid,)
+
+        def rows(sql, table):
+            try:
+                df = storage.query(sql, params, tables=[table])
+            except Exception:
+                return []                # table missing or unreadable
+            return df.drop(columns=["_row"], errors="ignore").to_dict("records")
+
+        for row in rows("SELECT * FROM Assessment_Logs "
+                        "WHERE upper(User_ID) = ? ORDER BY _row", "Assessment_Logs"):
+            state.record_assessment(row)
+        for row in rows("SELECT TAP_Level FROM ArgLog "
+                        "WHERE upper(User_ID) = ?", "ArgLog"):
+            state.record_level(tap=row["TAP_Level"])
+        for row in rows("SELECT Rep_Level FROM RepLog "
+                        "WHERE upper(User_ID) = ?", "RepLog"):
+            state.record_level(rep=row["Rep_Level"])
+        for row in rows("SELECT Event, Details FROM Temporal_Traces "
+                        "WHERE upper(User_ID) = ? AND Event IN ("
+                        + ", ".join(f"'{e}'" for e in COMPLETION_EVENTS) + ")",
+                        "Temporal_Traces"):
+            state.record_event(row["Event"], row["Details"])
+        return state
+
+    # ── Incremental updates (called by the log writers) ─────────────────────────
+
+    def record_assessment(self, row: dict):
+        """One Assessment_Logs row (header → value) written for this student."""
+        row    = _assessment_row(row)
+        module = str(row["Module_ID"]).strip()
+        status = str(row["Status"]).strip()
+        with self._lock:
+            self.assessments.append(row)
+            if status == "INITIAL" and module not in self.started:
+                self.started.append(module)
+            elif status == "POST":
+                self.finished.add(module)
+            if status.startswith("TAP_COMPLETE"):
+                self.completed.setdefault(module, {})["TARKA"] = True
+                self.best_tap = _higher(self.best_tap,
+                                        status[len("TAP_COMPLETE_"):], TAP_ORDER)
+            elif status in COMPLETION_STATUSES:
+                self.completed.setdefault(module, {})[COMPLETION_STATUSES[status]] = True
+            if status == "TRIADIC_COMPLETE":
+                self.best_rep = _higher(self.best_rep, "TRIADIC", REP_ORDER)
+
+    def record_event(self, event, details):
+        agent = COMPLETION_EVENTS.get(str(event))
+        if agent:
+            with self._lock:
+                self.completed.setdefault(_event_topic(details), {})[agent] = True
+
+    def record_level(self, tap=None, rep=None):
+        with self._lock:
+            self.best_tap = _higher(self.best_tap, str(tap), TAP_ORDER)
+            self.best_rep = _higher(self.best_rep, str(rep), REP_ORDER)
+
+    def mark_completed(self, module_id, agent_key):
+        """Marks `agent_key` complete for `module_id`."""
+        with self._lock:
+            self.completed.setdefault(str(module_id).strip(), {})[agent_key] = True
+
+    # ── Reads ──────────────────────────────────────────────────────────────────
+
+    def agents_completed(self, module_id) -> dict:
+        """Copy of the {agent: True} completions for `module_id`."""
+        with self._lock:
+            return dict(self.completed.get(str(module_id).strip(), {}))
+
+    def assessment_rows(self) -> list:
+        """Copies of this student's Assessment_Logs rows, oldest first."""
+        with self._lock:
+            return [dict(row) for row in self.assessments]
+
+    def finished_modules(self) -> set:
+        """Copy of the modules with a POST row."""
+        with self._lock:
+            return set(self.finished)
+
+    def attempt_started(self, module_id):
+        """Timestamp of the latest INITIAL row for `module_id`, or None."""
+        module_id = str(module_id).strip()
+        with self._lock:
+            for row in reversed(self.assessments):
+                if (str(row["Module_ID"]).strip() == module_id
+                        and str(row["Status"]).strip() == "INITIAL"):
+                    return str(row["Timestamp"]) or None
+        return None
+
+    def is_finished(self, module_id) -> bool:
+        with self._lock:
+            return str(module_id).strip() in self.finished
+
+    @property
+    def pending_post(self) -> list:
+        """Modules with an initial diagnostic but no Tier 5-6 (POST) row yet."""
+        with self._lock:
+            return [m for m in self.started if m not in self.finished]
+
+
+_STATES = OrderedDict()           # uid -> LearnerState, least recently used first
+_STATES_LOCK = threading.Lock()
+
+
+def register(state: LearnerState, replace=False) -> LearnerState:
+    """
+    Registers `state` for its student. An already registered state wins
+    unless `replace` is set (a fresh load at login).
+    """
+    with _STATES_LOCK:
+        if replace or state.uid not in _STATES:
+            _STATES[state.uid] = state
+        _STATES.move_to_end(state.uid)
+        while len(_STATES) > LEARNER_STATE_CAPACITY:
+            _STATES.popitem(last=False)
+        return _STATES[state.uid]
+
+
+def get_learner_state(uid):
+    """The registered state of `uid`, or None before that student logs in."""
+    uid = str(uid).upper().strip()
+    with _STATES_LOCK:
+        state = _STATES.get(uid)
+        if state is not None:
+            _STATES.move_to_end(uid)
+        return state
+
+
+def forget(uid):
+    """Drops the registered state of `uid` (logout)."""
+    with _STATES_LOCK:
+        _STATES.pop(str(uid).upper().strip(), None)
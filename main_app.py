@@ -6,6 +6,7 @@ Routing logic: login → role-based portal dispatch.
 Changes from original:
   - Added admin_dashboard import for Admin/Supervisor role
   - Added agent_completed session state initialisation
+  - Login restores the student's latest session checkpoint
   - All other logic preserved exactly as original
 """
 
@@ -35,6 +36,9 @@ if "current_tap_level" not in st.session_state:
 if "current_rep_level" not in st.session_state:
     st.session_state.current_rep_level = "MONADIC"
 
+# Roles routed to staff pages; everyone else gets the student portal
+STAFF_ROLES = ["Admin", "Researcher", "Supervisor", "Teacher", "Head Teacher"]
+
 # ── Login screen ──────────────────────────────────────────────────────────────
 if st.session_state.user is None:
     st.title("🧪 Saathi Vigyan | साथी विज्ञान | 사아티 비잔")
@@ -53,6 +57,18 @@ if st.session_state.user is None:
         user_data = db.check_login(user_id)
         if user_data:
             st.session_state.user = user_data
+            # Resume where this user left off (one keyed checkpoint read)
+            db.restore_session(user_id)
+            role = str(user_data.get("Role", "Student")).strip()
+            if role not in STAFF_ROLES:
+                # Fresh per-student state each login (replaces a stale copy)
+                from config import normalise_group
+                db.load_learner_state(
+                    user_id,
+                    user_data.get("Group_Code")
+                    or normalise_group(str(user_data.get("Group", "CON"))),
+                    reload=True,
+                )
             st.rerun()
         else:
             st.error("❌ ID not found. Please verify with the Participants database.")
@@ -65,6 +81,8 @@ else:
     st.sidebar.write(f"**Group:** {st.session_state.user.get('Group', '—')}")
 
     if st.sidebar.button("Logout | बाहिरिनुहोस् | 로그아웃"):
+        if role not in STAFF_ROLES:
+            db.forget_learner_state(st.session_state.user.get("User_ID", ""))
         st.session_state.clear()
         st.rerun()
 
@@ -9,6 +9,8 @@ Contains:
   3. render_group_info() — Group-aware information panel
   4. render_progress_journey() — Visual agent journey tracker
   5. call_agent_vision() — Multimodal API call for Rupak image input
+  6. render_chat_history() — Windowed agent chat history with
+     "load earlier turns"
 
 Academic justification for multimodal Rupak:
   The MA vs MMALE distinction requires a genuine, measurable difference
@@ -24,12 +26,14 @@ Academic justification for multimodal Rupak:
 
 import streamlit as st
 import base64
-from openai import OpenAI
 from config import (
-    GROUPS, get_group_config, get_accessible_agents,
-    is_multimodal, is_control, t, get_language, UI_STRINGS,
+    get_group_config, get_accessible_agents,
+    is_control, t, CHAT_WINDOW_TURNS,
+)
+from agents import (
+    AGENTS, ChatTranscript, as_transcript, build_agent_context, parse_signals,
+    display_text,
 )
-from agents import AGENTS, AGENT_SEQUENCE, ALL_SIGNAL_CODES
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # 1. SCIENTIFIC PRACTICE ORIENTATION (for student dashboard)
@@ -189,8 +193,10 @@ def render_rupak_multimodal(uid: str, group_code: str, module: dict, lang: str =
     Rupak can respond to its accuracy — this is genuine model-based
     learning (Justi & Gilbert, 2002).
     """
-    from agents import RUPAK_SYSTEM_PROMPT
-    from database_manager import log_temporal_trace
+    from database_manager import (
+        log_temporal_trace, log_conversation_turn, checkpoint_session,
+        fetch_attempt_history,
+    )
 
     topic = module.get("Sub_Title", "this concept")
 
@@ -255,18 +261,21 @@ def render_rupak_multimodal(uid: str, group_code: str, module: dict, lang: str =
 
     with col_chat:
         # Display previous Rupak conversation
-        rupak_msgs = st.session_state.get("rupak_messages", [])
-        for m in rupak_msgs[1:]:  # skip system prompt
-            display = m.get("content", "")
-            if isinstance(display, list):
-                # multimodal message — extract text parts only for display
-                display = " ".join(
-                    p.get("text", "") for p in display if isinstance(p, dict) and p.get("type") == "text"
-                )
-            for code in ALL_SIGNAL_CODES:
-                display = display.replace(code, "")
-            with st.chat_message(m["role"]):
-                st.markdown(display.strip())
+        rupak_msgs = as_transcript(st.session_state.get("rupak_messages")) or ChatTranscript()
+        if not rupak_msgs:
+            # Resume this attempt after a reload (image turns come back as
+            # their text with an [image] marker; the images are not stored)
+            restored = fetch_attempt_history(uid, module.get("Sub_Title", "Unknown"),
+                                             "RUPAK")
+            if restored:
+                from agents import initialise_agent
+                rupak_msgs = initialise_agent(
+                    "RUPAK", {**st.session_state.get("agent_context", {})})
+                rupak_msgs.extend(restored)
+        if rupak_msgs:
+            st.session_state["rupak_messages"] = rupak_msgs
+            # skips the system prompt; multimodal messages show their text parts
+            render_chat_history(rupak_msgs, "rupak_messages", lang)
 
         if st.button(submit_label, type="primary"):
             if not uploaded_image and len(text_description.strip()) < 5:
@@ -312,12 +321,25 @@ def render_rupak_multimodal(uid: str, group_code: str, module: dict, lang: str =
                     messages  = rupak_msgs,
                     api_key   = st.secrets["OPENAI_API_KEY"],
                     is_vision = uploaded_image is not None,
+                    group     = group_code,
                 )
 
             ai_content = result["content"]
             rupak_msgs.append({"role": "assistant", "content": ai_content})
             st.session_state["rupak_messages"] = rupak_msgs
 
+            # Same Conversations rows as the text agents in student_portal
+            # (image parts are logged as an [image] marker)
+            module_id = module.get("Sub_Title", "Unknown")
+            turn = sum(1 for m in rupak_msgs if m["role"] == "user")
+            logged_user = display_text(user_content)
+            if uploaded_image:
+                logged_user = (logged_user + " [image]").strip()
+            log_conversation_turn(uid, module_id, "RUPAK", turn, "user",
+                                  logged_user, result["prompt_hash"])
+            log_conversation_turn(uid, module_id, "RUPAK", turn, "assistant",
+                                  ai_content, result["prompt_hash"])
+
             # Log with image flag
             img_flag = "|MODE:IMAGE" if uploaded_image else "|MODE:TEXT"
             log_temporal_trace(
@@ -327,7 +349,9 @@ def render_rupak_multimodal(uid: str, group_code: str, module: dict, lang: str =
             )
             log_temporal_trace(
                 uid, "RUPAK_MULTIMODAL_CHAT",
-                f"Topic:{topic}{img_flag}|AI:{ai_content[:300]}"
+                f"Topic:{topic}{img_flag}"
+                + (f"|DEGRADED:{result['degraded_reason']}" if result["degraded"] else "")
+                + f"|AI:{ai_content[:300]}"
             )
 
             # Update rep level
@@ -336,10 +360,10 @@ def render_rupak_multimodal(uid: str, group_code: str, module: dict, lang: str =
 
             # Check for triadic completion
             if result.get("triadic"):
-                completed = st.session_state.get("agent_completed", {})
-                completed["RUPAK"] = True
-                st.session_state.agent_completed = completed
-                from database_manager import log_assessment, get_nepal_time
+                from database_manager import (
+                    log_assessment, get_nepal_time, mark_agent_completed,
+                )
+                mark_agent_completed(uid, topic, "RUPAK")
                 log_assessment(
                     uid, group_code, topic,
                     "N/A", "N/A",
@@ -347,42 +371,39 @@ def render_rupak_multimodal(uid: str, group_code: str, module: dict, lang: str =
                     "N/A", "TRIADIC_COMPLETE", get_nepal_time()
                 )
 
+            checkpoint_session(uid)
             st.rerun()
 
 
-def call_agent_vision(messages: list, api_key: str, is_vision: bool = False) -> dict:
+def call_agent_vision(messages: list, api_key: str, is_vision: bool = False,
+                      group: str = None) -> dict:
     """
     Extended call_agent for multimodal (vision) interactions.
     Used by render_rupak_multimodal for MMALE group.
     Sends image + text to GPT-4o Vision API.
     """
-    from agents import (
-        detect_rep_level, detect_redirect,
-        detect_tap_level, detect_communication_level,
-    )
-
-    client = OpenAI(api_key=api_key)
+    from agents import generation_profile, prompt_hash, resilient_complete
 
-    resp = client.chat.completions.create(
-        model    = "gpt-4o",    # gpt-4o supports vision natively
-        messages = messages,
-        max_tokens = 1000,
+    # Same path as call_agent: Rupak's generation profile (its model must
+    # accept images), engine limits, deadline and fallback model
+    content, info = resilient_complete(
+        generation_profile("RUPAK", group), api_key,
+        build_agent_context("RUPAK", messages, api_key),
     )
-    content = resp.choices[0].message.content
-
-    display = content
-    for code in ALL_SIGNAL_CODES:
-        display = display.replace(code, "")
+    signals = parse_signals(content)
 
     return {
         "content":       content,
-        "display":       display.strip(),
-        "rep_level":     detect_rep_level(content),
-        "tap_level":     detect_tap_level(content),
-        "redirect":      detect_redirect(content),
-        "comm_level":    detect_communication_level(content),
-        "triadic":       "[TRIADIC_FLUENCY_DETECTED]" in content,
+        "display":       signals.display,
+        "rep_level":     signals.rep_level,
+        "tap_level":     signals.tap_level,
+        "redirect":      signals.redirect,
+        "comm_level":    signals.comm_level,
+        "triadic":       signals.triadic,
         "vision_used":   is_vision,
+        "prompt_hash":   prompt_hash(messages),
+        "degraded":      info["degraded"],
+        "degraded_reason": info["degraded_reason"],
     }
 
 
@@ -463,3 +484,45 @@ def render_progress_journey(group_code: str, lang: str = "ne"):
             st.sidebar.markdown(f"▶️ **{icon} {name}** ← active")
         else:
             st.sidebar.markdown(f"🔒 {icon} {name}")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 5. WINDOWED CHAT HISTORY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_EARLIER_LABELS = {
+    "en": ("🕘 {n} earlier messages", "Load earlier turns"),
+    "ne": ("🕘 {n} अघिल्ला सन्देशहरू", "अघिल्ला कुराकानी देखाउनुहोस्"),
+    "ko": ("🕘 이전 메시지 {n}개", "이전 대화 더 보기"),
+}
+
+
+def render_chat_history(messages: ChatTranscript, key: str, lang: str = "en"):
+    """
+    Renders the last CHAT_WINDOW_TURNS turns of an agent chat (system prompt
+    skipped, display text only).
+
+    Original: every rerun emitted one st.chat_message per message, so rerun
+    time and websocket payload grew with the length of the conversation.
+    Now older messages collapse into one expander holding a cached digest
+    of the student's earlier messages (ChatTranscript.earlier_summary), and
+    "load earlier turns" widens this chat's window by CHAT_WINDOW_TURNS.
+    The window is kept per chat in st.session_state[f"{key}_window"].
+    """
+    window_key = f"{key}_window"
+    turns = st.session_state.get(window_key, CHAT_WINDOW_TURNS)
+    start = max(1, len(messages) - 2 * turns)
+
+    if start > 1:
+        label, button = _EARLIER_LABELS.get(lang, _EARLIER_LABELS["en"])
+        with st.expander(label.format(n=start - 1)):
+            st.markdown(messages.earlier_summary(start))
+            st.button(
+                button, key=f"{key}_load_earlier",
+                on_click=lambda: st.session_state.__setitem__(
+                    window_key, turns + CHAT_WINDOW_TURNS),
+            )
+
+    for role, text in messages.display_rows(start):
+        with st.chat_message(role):
+            st.markdown(text)
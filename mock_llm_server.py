@@ -0,0 +1,363 @@
+"""
+mock_llm_server.py — Offline OpenAI Stand-in for Load Tests
+============================================================
+A local, OpenAI-compatible chat-completions server that answers every agent
+with deterministic replies built from test_questions.AGENT_TEST_SEQUENCES,
+including the signal code each test turn expects. Point the app (or a
+benchmark) at it through the base URL and no API quota is spent:
+
+    python mock_llm_server.py --port 8765 --latency lognormal:0.8,0.4 \\
+                              --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run main_app.py
+
+    # classroom-scale simulation of call_agent against an in-process server
+    python mock_llm_server.py --simulate 40 --latency uniform:0.5,2
+
+How replies are chosen:
+  - the agent is recognised from its system prompt (agents.AGENTS);
+  - a student message matching a test turn (case/whitespace-insensitive)
+    gets that turn's expected signal; any other message gets the signal of
+    the test turn at the same position in the conversation;
+  - context-summary requests get a fixed summary, anything else an echo.
+
+Options:
+  --latency     time to first byte: fixed:S | uniform:A,B | normal:MU,SD |
+                lognormal:MEDIAN,SIGMA (seconds)
+  --chunk-delay seconds between streamed chunks (--chunk-size characters)
+  --error-rate  share of requests answered with --error-status (429/500/503)
+  --drop-rate   share of streams cut off half way
+  --seed        makes latency and error injection repeatable
+
+GET /stats returns request, error and per-agent counters.
+Uses only the standard library (plus agents/test_questions for content).
+"""
+
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from agents import AGENTS, SUMMARY_SYSTEM_PROMPT
+from test_questions import AGENT_TEST_SEQUENCES
+
+
+# ── Reply content ──────────────────────────────────────────────────────────────
+
+def _normalise(text):
+    return " ".join(str(text).casefold().split())
+
+
+def _text(content):
+    if isinstance(content, list):
+        return " ".join(
+            p.get("text", "") for p in content
+            if isinstance(p, dict) and p.get("type") == "text"
+        )
+    return str(content or "")
+
+
+# normalised student message -> (agent_key, turn index)
+_TURN_INDEX = {
+    _normalise(turn["student"]): (agent_key, i)
+    for agent_key, seq in AGENT_TEST_SEQUENCES.items()
+    for i, turn in enumerate(seq["test_turns"])
+}
+
+
+def identify_agent(messages):
+    """Agent key whose system prompt heads `messages`, or None."""
+    if not messages or messages[0].get("role") != "system":
+        return None
+    system = _text(messages[0].get("content"))
+    if system == SUMMARY_SYSTEM_PROMPT:
+        return "SUMMARY"
+    for agent_key, agent in AGENTS.items():
+        if system.startswith(agent["system_prompt"]):
+            return agent_key
+    return None
+
+
+def mock_reply(messages):
+    """(agent_key, reply text) for a chat request — deterministic."""
+    agent_key = identify_agent(messages)
+    student   = next(
+        (_text(m.get("content")) for m in reversed(messages)
+         if m.get("role") == "user"), ""
+    )
+    if agent_key == "SUMMARY":
+        return agent_key, ("The student is working through the topic; earlier "
+                           "turns covered their initial claim and reasoning.")
+    if agent_key not in AGENT_TEST_SEQUENCES:
+        return agent_key, f"Mock reply to: {student[:200]}"
+
+    turns = AGENT_TEST_SEQUENCES[agent_key]["test_turns"]
+    match = _TURN_INDEX.get(_normalise(student))
+    if match and match[0] == agent_key:
+        index = match[1]
+    else:
+        asked = sum(1 for m in messages if m.get("role") == "user")
+        index = min(max(asked - 1, 0), len(turns) - 1)
+    turn   = turns[index]
+    name   = AGENTS[agent_key]["name"]
+    reply  = (
+        f"{name} (mock, turn {index + 1}): {turn['purpose']}. "
+        f"You said: \"{student[:120]}\". What evidence supports that idea?"
+    )
+    if turn.get("expect_signal"):
+        reply += f" {turn['expect_signal']}"
+    return agent_key, reply
+
+
+# ── Fault and latency model ────────────────────────────────────────────────────
+
+def parse_latency(spec):
+    """'fixed:0.5' | 'uniform:a,b' | 'normal:mu,sd' | 'lognormal:median,sigma'."""
+    kind, _, args = str(spec).partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()] if args else []
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        return lambda rng: values[0] if values else 0.0
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"unknown latency distribution: {spec!r}")
+
+
+class MockOptions:
+    def __init__(self, latency="fixed:0", chunk_size=12, chunk_delay=0.02,
+                 error_rate=0.0, error_status=500, drop_rate=0.0, seed=None):
+        self.latency      = parse_latency(latency)
+        self.chunk_size   = chunk_size
+        self.chunk_delay  = chunk_delay
+        self.error_rate   = error_rate
+        self.error_status = error_status
+        self.drop_rate    = drop_rate
+        self.rng          = random.Random(seed)
+        self.lock         = threading.Lock()
+        self.stats        = {"requests": 0, "streams": 0, "errors": 0,
+                             "dropped": 0, "agents": {}}
+
+    def draw(self):
+        """(latency, inject_error, drop_stream) for one request."""
+        with self.lock:
+            return (self.latency(self.rng),
+                    self.rng.random() < self.error_rate,
+                    self.rng.random() < self.drop_rate)
+
+    def count(self, field, agent_key=None):
+        with self.lock:
+            self.stats[field] += 1
+            if agent_key is not None:
+                agents = self.stats["agents"]
+                agents[agent_key] = agents.get(agent_key, 0) + 1
+
+
+# ── HTTP server ────────────────────────────────────────────────────────────────
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None                       # set by make_server
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [
+                {"id": m, "object": "model", "owned_by": "mock"}
+                for m in ("gpt-4o", "gpt-4o-mini")
+            ]})
+        elif self.path.rstrip("/") in ("/stats", "/health"):
+            with self.options.lock:
+                stats = json.loads(json.dumps(self.options.stats))
+            self._json(200, stats)
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        length  = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        options = self.options
+        latency, fail, drop = options.draw()
+        agent_key, reply = mock_reply(request.get("messages", []))
+        options.count("requests", agent_key or "UNKNOWN")
+
+        time.sleep(latency)
+        if fail:
+            options.count("errors")
+            self._json(options.error_status, {"error": {
+                "message": "injected failure", "type": "server_error",
+                "code": options.error_status,
+            }})
+            return
+
+        model   = request.get("model", "gpt-4o")
+        created = int(time.time())
+        if not request.get("stream"):
+            self._json(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion",
+                "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": reply}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0,
+                          "total_tokens": 0},
+            })
+            return
+
+        options.count("streams")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        size   = max(int(options.chunk_size), 1)
+        chunks = [reply[i:i + size] for i in range(0, len(reply), size)]
+        if drop:
+            chunks = chunks[:len(chunks) // 2]
+        try:
+            for text in chunks:
+                event = {
+                    "id": "chatcmpl-mock", "object": "chat.completion.chunk",
+                    "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": text},
+                                 "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(options.chunk_delay)
+            if drop:
+                options.count("dropped")
+                self.close_connection = True
+                return                   # connection closes without [DONE]
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def make_server(host="127.0.0.1", port=0, **options):
+    """ThreadingHTTPServer serving mock completions (port 0 = any free port)."""
+    handler = type("Handler", (MockHandler,), {"options": MockOptions(**options)})
+    server  = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    """Starts make_server() on a daemon thread; returns (server, base_url)."""
+    server = make_server(host, port, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1"
+
+
+# ── Classroom simulation ───────────────────────────────────────────────────────
+
+def simulate_classroom(students, agent_keys=None, stream=True):
+    """
+    Runs one test sequence per simulated student (round-robin over agents)
+    through agents.call_agent concurrently; returns a latency summary.
+    The base URL must already point at a mock server.
+    """
+    from agents import call_agent, initialise_agent
+    from agent_engine import engine_stats
+
+    agent_keys = agent_keys or list(AGENT_TEST_SEQUENCES)
+    latencies, outcomes, lock = [], {}, threading.Lock()
+
+    def student(n):
+        agent_key = agent_keys[n % len(agent_keys)]
+        seq = AGENT_TEST_SEQUENCES[agent_key]
+        messages = initialise_agent(agent_key, {"topic": seq["topic"], "lang": "en"})
+        for turn in seq["test_turns"]:
+            messages.append({"role": "user", "content": turn["student"]})
+            started = time.monotonic()
+            if stream:
+                reply = call_agent(agent_key, messages, "mock-key", stream=True)
+                for _ in reply:
+                    pass
+                result = reply.result
+            else:
+                result = call_agent(agent_key, messages, "mock-key")
+            elapsed = time.monotonic() - started
+            messages.append({"role": "assistant", "content": result["content"]})
+            outcome = result["degraded_reason"] or "ok"
+            with lock:
+                latencies.append(elapsed)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=student, args=(n,)) for n in range(students)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)], 3)
+
+    return {
+        "students": students, "turns": len(latencies),
+        "wall_secs": round(time.monotonic() - started, 2),
+        "p50": pct(0.50), "p95": pct(0.95), "max": pct(1.0),
+        "outcomes": outcomes, "engine": engine_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline OpenAI-compatible stand-in for the MMALE agents."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0")
+    parser.add_argument("--chunk-size", type=int, default=12)
+    parser.add_argument("--chunk-delay", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--simulate", type=int, metavar="STUDENTS",
+                        help="run a classroom simulation against an "
+                             "in-process server and exit")
+    args = parser.parse_args()
+    options = dict(
+        latency=args.latency, chunk_size=args.chunk_size,
+        chunk_delay=args.chunk_delay, error_rate=args.error_rate,
+        error_status=args.error_status, drop_rate=args.drop_rate, seed=args.seed,
+    )
+
+    if args.simulate:
+        import os
+        server, base_url = start_mock_server(args.host, 0, **options)
+        os.environ["OPENAI_BASE_URL"] = base_url
+        print(json.dumps(simulate_classroom(args.simulate), indent=2))
+        server.shutdown()
+        return
+
+    server = make_server(args.host, args.port, **options)
+    print(f"Mock OpenAI server on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -26,13 +26,13 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from database_manager import (
-    get_gspread_client,
+    read_sheet,
     fetch_performance_learning_gap,
     fetch_agent_interaction_summary,
+    flush_event_logs,
+    pending_event_logs,
 )
 
-SHEET_KEY = "1UqWkZKJdT2CQkZn5-MhEzpSRHsKE4qAeA17H0BOnK60"
-
 # ── Column name map: actual sheet headers → safe internal names ───────────────
 # This resolves the mismatch between what log_assessment writes (T2, T4, T6)
 # and what the original portal expected (Tier_2 (Confidence_Ans)).
@@ -65,13 +65,15 @@ def show():
     st.title("🔬 PhD Principal Investigator Dashboard")
     st.caption("MMALE Research Analytics — Multimodal Multi-Agent Learning Ecology")
 
+    # Queued Temporal_Traces / ArgLog / RepLog rows are written on demand
+    # (flushing blocks on Sheets, so it no longer runs on every rerun).
+    _render_sync_control("sync_top")
+
     # ── Live study monitor bar ─────────────────────────────────────────────────
     _render_live_monitor()
 
     try:
-        client  = get_gspread_client()
-        sh      = client.open_by_key(SHEET_KEY)
-        logs_df = _load_and_clean(sh, "Assessment_Logs")
+        logs_df = _load_and_clean("Assessment_Logs")
 
         if logs_df.empty:
             st.warning("⚠️ No data in Assessment_Logs yet.")
@@ -93,10 +95,10 @@ def show():
             render_dynamic_sankey(logs_df)
 
         with tab3:
-            _render_export(logs_df, sh)
+            _render_export(logs_df)
 
         with tab4:
-            _render_agent_analytics(sh)
+            _render_agent_analytics()
 
         with tab5:
             _render_gap_analysis()
@@ -105,6 +107,25 @@ def show():
         st.error(f"Researcher Portal Error: {e}")
         st.exception(e)
 
+# ── Write-behind sync ─────────────────────────────────────────────────────────
+
+def _render_sync_control(key: str):
+    """Queued-row caption plus a "Sync now" button that flushes write-behind rows."""
+    queued = pending_event_logs()
+    c1, c2 = st.columns([4, 1])
+    with c1:
+        if queued:
+            st.caption(
+                "⏳ Rows not yet in storage: "
+                + ", ".join(f"{k}: {v}" for k, v in queued.items())
+            )
+        else:
+            st.caption("✅ All logged rows are in storage.")
+    with c2:
+        if st.button("🔄 Sync now", key=key, disabled=not queued):
+            written = flush_event_logs()
+            st.toast(f"Synced {written} row(s).")
+
 # ── Live study monitor ────────────────────────────────────────────────────────
 
 def _render_live_monitor():
@@ -133,13 +154,14 @@ def _render_live_monitor():
 
 # ── Data loader with column normalisation ─────────────────────────────────────
 
-def _load_and_clean(sh, worksheet_name: str) -> pd.DataFrame:
+def _load_and_clean(worksheet_name: str) -> pd.DataFrame:
     """
-    Loads a worksheet and normalises column names using COL_RENAME.
+    Loads a worksheet (from the local replica) and normalises column names
+    using COL_RENAME.
     Short names (T1-T6) pass through unchanged.
     Verbose names from older sheet versions are mapped to short names.
     """
-    df = pd.DataFrame(sh.worksheet(worksheet_name).get_all_records())
+    df = read_sheet(worksheet_name)
     if df.empty:
         return df
     df.rename(columns=COL_RENAME, inplace=True)
@@ -268,8 +290,10 @@ def render_dynamic_sankey(df: pd.DataFrame):
 
 # ── Tab 3: Export (EXTENDED) ──────────────────────────────────────────────────
 
-def _render_export(logs_df: pd.DataFrame, sh):
+def _render_export(logs_df: pd.DataFrame):
     st.subheader("Raw Evidence Hub")
+    # Sync before downloading so the trace export includes the latest turns
+    _render_sync_control("sync_export")
 
     c1, c2, c3 = st.columns(3)
 
@@ -281,7 +305,7 @@ def _render_export(logs_df: pd.DataFrame, sh):
 
     with c2:
         try:
-            trace_df = pd.DataFrame(sh.worksheet("Temporal_Traces").get_all_records())
+            trace_df = read_sheet("Temporal_Traces")
             if not trace_df.empty:
                 st.download_button(
                     "📥 Temporal_Traces CSV",
@@ -306,12 +330,12 @@ def _render_export(logs_df: pd.DataFrame, sh):
 
 # ── Tab 4: Multi-Agent Analytics (NEW) ───────────────────────────────────────
 
-def _render_agent_analytics(sh):
+def _render_agent_analytics():
     st.subheader("⚖️ Tarka AI — Argumentation Quality (TAP Levels)")
 
     # ── ArgLog ────────────────────────────────────────────────────────────────
     try:
-        arg_df = pd.DataFrame(sh.worksheet("ArgLog").get_all_records())
+        arg_df = read_sheet("ArgLog")
         if arg_df.empty:
             st.info("ArgLog is empty — Tarka data will appear here once students "
                     "complete argumentation sessions.")
@@ -390,7 +414,7 @@ def _render_agent_analytics(sh):
 
     # ── RepLog ────────────────────────────────────────────────────────────────
     try:
-        rep_df = pd.DataFrame(sh.worksheet("RepLog").get_all_records())
+        rep_df = read_sheet("RepLog")
         if rep_df.empty:
             st.info("RepLog is empty — Rupak data will appear here once students "
                     "complete modelling sessions.")
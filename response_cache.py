@@ -0,0 +1,187 @@
+"""
+response_cache.py — MMALE Agent Response Cache
+===============================================
+Opt-in cache of agent replies for the opening turns of a conversation.
+
+Many students in one module answer an agent's opening the same way (same
+option, same stock reasoning), and each of those turns used to cost a full
+GPT-4o call. The cache key is
+
+    (agent, module, prompt hash, model, normalised conversation)
+
+The prompt hash covers the agent and language (agents.SYSTEM_PROMPTS). The
+conversation is normalised by casefolding and collapsing whitespace.
+Only conversations of at most RESPONSE_CACHE_LAST_N messages after the system
+prompt are cached. Later turns depend on the whole dialogue, so a key built
+from its last few messages could return a reply written for a different
+conversation.
+
+Two tiers:
+  memory — LRU of RESPONSE_CACHE_MAX_ENTRIES replies, per-entry TTL
+  disk   — SQLite table at RESPONSE_CACHE_PATH, same TTL; survives restarts
+           and refills the memory tier on a hit
+
+Callers mark replies served from the cache ("cached": True in the
+call_agent result) so research logs can separate them.
+
+This module has no Streamlit dependency.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import (
+    RESPONSE_CACHE_AGENTS, RESPONSE_CACHE_TTL_SECS, RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_LAST_N, RESPONSE_CACHE_PATH,
+)
+
+
+def _normalise(text):
+    return " ".join(str(text).casefold().split())
+
+
+class ResponseCache:
+    """LRU + TTL reply cache with a SQLite tier."""
+
+    def __init__(self, agents=RESPONSE_CACHE_AGENTS, ttl=RESPONSE_CACHE_TTL_SECS,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 last_n=RESPONSE_CACHE_LAST_N, path=RESPONSE_CACHE_PATH):
+        self.agents      = {a for a, on in dict(agents).items() if on}
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self.last_n      = last_n
+        self._entries    = OrderedDict()     # key -> (stored_at, content)
+        self._lock       = threading.Lock()
+        self._stats      = {}                # agent -> counters
+        self._conn       = None
+        if path and self.agents:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, agent TEXT, content TEXT, "
+                    "stored_at REAL)"
+                )
+                self._conn.execute(
+                    "DELETE FROM responses WHERE stored_at < ?",
+                    (time.time() - ttl,),
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn = None            # memory tier only
+
+    def enabled(self, agent_key):
+        return agent_key in self.agents
+
+    def key(self, agent_key, module_id, messages, prompt_id, model=""):
+        """
+        Cache key for this request, or None when it must not be cached
+        (agent not enabled, conversation too long, or multimodal content).
+        """
+        if agent_key not in self.agents:
+            return None
+        history = messages[1:] if messages and messages[0].get("role") == "system" else messages
+        if not history or len(history) > self.last_n:
+            return None
+        if any(not isinstance(m.get("content"), str) for m in history):
+            return None
+        payload = json.dumps(
+            [agent_key, str(module_id), prompt_id, model,
+             [[m.get("role"), _normalise(m["content"])] for m in history]],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, agent_key, field):
+        counters = self._stats.setdefault(
+            agent_key, {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        )
+        counters[field] += 1
+
+    def get(self, agent_key, key):
+        """Cached reply for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self._count(agent_key, "hits")
+                return entry[1]
+            self._entries.pop(key, None)
+            row = None
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT stored_at, content FROM responses WHERE key = ?",
+                        (key,),
+                    ).fetchone()
+                except sqlite3.Error:
+                    row = None
+            if row and now - row[0] < self.ttl:
+                self._remember(key, row[0], row[1])
+                self._count(agent_key, "hits")
+                self._count(agent_key, "disk_hits")
+                return row[1]
+            self._count(agent_key, "misses")
+            return None
+
+    def put(self, agent_key, key, content):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, content)
+            self._count(agent_key, "stores")
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                        (key, agent_key, content, now),
+                    )
+                    self._conn.commit()
+                except sqlite3.Error:
+                    pass
+
+    def _remember(self, key, stored_at, content):
+        self._entries[key] = (stored_at, content)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """{agent: {hits, disk_hits, misses, stores, hit_rate}} plus totals."""
+        with self._lock:
+            per_agent = {a: dict(c) for a, c in self._stats.items()}
+            entries = len(self._entries)
+        totals = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        for counters in per_agent.values():
+            for field in totals:
+                totals[field] += counters[field]
+            counters["hit_rate"] = round(
+                counters["hits"] / max(counters["hits"] + counters["misses"], 1), 3)
+        totals["hit_rate"] = round(
+            totals["hits"] / max(totals["hits"] + totals["misses"], 1), 3)
+        return {"agents": per_agent, "total": totals, "entries": entries}
+
+
+_CACHE      = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """The process-wide response cache (configured from config.py)."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = ResponseCache()
+    return _CACHE
+
+
+def response_cache_stats() -> dict:
+    return get_response_cache().stats()
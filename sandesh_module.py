@@ -28,8 +28,12 @@ Data streams produced:
 import streamlit as st
 from database_manager import (
     log_open_response, log_reflection_survey, get_nepal_time,
+    checkpoint_session, log_conversation_turn, mark_agent_completed,
 )
-from agents import initialise_agent, call_agent, ALL_SIGNAL_CODES
+from agents import (
+    initialise_agent, call_agent, as_transcript, ChatTranscript, prompt_hash,
+)
+from mmale_components import render_chat_history
 
 # ── Rubric definitions (for researcher coding, displayed to student) ──────────
 
@@ -209,7 +213,9 @@ def render_sandesh_open_response(uid: str, group: str,
 
     with col_right:
         phase = st.session_state.get(f"sandesh_phase_{q_variant}", "DRAFT")
-        sandesh_msgs = st.session_state.get("sandesh_messages", [])
+        sandesh_msgs = as_transcript(st.session_state.get("sandesh_messages")) or ChatTranscript()
+        if sandesh_msgs:
+            st.session_state["sandesh_messages"] = sandesh_msgs
         sandesh_completed = st.session_state.get(
             "agent_completed", {}
         ).get("SANDESH", False)
@@ -295,14 +301,20 @@ def render_sandesh_open_response(uid: str, group: str,
                     )
                     # Inject draft into first message
                     if st.session_state["sandesh_messages"]:
+                        draft_msg = (
+                            f"Here is my draft response:\n\n{draft_text}\n\n"
+                            "Please help me improve it."
+                        )
                         st.session_state["sandesh_messages"].append({
-                            "role": "user",
-                            "content": (
-                                f"Here is my draft response:\n\n{draft_text}\n\n"
-                                "Please help me improve it."
-                            ),
+                            "role": "user", "content": draft_msg,
                         })
+                        log_conversation_turn(
+                            uid, module.get("Sub_Title", "Unknown"), "SANDESH",
+                            1, "user", draft_msg,
+                            prompt_hash(st.session_state["sandesh_messages"]),
+                        )
                     st.session_state[f"sandesh_phase_{q_variant}"] = "AI_DISCUSSION"
+                    checkpoint_session(uid)
                     st.rerun()
 
         # ── Phase 2: AI DISCUSSION ────────────────────────────────────────────
@@ -315,12 +327,7 @@ def render_sandesh_open_response(uid: str, group: str,
                 "Sandesh सँग आफ्नो मस्यौदा छलफल गर्नुहोस्।"
             )
 
-            for m in sandesh_msgs[1:]:
-                content = m.get("content", "")
-                for code in ALL_SIGNAL_CODES:
-                    content = content.replace(code, "")
-                with st.chat_message(m["role"]):
-                    st.markdown(content.strip())
+            render_chat_history(sandesh_msgs, "sandesh_messages", lang)
 
             placeholder = (
                 "Ask Sandesh for feedback on your draft..."
@@ -335,21 +342,33 @@ def render_sandesh_open_response(uid: str, group: str,
                         agent_key="SANDESH",
                         messages=sandesh_msgs,
                         api_key=st.secrets["OPENAI_API_KEY"],
+                        group=group,
                     )
                 ai_content = result["content"]
                 sandesh_msgs.append({"role": "assistant", "content": ai_content})
                 st.session_state["sandesh_messages"] = sandesh_msgs
 
                 from database_manager import log_temporal_trace
+                # Same Conversations rows as the text agents in student_portal
+                module_id = module.get("Sub_Title", "Unknown")
+                turn = sum(1 for m in sandesh_msgs if m["role"] == "user")
+                log_conversation_turn(uid, module_id, "SANDESH", turn, "user",
+                                      prompt, result["prompt_hash"])
+                log_conversation_turn(uid, module_id, "SANDESH", turn, "assistant",
+                                      ai_content, result["prompt_hash"])
                 log_temporal_trace(uid, "SANDESH_OPEN_CHAT",
                     f"Topic:{topic}|Q:{q_variant}|Student:{prompt[:200]}")
                 log_temporal_trace(uid, "SANDESH_OPEN_CHAT",
                     f"Topic:{topic}|Q:{q_variant}|"
-                    f"COMM:{result.get('comm_level','?')}|AI:{ai_content[:200]}")
+                    f"COMM:{result.get('comm_level','?')}"
+                    + (f"|DEGRADED:{result['degraded_reason']}" if result["degraded"] else "")
+                    + f"|AI:{ai_content[:200]}")
+                checkpoint_session(uid)
                 st.rerun()
 
             if st.button("✍️ Write My Final Response →", type="secondary"):
                 st.session_state[f"sandesh_phase_{q_variant}"] = "REVISED"
+                checkpoint_session(uid)
                 st.rerun()
 
         # ── Phase 3: REVISED RESPONSE ─────────────────────────────────────────
@@ -411,9 +430,7 @@ def render_sandesh_open_response(uid: str, group: str,
                         self_rating=self_rating_rev,
                         timestamp=get_nepal_time(),
                     )
-                    completed = st.session_state.get("agent_completed", {})
-                    completed["SANDESH"] = True
-                    st.session_state.agent_completed = completed
+                    mark_agent_completed(uid, topic, "SANDESH")
                     st.session_state[f"sandesh_phase_{q_variant}"] = "COMPLETE"
 
                     from database_manager import log_assessment
@@ -423,6 +440,7 @@ def render_sandesh_open_response(uid: str, group: str,
                         f"Communication complete: {q_variant}",
                         "N/A", "ECOLOGY_COMPLETE", get_nepal_time()
                     )
+                    checkpoint_session(uid)
                     st.rerun()
 
         # ── Phase 4: COMPLETE ─────────────────────────────────────────────────
@@ -0,0 +1,316 @@
+"""
+session_checkpoints.py — MMALE Session Checkpoints
+===================================================
+Durable copies of each student's Streamlit session, so a browser refresh
+resumes where the student left off.
+
+Original: a refresh wiped st.session_state — every agent conversation, the
+turn counters, agent_completed and the active module. On the next visit to
+an agent, fetch_chat_history rebuilt that one conversation from storage and
+nothing else came back. Now:
+
+  - after each turn the portals call database_manager.checkpoint_session(),
+    which snapshots the session keys below (snapshot_session) and queues
+    it here; a background thread writes queued checkpoints to SQLite in
+    one transaction, keeping only the newest per student (a failed write
+    is re-queued unless a newer checkpoint is already waiting);
+  - a checkpoint is one row per User_ID: zlib-compressed JSON, a format
+    number (CHECKPOINT_FORMAT) and a version that only ever increases, so
+    a late write never replaces a newer checkpoint;
+  - login restores it with one keyed read (restore_snapshot).
+
+Snapshots are compact: an agent's system prompt is stored as its
+SYSTEM_PROMPTS hash, and image parts of multimodal Rupak messages are
+dropped (their text is kept). Unchanged snapshots are not re-queued.
+
+This module has no Streamlit dependency.
+"""
+
+import os
+import json
+import time
+import zlib
+import atexit
+import sqlite3
+import hashlib
+import threading
+
+from config import CHECKPOINT_PATH, CHECKPOINT_TTL_SECS
+from agents import (
+    AGENTS, SYSTEM_PROMPTS, PROMPT_HASHES, ChatTranscript, system_message,
+)
+
+CHECKPOINT_FORMAT = 1        # bump when the snapshot layout changes
+CHECKPOINT_RETRY_SECS = 1.0  # pause after a failed write before retrying
+
+# Session keys saved as they are
+CHECKPOINT_KEYS = [
+    "active_module", "agent_context", "active_agent", "current_tab",
+    "current_tap_level", "current_rep_level", "current_q_level",
+    "current_eq_level", "agent_completed", "mastery_triggered",
+    "con_pending_post_module", "language", "module_started_at",
+]
+# Per-item flags saved by key prefix
+CHECKPOINT_PREFIXES = ("sandesh_phase_", "logged_initial_")
+# Per-agent keys: f"{agent}_messages" (compacted) and f"{agent}_turn"
+CHECKPOINT_AGENTS = [key.lower() for key in AGENTS]
+
+
+# ── Snapshot layout ────────────────────────────────────────────────────────────
+
+_SYSTEM_BY_HASH = {
+    PROMPT_HASHES[m["content"]]: m for m in SYSTEM_PROMPTS.values()
+}
+
+
+def _compact_message(message):
+    content = message.get("content", "")
+    if isinstance(content, list):            # multimodal: keep the text parts
+        text = " ".join(part.get("text", "") for part in content
+                        if part.get("type") == "text")
+        if any(part.get("type") == "image_url" for part in content):
+            text = (text + " [image]").strip()
+        content = text
+    return {"role": message.get("role"), "content": content}
+
+
+def compact_messages(messages):
+    """Agent message list → JSON-ready list (system prompt as its hash)."""
+    if not messages:
+        return messages
+    head = messages[0]
+    rows = []
+    if (head.get("role") == "system" and isinstance(head.get("content"), str)
+            and head["content"] in PROMPT_HASHES):
+        rows.append({"role": "system", "prompt": PROMPT_HASHES[head["content"]]})
+        messages = messages[1:]
+    rows.extend(_compact_message(m) for m in messages)
+    return rows
+
+
+def expand_messages(rows, agent_key, lang="en"):
+    """compact_messages() output → ChatTranscript (shared system prompt)."""
+    if rows is None:
+        return None
+    messages = ChatTranscript()
+    for row in rows:
+        if "prompt" in row:
+            # A prompt edited since the checkpoint falls back to the current one
+            messages.append(_SYSTEM_BY_HASH.get(row["prompt"])
+                            or system_message(agent_key, lang))
+        else:
+            messages.append(row)
+    return messages
+
+
+def snapshot_session(session) -> dict:
+    """The checkpointed part of a session (st.session_state or any mapping)."""
+    snapshot = {key: session[key] for key in CHECKPOINT_KEYS if key in session}
+    for agent in CHECKPOINT_AGENTS:
+        if f"{agent}_messages" in session:
+            snapshot[f"{agent}_messages"] = compact_messages(
+                session[f"{agent}_messages"])
+        if f"{agent}_turn" in session:
+            snapshot[f"{agent}_turn"] = session[f"{agent}_turn"]
+    for key in list(session.keys()):
+        if str(key).startswith(CHECKPOINT_PREFIXES):
+            snapshot[key] = session[key]
+    return snapshot
+
+
+def restore_snapshot(session, snapshot: dict):
+    """Writes a snapshot_session() result back into `session`."""
+    lang = snapshot.get("language") or "en"
+    for key, value in snapshot.items():
+        agent = key[:-len("_messages")] if key.endswith("_messages") else None
+        if agent in CHECKPOINT_AGENTS:
+            value = expand_messages(value, agent.upper(), lang)
+        session[key] = value
+
+
+def _json_default(value):
+    # numpy / pandas scalars from module rows
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+# ── Store ──────────────────────────────────────────────────────────────────────
+
+class CheckpointStore:
+    """Latest checkpoint per student in SQLite, written by a background thread."""
+
+    def __init__(self, path=CHECKPOINT_PATH, ttl=CHECKPOINT_TTL_SECS):
+        self.ttl       = ttl
+        self._pending  = {}            # uid -> (version, blob) not yet written
+        self._inflight = {}            # batch being written (still readable)
+        self._digests  = {}            # uid -> digest of the last queued payload
+        self._versions = {}            # uid -> last version handed out
+        self._memory   = {}            # uid -> (version, blob) when SQLite is unavailable
+        self._writing  = False
+        self._cond     = threading.Condition()
+        self._db_lock  = threading.Lock()
+        self._stats    = {"queued": 0, "unchanged": 0, "written": 0,
+                          "restored": 0, "errors": 0, "retried": 0}
+        self._conn     = None
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS checkpoints ("
+                    "uid TEXT PRIMARY KEY, version INTEGER, saved_at REAL, "
+                    "payload BLOB)"
+                )
+                self._conn.execute(
+                    "DELETE FROM checkpoints WHERE saved_at < ?",
+                    (time.time() - ttl,),
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn = None      # checkpoints kept in memory only
+        self._thread = threading.Thread(
+            target=self._run, name="session-checkpoints", daemon=True,
+        )
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _uid(uid):
+        return str(uid).upper().strip()
+
+    def save(self, uid, snapshot: dict) -> bool:
+        """Queues `snapshot` for `uid`. False when it equals the last one queued."""
+        payload = json.dumps(
+            {"format": CHECKPOINT_FORMAT, "session": snapshot},
+            ensure_ascii=False, separators=(",", ":"), default=_json_default,
+        ).encode("utf-8")
+        digest = hashlib.sha256(payload).digest()
+        uid    = self._uid(uid)
+        with self._cond:
+            if self._digests.get(uid) == digest:
+                self._stats["unchanged"] += 1
+                return False
+            version = max(time.time_ns(), self._versions.get(uid, 0) + 1)
+            self._versions[uid] = version
+            self._digests[uid]  = digest
+            self._pending[uid]  = (version, zlib.compress(payload, 6))
+            self._stats["queued"] += 1
+            self._cond.notify()
+        return True
+
+    def load(self, uid):
+        """The latest snapshot of `uid` (queued or stored), or None."""
+        uid = self._uid(uid)
+        with self._cond:
+            pending = (self._pending.get(uid) or self._inflight.get(uid)
+                       or self._memory.get(uid))
+        blob = pending[1] if pending else None
+        if blob is None and self._conn is not None:
+            try:
+                with self._db_lock:
+                    row = self._conn.execute(
+                        "SELECT payload, saved_at FROM checkpoints WHERE uid = ?",
+                        (uid,),
+                    ).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row and time.time() - row[1] < self.ttl:
+                blob = row[0]
+        if blob is None:
+            return None
+        try:
+            data = json.loads(zlib.decompress(blob))
+        except (zlib.error, ValueError):
+            return None
+        if data.get("format") != CHECKPOINT_FORMAT:
+            return None                # older layout: start a fresh session
+        with self._cond:
+            self._stats["restored"] += 1
+        return data.get("session")
+
+    def flush(self, timeout=5.0) -> bool:
+        """Waits until every queued checkpoint is written. False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {**self._stats, "pending": len(self._pending),
+                    "persistent": self._conn is not None}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+                self._writing = True
+            try:
+                self._write(batch)
+            finally:
+                with self._cond:
+                    self._inflight = {}    # committed, re-queued or kept in memory
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write(self, batch):
+        if self._conn is None:
+            with self._cond:
+                self._memory.update(batch)
+                self._stats["written"] += len(batch)
+            return
+        now = time.time()
+        try:
+            with self._db_lock:
+                self._conn.executemany(
+                    "INSERT INTO checkpoints (uid, version, saved_at, payload) "
+                    "VALUES (?, ?, ?, ?) ON CONFLICT(uid) DO UPDATE SET "
+                    "version = excluded.version, saved_at = excluded.saved_at, "
+                    "payload = excluded.payload "
+                    "WHERE excluded.version > checkpoints.version",
+                    [(uid, version, now, blob)
+                     for uid, (version, blob) in batch.items()],
+                )
+                self._conn.commit()
+            with self._cond:
+                self._stats["written"] += len(batch)
+        except sqlite3.Error:
+            # Put the batch back for the next cycle; a checkpoint queued
+            # since then is newer and stays
+            with self._cond:
+                self._stats["errors"] += 1
+                for uid, entry in batch.items():
+                    if uid not in self._pending:
+                        self._pending[uid] = entry
+                        self._stats["retried"] += 1
+            time.sleep(CHECKPOINT_RETRY_SECS)
+
+
+_STORE      = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """The process-wide checkpoint store (configured from config.py)."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = CheckpointStore()
+    return _STORE
+
+
+def checkpoint_stats() -> dict:
+    """Checkpoint counters ({} before the first checkpoint or restore)."""
+    if _STORE is None:
+        return {}
+    return _STORE.stats()
@@ -0,0 +1,326 @@
+"""
+storage_backends.py — MMALE Storage Backends
+=============================================
+The storage interface behind database_manager, plus two local
+implementations.
+
+  StorageBackend — the operations the portals rely on: append an event
+                   row, read a table, run SQL over tables, look up a
+                   participant, answer-key lookups and file upload.
+  SQLiteBackend  — a single SQLite file. Every table uses the layout of the
+                   Sheets read replica (`_row` + one column per header
+                   cell) and the same indexes, so the SQL in
+                   database_manager runs unchanged.
+  MemoryBackend  — SQLiteBackend on an in-memory database, for tests,
+                   benchmarks and offline demos.
+
+The Google Sheets implementation (SheetsBackend) lives in database_manager
+next to the write-behind logger, replica and caches it is built from.
+The backend is chosen by config.STORAGE_BACKEND ("sheets" | "sqlite" |
+"memory").
+
+This module has no Streamlit or Google dependency.
+"""
+
+import os
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import pandas as pd
+
+# ── Table layout ───────────────────────────────────────────────────────────────
+# Header rows of every research sheet, in column order. The Sheets backend
+# creates the bootstrap sheets from these; the local backends create every
+# table from them.
+
+TABLE_SCHEMAS = {
+    "Participants": ["User_ID", "Name", "Role", "Group"],
+    "Instructional_Materials": [
+        "Date", "Teacher_ID", "Group", "Main_Title", "Sub_Title",
+        "Objectives", "File_Link", "Video_Link", "Diagnostic_Question",
+        "Option_A", "Option_B", "Option_C", "Option_D",
+        "Correct_Answer", "Socratic_Tree",
+    ],
+    "Assessment_Logs": [
+        "Timestamp", "User_ID", "Group", "Module_ID",
+        "T1", "T2", "T3", "T4", "Status", "Diagnostic_Result", "T5", "T6",
+    ],
+    "Temporal_Traces": ["Timestamp", "User_ID", "Event", "Details"],
+    "Assignments": [
+        "Date", "Teacher_ID", "Group", "Title", "Description", "File_Link",
+    ],
+    "ArgLog": [
+        "Timestamp", "User_ID", "Group", "Module_ID",
+        "TAP_Level", "Turn_Number", "Student_Msg", "Agent_Msg",
+    ],
+    "RepLog": [
+        "Timestamp", "User_ID", "Group", "Module_ID",
+        "Rep_Level", "Turn_Number", "Student_Msg", "Agent_Msg",
+    ],
+    "OpenResponse": [
+        "Timestamp", "User_ID", "Group", "Module_ID",
+        "Item_Num", "Phase", "Response_Text",
+        "Self_Rating", "Word_Count",
+    ],
+    "ReflectionSurvey": [
+        "Timestamp", "User_ID", "Group",
+        "AI_Helped_Understanding_1to5",
+        "AI_Helped_Answering_1to5",
+        "Hardest_Agent", "Most_Useful_Agent", "Comment",
+    ],
+    "Conversations": [
+        "Timestamp", "User_ID", "Module_ID", "Agent",
+        "Turn", "Role", "Content", "Prompt_Hash",
+    ],
+}
+
+# Single-column indexes created wherever the column exists
+INDEXED_COLUMNS = ["Module_ID", "Status", "Sub_Title", "Event"]
+# Extra (upper(User_ID), ...) composite indexes for per-student lookups
+USER_INDEXES = {"Conversations": ["Module_ID", "Agent"]}
+
+
+class TableNotFound(LookupError):
+    """Raised when a backend has no table with the requested name."""
+
+
+def quote_identifier(identifier):
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def column_names(header):
+    """Sheet header → unique, non-empty SQLite column names."""
+    names, seen = [], set()
+    for i, raw in enumerate(header):
+        name = str(raw).strip() or f"Column_{i + 1}"
+        while name in seen:
+            name += "_"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def create_table(conn, name, header):
+    """(Re)creates table `name` with `_row` + header columns and its indexes."""
+    cols  = column_names(header)
+    table = quote_identifier(name)
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute(
+        f"CREATE TABLE {table} (_row INTEGER PRIMARY KEY, "
+        + ", ".join(quote_identifier(c) for c in cols) + ")"
+    )
+    if "User_ID" in cols:
+        conn.execute(
+            f"CREATE INDEX {quote_identifier(f'ix_{name}_uid')} "
+            f"ON {table} (upper(\"User_ID\"))"
+        )
+        extra = USER_INDEXES.get(name)
+        if extra and all(c in cols for c in extra):
+            conn.execute(
+                f"CREATE INDEX {quote_identifier(f'ix_{name}_user_key')} "
+                f"ON {table} (upper(\"User_ID\"), "
+                + ", ".join(quote_identifier(c) for c in extra) + ")"
+            )
+    for col in INDEXED_COLUMNS:
+        if col in cols:
+            conn.execute(
+                f"CREATE INDEX {quote_identifier(f'ix_{name}_{col}')} "
+                f"ON {table} ({quote_identifier(col)})"
+            )
+
+
+# ── Interface ──────────────────────────────────────────────────────────────────
+
+class StorageBackend(ABC):
+    """Operations database_manager needs from a research data store."""
+
+    name = "abstract"
+
+    @abstractmethod
+    def append_event(self, table, row, deferred=False):
+        """
+        Appends one row (values in header order) to `table`. deferred=True
+        allows the backend to batch the write (high-volume trace rows).
+        """
+
+    @abstractmethod
+    def read_table(self, table):
+        """Whole table as a DataFrame in insertion order (caller may mutate)."""
+
+    @abstractmethod
+    def query(self, sql, params=(), tables=()):
+        """
+        Runs SQL over the replica-style tables (`_row` + header columns).
+        `tables` lists the tables the query reads.
+        """
+
+    @abstractmethod
+    def lookup_participant(self, user_id):
+        """Participants row (dict) for `user_id`, case-insensitive, or None."""
+
+    @abstractmethod
+    def answer_key(self, sub_title):
+        """Correct_Answer of the first module with this Sub_Title, or None."""
+
+    @abstractmethod
+    def answer_map(self, last_wins=False):
+        """
+        {Sub_Title: Correct_Answer} as strings. The first module with a
+        Sub_Title wins (as in log_assessment); last_wins=True keeps the latest
+        row instead, as the original gap analysis did.
+        """
+
+    @abstractmethod
+    def upload_file(self, uploaded_file):
+        """Stores an uploaded file; returns a link to it or None."""
+
+    @abstractmethod
+    def tables(self):
+        """Names of the tables that exist."""
+
+    def flush(self, table=None):
+        """Writes any deferred rows now. Returns rows written."""
+        return 0
+
+    def pending(self):
+        """{table: deferred row count} for tables with unwritten rows."""
+        return {}
+
+    def pending_rows(self, table):
+        """Copies of the deferred rows not yet written to `table`."""
+        return []
+
+
+# ── SQLite ─────────────────────────────────────────────────────────────────────
+
+class SQLiteBackend(StorageBackend):
+    """All research tables in one SQLite database."""
+
+    name = "sqlite"
+
+    def __init__(self, path, schemas=TABLE_SCHEMAS, upload_dir=None):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path  = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock    = threading.RLock()
+        self._columns = {}
+        self.upload_dir = upload_dir or os.path.join(
+            os.path.dirname(os.path.abspath(path)), "uploads"
+        )
+        with self._lock:
+            existing = set(self.tables())
+            for name, header in schemas.items():
+                if name not in existing:
+                    create_table(self._conn, name, header)
+            self._conn.commit()
+
+    def _table_columns(self, table):
+        cols = self._columns.get(table)
+        if cols is None:
+            info = self._conn.execute(
+                f"PRAGMA table_info({quote_identifier(table)})"
+            ).fetchall()
+            if not info:
+                raise TableNotFound(table)
+            cols = self._columns[table] = [c[1] for c in info if c[1] != "_row"]
+        return cols
+
+    def append_event(self, table, row, deferred=False):
+        with self._lock:
+            cols   = self._table_columns(table)
+            values = (["" if v is None else v for v in row]
+                      + [""] * len(cols))[:len(cols)]
+            self._conn.execute(
+                f"INSERT INTO {quote_identifier(table)} ("
+                + ", ".join(quote_identifier(c) for c in cols)
+                + f") VALUES ({', '.join('?' * len(cols))})",
+                values,
+            )
+            self._conn.commit()
+
+    def read_table(self, table):
+        with self._lock:
+            self._table_columns(table)
+            df = pd.read_sql_query(
+                f"SELECT * FROM {quote_identifier(table)} ORDER BY _row",
+                self._conn,
+            )
+        return df.drop(columns=["_row"])
+
+    def query(self, sql, params=(), tables=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def lookup_participant(self, user_id):
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT * FROM Participants WHERE upper(trim(User_ID)) = ? "
+                "ORDER BY _row LIMIT 1",
+                (str(user_id).upper().strip(),),
+            )
+            row = cur.fetchone()
+            if row is None:
+                return None
+            record = dict(zip([d[0] for d in cur.description], row))
+        record.pop("_row", None)
+        return record
+
+    def answer_key(self, sub_title):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT Correct_Answer FROM Instructional_Materials "
+                "WHERE Sub_Title = ? ORDER BY _row LIMIT 1",
+                (str(sub_title),),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def answer_map(self, last_wins=False):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT Sub_Title, Correct_Answer FROM Instructional_Materials "
+                "ORDER BY _row"
+            ).fetchall()
+        answers = {}
+        for sub_title, correct in rows:
+            if last_wins:
+                answers[str(sub_title)] = str(correct)
+            else:
+                answers.setdefault(str(sub_title), str(correct))
+        return answers
+
+    def upload_file(self, uploaded_file):
+        os.makedirs(self.upload_dir, exist_ok=True)
+        target = Path(self.upload_dir) / f"{uuid.uuid4().hex[:8]}_{Path(uploaded_file.name).name}"
+        target.write_bytes(uploaded_file.getvalue())
+        return target.resolve().as_uri()
+
+    def tables(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE '\\_%' ESCAPE '\\'"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+
+# ── In-memory ──────────────────────────────────────────────────────────────────
+
+class MemoryBackend(SQLiteBackend):
+    """SQLiteBackend on ':memory:'; uploads are kept in `self.files`."""
+
+    name = "memory"
+
+    def __init__(self, schemas=TABLE_SCHEMAS):
+        super().__init__(":memory:", schemas=schemas)
+        self.files = {}
+
+    def upload_file(self, uploaded_file):
+        key = f"{uuid.uuid4().hex[:8]}_{uploaded_file.name}"
+        self.files[key] = uploaded_file.getvalue()
+        return f"memory://{key}"
@@ -1,7 +1,7 @@
 """
 student_portal.py — MMALE Student Interface (Final)
 =====================================================
-Fixes applied in this version (12 issues resolved):
+Fixes applied in this version (14 issues resolved):
 
   1.  get_spreadsheet() replaces open_by_key() everywhere — performance fix
   2.  config imports added — group access control, language system
@@ -16,6 +16,16 @@ Fixes applied in this version (12 issues resolved):
   10. Agent access control — unlock gate checks group permissions
   11. Revision form routes to correct 6-agent tab names
   12. render_modules and metacognitive dashboard use get_spreadsheet()
+  13. Agent chat turns (both roles) go to the Conversations store and are
+      restored from it when an agent conversation is re-initialised
+  14. Agent replies stream token by token (call_agent(stream=True))
+  15. Agent chat panels are st.fragments — a chat message reruns only the
+      chat, not the sidebar, concept column or metrics
+  16. Progress comes from the student's LearnerState (built once at login,
+      updated by the log writers) instead of scanning Assessment_Logs;
+      agent_completed is a per-session copy of its active-module entry
+  17. The session is checkpointed after every turn and restored at login
+      (database_manager.checkpoint_session / restore_session)
 
 Group behaviour:
   CON   — Four-tier diagnostic only. No AI. Pre/post data collected.
@@ -25,21 +35,22 @@ Group behaviour:
 """
 
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import pandas as pd
 import plotly.express as px
 from database_manager import (
-    get_spreadsheet, log_assessment, log_temporal_trace,
+    read_sheet, log_assessment, log_temporal_trace,
     log_tap_event, log_rep_event,
+    log_conversation_turn, fetch_attempt_history, load_learner_state,
+    mark_agent_completed,
+    checkpoint_session,
 )
 from datetime import datetime, timedelta
 
 # ── Multi-agent system ────────────────────────────────────────────────────────
 from agents import (
-    AGENTS, AGENT_SEQUENCE, ALL_SIGNAL_CODES,
+    AGENTS, ChatTranscript, as_transcript,
     initialise_agent, call_agent,
-    detect_tap_level, detect_rep_level,
-    detect_hypothesis_quality, detect_evidence_quality,
-    detect_communication_level, detect_redirect,
 )
 
 # ── Group access control and language system ──────────────────────────────────
@@ -54,7 +65,7 @@ from config import (
 from sandesh_module import render_sandesh_open_response
 from mmale_components import (
     render_orientation, render_rupak_multimodal,
-    render_group_info, render_progress_journey,
+    render_group_info, render_progress_journey, render_chat_history,
 )
 
 SHEET_KEY = "1UqWkZKJdT2CQkZn5-MhEzpSRHsKE4qAeA17H0BOnK60"
@@ -119,8 +130,21 @@ def show():
     user  = st.session_state.user
     uid   = str(user.get("User_ID", "")).upper()
     # FIX 4: normalise group name ("Control" → "CON", "School A" → "SA" etc.)
+    # Group_Code is resolved once by the participant directory at login.
     from config import normalise_group
-    group = normalise_group(str(user.get("Group", "CON")))
+    group = user.get("Group_Code") or normalise_group(str(user.get("Group", "CON")))
+
+    # ── Learner state ─────────────────────────────────────────────────────────
+    # Built at login; agent_completed is a copy of its active-module entry
+    learner = load_learner_state(uid, group)
+    module  = st.session_state.get("active_module")
+    if module:
+        m_id = module.get("Sub_Title", "")
+        # a restored checkpoint may hold completions not yet in storage
+        for key, done in (st.session_state.get("agent_completed") or {}).items():
+            if done:
+                learner.mark_completed(m_id, key)
+        st.session_state.agent_completed = learner.agents_completed(m_id)
 
     # ── Language ──────────────────────────────────────────────────────────────
     lang = render_language_selector(sidebar=True)   # FIX 7
@@ -228,23 +252,12 @@ def render_modules(uid: str, group: str, lang: str = "ne"):
         st.header("📚 Learning Modules")
 
     try:
-        sh = get_spreadsheet()
-
-        # ── Load completed modules for this student ───────────────────────────
-        log_df = pd.DataFrame(sh.worksheet("Assessment_Logs").get_all_records())
-        finished_modules = []
-        if not log_df.empty:
-            log_df.columns = [c.strip() for c in log_df.columns]
-            user_mask   = (log_df["User_ID"].astype(str).str.upper().str.strip()
-                           == uid.strip().upper())
-            status_mask = log_df["Status"].astype(str).str.strip() == "POST"
-            finished_modules = (
-                log_df[user_mask & status_mask]["Module_ID"]
-                .astype(str).str.strip().tolist()
-            )
+        # ── Completed modules for this student (learner state) ────────────────
+        learner          = load_learner_state(uid, group)
+        finished_modules = learner.finished_modules()
 
         # ── Load available modules for this group ─────────────────────────────
-        m_df = pd.DataFrame(sh.worksheet("Instructional_Materials").get_all_records())
+        m_df = read_sheet("Instructional_Materials")
 
         if m_df.empty:
             st.info("No modules deployed yet. Please wait for your teacher to add content." if lang == "en"
@@ -299,6 +312,9 @@ def render_modules(uid: str, group: str, lang: str = "ne"):
 
         # ── FIX 2: Check if CON student needs Tier 5-6 form ──────────────────
         pending_post = st.session_state.get("con_pending_post_module")
+        if not pending_post and is_control(group) and learner.pending_post:
+            # Diagnostic logged but the form was not saved (e.g. a reload)
+            pending_post = learner.pending_post[0]
         if pending_post and is_control(group):
             # Find the module row
             match_rows = available[
@@ -389,10 +405,11 @@ def render_modules(uid: str, group: str, lang: str = "ne"):
                 return
 
             # FIX 1: Double-log guard using module-specific key
+            started_at = get_nepal_time()
             log_key = f"logged_initial_{uid}_{m_id}"
             if not st.session_state.get(log_key, False):
                 log_assessment(uid, group, m_id, t1, t2, t3, t4,
-                               "INITIAL", get_nepal_time())
+                               "INITIAL", started_at)
                 st.session_state[log_key] = True
 
             context = {
@@ -411,6 +428,8 @@ def render_modules(uid: str, group: str, lang: str = "ne"):
             st.session_state.current_rep_level = "MONADIC"
             st.session_state.agent_completed   = {}
             st.session_state.mastery_triggered = False
+            # Chat history restored on reload starts here (this attempt only)
+            st.session_state.module_started_at = started_at
 
             for key in ["khoji", "praman", "tarka", "rupak", "sandesh"]:
                 st.session_state[f"{key}_messages"] = None
@@ -422,6 +441,7 @@ def render_modules(uid: str, group: str, lang: str = "ne"):
                 st.session_state.current_tab = "📚 Learning Modules"
             else:
                 st.session_state.current_tab = AGENT_TAB_MAP["SAATHI"]
+            checkpoint_session(uid)
             st.rerun()
 
     except Exception as e:
@@ -511,6 +531,7 @@ def render_con_post_form(uid: str, group: str, module: dict, lang: str):
                 st.session_state.active_module     = None
                 st.session_state.mastery_triggered = False
                 st.session_state.current_tab       = "📚 Learning Modules"
+                checkpoint_session(uid)
                 st.rerun()
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -579,10 +600,18 @@ def render_agent_chat(uid: str, group: str, agent_key: str, lang: str = "ne"):
                 "rep_level": st.session_state.get("current_rep_level", "MONADIC"),
                 "lang":      lang,
             }
+            # Resume this attempt's conversation with the agent (e.g. after reload)
+            restored = fetch_attempt_history(
+                uid, module.get("Sub_Title", "Unknown"), agent_key
+            )
             st.session_state[msg_key] = initialise_agent(agent_key, ctx)
-            st.session_state[f"{agent_key.lower()}_turn"] = 0
+            st.session_state[msg_key].extend(restored)
+            st.session_state[f"{agent_key.lower()}_turn"] = sum(
+                1 for m in restored if m["role"] == "user"
+            )
 
-    messages = st.session_state.get(msg_key, [])
+    messages = as_transcript(st.session_state.get(msg_key)) or ChatTranscript()
+    st.session_state[msg_key] = messages
 
     # ── Post-mastery forms ────────────────────────────────────────────────────
     completed = st.session_state.get("agent_completed", {})
@@ -643,174 +672,230 @@ def render_agent_chat(uid: str, group: str, agent_key: str, lang: str = "ne"):
     col_phenom, col_chat = st.columns([1, 1.5], gap="large")
 
     with col_phenom:
-        if lang == "ko":
-            st.markdown("### 📝 현재 개념")
-        elif lang == "ne":
-            st.markdown("### 📝 वर्तमान अवधारणा")
-        else:
-            st.markdown("### 📝 Current Concept")
-
-        with st.container(border=True):
-            st.subheader(module.get("Sub_Title", ""))
-            st.write(f"**Q:** {module.get('Diagnostic_Question', '')}")
-            st.write("---")
-            for letter, opt_key in zip("ABCD",
-                ["Option_A","Option_B","Option_C","Option_D"]):
-                st.write(f"{letter}) {module.get(opt_key, '')}")
-
-        with st.container(border=True):
-            st.caption("🔬 Research Instrument")
-            st.markdown(f"**{agent['instrument']}**")
-            if agent_key == "TARKA":
-                st.metric("TAP Level", st.session_state.get("current_tap_level","TAP_1"))
-            if agent_key == "RUPAK":
-                st.metric("Rep Level", st.session_state.get("current_rep_level","MONADIC"))
-            if agent_key == "KHOJI":
-                q_level = st.session_state.get("current_q_level", "—")
-                st.metric("Question Quality", q_level)
-            if agent_key == "PRAMAN":
-                eq_level = st.session_state.get("current_eq_level", "—")
-                st.metric("Evidence Quality", eq_level)
+        _phenomenon_panel(module, lang)
+        _instrument_panel(agent_key)
 
     with col_chat:
-        st.subheader(f"{agent['icon']} {agent['name']}")
-        if lang == "ko":
-            from config import KOREAN_PRACTICE
-            st.caption(KOREAN_PRACTICE.get(agent_key, (agent['role'],""))[1])
-        else:
-            st.caption(f"{agent['role']} | {agent['practice']}")
-
-        # Render conversation history
-        for m in messages[1:]:
-            content = m.get("content", "")
-            if isinstance(content, list):
-                content = " ".join(
-                    p.get("text","") for p in content
-                    if isinstance(p,dict) and p.get("type")=="text"
-                )
-            for code in ALL_SIGNAL_CODES:
-                content = content.replace(code, "")
-            with st.chat_message(m["role"]):
-                st.markdown(content.strip())
-
-        # Chat input
-        placeholder = CHAT_PLACEHOLDERS.get(agent_key, {}).get(lang, "Type here...")
-
-        if prompt := st.chat_input(placeholder):
-            messages.append({"role": "user", "content": prompt})
-
-            with st.spinner(f"{agent['icon']} {agent['nepali_name']} AI..."):
-                result = call_agent(
-                    agent_key = agent_key,
-                    messages  = messages,
-                    api_key   = st.secrets["OPENAI_API_KEY"],
-                )
-
-            ai_content = result["content"]
-            messages.append({"role": "assistant", "content": ai_content})
-            st.session_state[msg_key] = messages
-
-            topic = module.get("Sub_Title", "Unknown")
-
-            # ── Research logging ──────────────────────────────────────────────
-            log_temporal_trace(
-                uid, agent["db_log_type"],
-                f"Topic:{topic}|Agent:{agent_key}|Group:{group}|"
-                f"Lang:{lang}|Turn:STUDENT|Msg:{prompt[:300]}"
+        _chat_panel(uid, group, agent_key, module, lang)
+
+
+# ── Agent chat panels ─────────────────────────────────────────────────────────
+# Original: every chat submission ran the whole script twice (the chat_input
+# rerun, then st.rerun()), rebuilding the sidebar menu, the concept column,
+# the research-instrument metrics and the full history each time. Now each
+# panel is an st.fragment: a new message reruns only _chat_panel, and the
+# page reruns only for redirects, completion and changed research levels.
+
+def _research_levels():
+    return tuple(st.session_state.get(k) for k in (
+        "current_tap_level", "current_rep_level",
+        "current_q_level", "current_eq_level",
+    ))
+
+
+def _rerun_chat_panel():
+    # scope="fragment" is only valid while the fragment itself is rerunning;
+    # a message handled during a full-page run reruns the page as before
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+@st.fragment
+def _phenomenon_panel(module: dict, lang: str):
+    if lang == "ko":
+        st.markdown("### 📝 현재 개념")
+    elif lang == "ne":
+        st.markdown("### 📝 वर्तमान अवधारणा")
+    else:
+        st.markdown("### 📝 Current Concept")
+
+    with st.container(border=True):
+        st.subheader(module.get("Sub_Title", ""))
+        st.write(f"**Q:** {module.get('Diagnostic_Question', '')}")
+        st.write("---")
+        for letter, opt_key in zip("ABCD",
+            ["Option_A","Option_B","Option_C","Option_D"]):
+            st.write(f"{letter}) {module.get(opt_key, '')}")
+
+
+@st.fragment
+def _instrument_panel(agent_key: str):
+    agent = AGENTS[agent_key]
+    with st.container(border=True):
+        st.caption("🔬 Research Instrument")
+        st.markdown(f"**{agent['instrument']}**")
+        if agent_key == "TARKA":
+            st.metric("TAP Level", st.session_state.get("current_tap_level","TAP_1"))
+        if agent_key == "RUPAK":
+            st.metric("Rep Level", st.session_state.get("current_rep_level","MONADIC"))
+        if agent_key == "KHOJI":
+            q_level = st.session_state.get("current_q_level", "—")
+            st.metric("Question Quality", q_level)
+        if agent_key == "PRAMAN":
+            eq_level = st.session_state.get("current_eq_level", "—")
+            st.metric("Evidence Quality", eq_level)
+
+
+@st.fragment
+def _chat_panel(uid: str, group: str, agent_key: str, module: dict, lang: str):
+    agent    = AGENTS[agent_key]
+    msg_key  = f"{agent_key.lower()}_messages"
+    messages = as_transcript(st.session_state.get(msg_key)) or ChatTranscript()
+
+    st.subheader(f"{agent['icon']} {agent['name']}")
+    if lang == "ko":
+        from config import KOREAN_PRACTICE
+        st.caption(KOREAN_PRACTICE.get(agent_key, (agent['role'],""))[1])
+    else:
+        st.caption(f"{agent['role']} | {agent['practice']}")
+
+    # Render conversation history (last turns; earlier ones on demand)
+    render_chat_history(messages, msg_key, lang)
+
+    # Chat input
+    placeholder = CHAT_PLACEHOLDERS.get(agent_key, {}).get(lang, "Type here...")
+
+    if prompt := st.chat_input(placeholder):
+        levels_before = _research_levels()
+        messages.append({"role": "user", "content": prompt})
+
+        with st.chat_message("user"):
+            st.markdown(prompt)
+        # Stream the reply into its bubble; signal codes are filtered out
+        with st.chat_message("assistant"):
+            stream = call_agent(
+                agent_key = agent_key,
+                messages  = messages,
+                api_key   = st.secrets["OPENAI_API_KEY"],
+                stream    = True,
+                module_id = module.get("Sub_Title", "Unknown"),
+                group     = group,
             )
-            signals = (
-                f"|TAP:{result['tap_level']}" if result.get("tap_level") else ""
-            ) + (
-                f"|REP:{result['rep_level']}" if result.get("rep_level") else ""
-            ) + (
-                f"|HQ:{result['hypothesis_level']}" if result.get("hypothesis_level") else ""
-            ) + (
-                f"|EQ:{result['evidence_level']}" if result.get("evidence_level") else ""
+            st.write_stream(stream)
+        result = stream.result
+
+        ai_content = result["content"]
+        messages.append({"role": "assistant", "content": ai_content})
+        st.session_state[msg_key] = messages
+
+        topic = module.get("Sub_Title", "Unknown")
+
+        # ── Research logging ──────────────────────────────────────────────
+        turn = sum(1 for m in messages if m["role"] == "user")
+        log_conversation_turn(uid, topic, agent_key, turn, "user", prompt,
+                              result["prompt_hash"])
+        log_conversation_turn(uid, topic, agent_key, turn, "assistant",
+                              ai_content, result["prompt_hash"])
+        log_temporal_trace(
+            uid, agent["db_log_type"],
+            f"Topic:{topic}|Agent:{agent_key}|Group:{group}|"
+            f"Lang:{lang}|Turn:STUDENT|Msg:{prompt[:300]}"
+        )
+        signals = (
+            f"|TAP:{result['tap_level']}" if result.get("tap_level") else ""
+        ) + (
+            f"|REP:{result['rep_level']}" if result.get("rep_level") else ""
+        ) + (
+            f"|HQ:{result['hypothesis_level']}" if result.get("hypothesis_level") else ""
+        ) + (
+            f"|EQ:{result['evidence_level']}" if result.get("evidence_level") else ""
+        ) + (
+            "|CACHED" if result.get("cached") else ""
+        ) + (
+            f"|DEGRADED:{result['degraded_reason']}" if result.get("degraded") else ""
+        )
+        log_temporal_trace(
+            uid, agent["db_log_type"],
+            f"Topic:{topic}|Agent:{agent_key}|Group:{group}|"
+            f"Turn:AI{signals}|Msg:{ai_content[:300]}"
+        )
+
+        # Granular ArgLog / RepLog
+        if agent_key == "TARKA":
+            st.session_state["tarka_turn"] = (
+                st.session_state.get("tarka_turn", 0) + 1
             )
-            log_temporal_trace(
-                uid, agent["db_log_type"],
-                f"Topic:{topic}|Agent:{agent_key}|Group:{group}|"
-                f"Turn:AI{signals}|Msg:{ai_content[:300]}"
+            log_tap_event(uid, group, topic,
+                          result.get("tap_level"),
+                          st.session_state["tarka_turn"],
+                          prompt, ai_content)
+
+        if agent_key == "RUPAK":
+            st.session_state["rupak_turn"] = (
+                st.session_state.get("rupak_turn", 0) + 1
             )
-
-            # Granular ArgLog / RepLog
-            if agent_key == "TARKA":
-                st.session_state["tarka_turn"] = (
-                    st.session_state.get("tarka_turn", 0) + 1
-                )
-                log_tap_event(uid, group, topic,
-                              result.get("tap_level"),
-                              st.session_state["tarka_turn"],
-                              prompt, ai_content)
-
-            if agent_key == "RUPAK":
-                st.session_state["rupak_turn"] = (
-                    st.session_state.get("rupak_turn", 0) + 1
-                )
-                log_rep_event(uid, group, topic,
-                              result.get("rep_level"),
-                              st.session_state["rupak_turn"],
-                              prompt, ai_content)
-
-            # ── Update research state metrics ─────────────────────────────────
-            if result.get("tap_level"):
-                st.session_state.current_tap_level = result["tap_level"]
-            if result.get("rep_level"):
-                st.session_state.current_rep_level = result["rep_level"]
-            if result.get("hypothesis_level"):
-                st.session_state.current_q_level = result["hypothesis_level"]
-            if result.get("evidence_level"):
-                st.session_state.current_eq_level = result["evidence_level"]
-
-            # ── Completion detection ──────────────────────────────────────────
-            ca = st.session_state.get("agent_completed", {})
-
-            if agent_key == "SAATHI" and result.get("mastery"):
-                ca["SAATHI"] = True
-                st.session_state.mastery_triggered = True
-
-            if agent_key == "KHOJI" and result.get("hypothesis_level") == "HYPOTHESIS":
-                ca["KHOJI"] = True
-                log_temporal_trace(uid, "KHOJI_COMPLETE",
-                                   f"Topic:{topic}|Group:{group}")
-
-            if agent_key == "PRAMAN" and result.get("evidence_level") == "EQ3":
-                ca["PRAMAN"] = True
-                log_temporal_trace(uid, "PRAMAN_COMPLETE",
-                                   f"Topic:{topic}|Group:{group}")
-
-            if agent_key == "TARKA":
-                tap = result.get("tap_level")
-                if tap in ("TAP_3","TAP_4","TAP_5"):
-                    ca["TARKA"] = True
-                    log_assessment(uid, group, topic, "N/A","N/A",
-                                   f"Argumentation at {tap}","N/A",
-                                   f"TAP_COMPLETE_{tap}", get_nepal_time())
-
-            if agent_key == "RUPAK" and result.get("triadic"):
-                ca["RUPAK"] = True
+            log_rep_event(uid, group, topic,
+                          result.get("rep_level"),
+                          st.session_state["rupak_turn"],
+                          prompt, ai_content)
+
+        # ── Update research state metrics ─────────────────────────────────
+        if result.get("tap_level"):
+            st.session_state.current_tap_level = result["tap_level"]
+        if result.get("rep_level"):
+            st.session_state.current_rep_level = result["rep_level"]
+        if result.get("hypothesis_level"):
+            st.session_state.current_q_level = result["hypothesis_level"]
+        if result.get("evidence_level"):
+            st.session_state.current_eq_level = result["evidence_level"]
+
+        # ── Completion detection ──────────────────────────────────────────
+        if agent_key == "SAATHI" and result.get("mastery"):
+            mark_agent_completed(uid, topic, "SAATHI")
+            st.session_state.mastery_triggered = True
+
+        if agent_key == "KHOJI" and result.get("hypothesis_level") == "HYPOTHESIS":
+            mark_agent_completed(uid, topic, "KHOJI")
+            log_temporal_trace(uid, "KHOJI_COMPLETE",
+                               f"Topic:{topic}|Group:{group}")
+
+        if agent_key == "PRAMAN" and result.get("evidence_level") == "EQ3":
+            mark_agent_completed(uid, topic, "PRAMAN")
+            log_temporal_trace(uid, "PRAMAN_COMPLETE",
+                               f"Topic:{topic}|Group:{group}")
+
+        if agent_key == "TARKA":
+            tap = result.get("tap_level")
+            if tap in ("TAP_3","TAP_4","TAP_5"):
+                mark_agent_completed(uid, topic, "TARKA")
                 log_assessment(uid, group, topic, "N/A","N/A",
-                               "Triadic fluency","N/A",
-                               "TRIADIC_COMPLETE", get_nepal_time())
-
-            if agent_key == "SANDESH" and result.get("comm_complete"):
-                ca["SANDESH"] = True
-                log_assessment(uid, group, topic, "N/A","N/A",
-                               "Full ecology complete","N/A",
-                               "ECOLOGY_COMPLETE", get_nepal_time())
-
-            st.session_state.agent_completed = ca
+                               f"Argumentation at {tap}","N/A",
+                               f"TAP_COMPLETE_{tap}", get_nepal_time())
+
+        if agent_key == "RUPAK" and result.get("triadic"):
+            mark_agent_completed(uid, topic, "RUPAK")
+            log_assessment(uid, group, topic, "N/A","N/A",
+                           "Triadic fluency","N/A",
+                           "TRIADIC_COMPLETE", get_nepal_time())
+
+        if agent_key == "SANDESH" and result.get("comm_complete"):
+            mark_agent_completed(uid, topic, "SANDESH")
+            log_assessment(uid, group, topic, "N/A","N/A",
+                           "Full ecology complete","N/A",
+                           "ECOLOGY_COMPLETE", get_nepal_time())
+
+        # ── FIX 9: Full redirect map for all 6 agents ─────────────────────
+        redirect = result.get("redirect")
+        if redirect and redirect in AGENT_TAB_MAP:
+            # Only redirect if target agent is accessible to this group
+            if agent_accessible(redirect, group):
+                st.info(f"🔄 → {AGENTS[redirect]['name']}")
+                st.session_state.current_tab = AGENT_TAB_MAP[redirect]
+                checkpoint_session(uid)
+                st.rerun()
 
-            # ── FIX 9: Full redirect map for all 6 agents ─────────────────────
-            redirect = result.get("redirect")
-            if redirect and redirect in AGENT_TAB_MAP:
-                # Only redirect if target agent is accessible to this group
-                if agent_accessible(redirect, group):
-                    st.info(f"🔄 → {AGENTS[redirect]['name']}")
-                    st.session_state.current_tab = AGENT_TAB_MAP[redirect]
-                    st.rerun()
+        checkpoint_session(uid)
 
+        # Completion or a new research level changes panels outside this
+        # fragment (completion screen, metrics), so rerun the page;
+        # otherwise redraw only the chat.
+        completed_now = st.session_state.get("agent_completed", {}).get(agent_key)
+        if completed_now or _research_levels() != levels_before:
             st.rerun()
+        _rerun_chat_panel()
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # TIER 5 & 6 REVISION FORM
@@ -869,6 +954,7 @@ def render_revision_form(uid: str, group: str, module: dict, lang: str = "ne"):
                 st.session_state.current_tab = AGENT_TAB_MAP["TARKA"]
             else:
                 st.session_state.current_tab = "🏠 Dashboard"
+            checkpoint_session(uid)
             st.rerun()
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -885,17 +971,9 @@ def render_metacognitive_dashboard(uid: str, lang: str = "ne"):
     st.markdown("---")
 
     try:
-        # FIX 12: use get_spreadsheet()
-        sh     = get_spreadsheet()
-        log_df = pd.DataFrame(sh.worksheet("Assessment_Logs").get_all_records())
-
-        if log_df.empty:
-            st.info("No data yet. Start a learning module to see your progress!")
-            return
-
-        user_data = log_df[
-            log_df["User_ID"].astype(str).str.upper() == uid.upper()
-        ].copy()
+        # This student's Assessment_Logs rows, kept by the learner state
+        learner   = load_learner_state(uid)
+        user_data = pd.DataFrame(learner.assessment_rows())
 
         if user_data.empty:
             st.info("Complete your first module to unlock analytics.")
@@ -913,6 +991,8 @@ def render_metacognitive_dashboard(uid: str, lang: str = "ne"):
         m3.metric("Arguments",    len(tap_rows))
         m4.metric("Models",       len(rep_rows))
         m5.metric("Full Ecology", len(eco_rows))
+        st.caption(f"Best TAP level: {learner.best_tap or '—'} · "
+                   f"Best representational level: {learner.best_rep or '—'}")
 
         # Confidence evolution chart
         if lang == "ko":
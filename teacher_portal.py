@@ -23,12 +23,10 @@ import pandas as pd
 import plotly.express as px
 from database_manager import (
     save_bulk_concepts, upload_to_drive,
-    get_gspread_client, save_assignment,
+    save_assignment, read_sheet,
 )
 from datetime import datetime
 
-SHEET_KEY = "1UqWkZKJdT2CQkZn5-MhEzpSRHsKE4qAeA17H0BOnK60"
-
 # Column name normalisation — same map as researcher_portal
 COL_RENAME = {
     "Tier_1 (Answer)":         "T1",
@@ -44,9 +42,9 @@ CONF_MAP = {"Guessing": 1, "Unsure": 2, "Sure": 3, "Very Sure": 4}
 TAP_ORDER = ["TAP_1", "TAP_2", "TAP_3", "TAP_4", "TAP_5"]
 
 
-def _load_logs(sh) -> pd.DataFrame:
-    """Load and normalise Assessment_Logs column names."""
-    df = pd.DataFrame(sh.worksheet("Assessment_Logs").get_all_records())
+def _load_logs() -> pd.DataFrame:
+    """Load (from the local replica) and normalise Assessment_Logs column names."""
+    df = read_sheet("Assessment_Logs")
     if df.empty:
         return df
     df.rename(columns=COL_RENAME, inplace=True)
@@ -203,9 +201,7 @@ def show():
         st.header("📊 Student Progress Analytics")
 
         try:
-            client = get_gspread_client()
-            sh = client.open_by_key(SHEET_KEY)
-            df = _load_logs(sh)
+            df = _load_logs()
 
             if df.empty:
                 st.info("Waiting for students to submit diagnostic data...")
@@ -345,7 +341,7 @@ def show():
                 # ── Section C: TAP level distribution from ArgLog ──────────────
                 st.subheader("⚖️ Argumentation Quality (Tarka AI — ArgLog)")
                 try:
-                    arg_df = pd.DataFrame(sh.worksheet("ArgLog").get_all_records())
+                    arg_df = read_sheet("ArgLog")
                     if not arg_df.empty:
                         tap_counts = (
                             arg_df.groupby("TAP_Level")
@@ -392,11 +388,7 @@ def show():
     with tab4:
         st.subheader("Active Modules")
         try:
-            client = get_gspread_client()
-            sh = client.open_by_key(SHEET_KEY)
-            m_df = pd.DataFrame(
-                sh.worksheet("Instructional_Materials").get_all_records()
-            )
+            m_df = read_sheet("Instructional_Materials")
             if not m_df.empty:
                 # Show only columns that exist in the sheet
                 display_cols = [
@@ -0,0 +1,43 @@
+"""
+test_agent_engine.py — Agent engine smoke test
+===============================================
+Completes one chat request through agent_engine against an in-process
+mock_llm_server, so a broken HTTP client setup (for example a missing
+package) fails here instead of turning every student turn into
+DEGRADED_REPLY.
+
+    python test_agent_engine.py        # or: python -m pytest test_agent_engine.py
+"""
+
+import os
+
+from mock_llm_server import start_mock_server
+
+
+def test_engine_completes_against_mock_server():
+    server, base_url = start_mock_server()
+    previous = os.environ.get("OPENAI_BASE_URL")
+    os.environ["OPENAI_BASE_URL"] = base_url
+    try:
+        from agent_engine import AgentEngine
+
+        engine = AgentEngine(max_in_flight=1)
+        response = engine.complete(
+            "mock-key", deadline=30,
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": "Say hello"}],
+        )
+        assert response.choices[0].message.content
+        stats = engine.stats()
+        assert stats["completed"] == 1 and stats["failed"] == 0
+    finally:
+        server.shutdown()
+        if previous is None:
+            os.environ.pop("OPENAI_BASE_URL", None)
+        else:
+            os.environ["OPENAI_BASE_URL"] = previous
+
+
+if __name__ == "__main__":
+    test_engine_completes_against_mock_server()
+    print("✅ agent engine completed one request against the mock server")
@@ -0,0 +1,69 @@
+"""
+test_chat_history.py — Chat history restore check
+==================================================
+fetch_chat_history(since=...) must return only the turns of the current
+attempt at a module, and the attempt starts at the latest INITIAL row
+(LearnerState.attempt_started) when the session has no start time.
+Runs on the in-memory storage backend; no Sheets access.
+
+    python test_chat_history.py        # or: python -m pytest test_chat_history.py
+"""
+
+import os
+
+os.environ.setdefault("MMALE_STORAGE_BACKEND", "memory")
+
+from storage_backends import TABLE_SCHEMAS
+
+
+def _row(table, **values):
+    return [values.get(column, "") for column in TABLE_SCHEMAS[table]]
+
+
+def test_history_is_limited_to_the_current_attempt():
+    import config
+    import database_manager as db
+    from learner_state import LearnerState
+
+    # config may already have been imported (e.g. by another test module)
+    # before the environment variable above was set.
+    previous, config.STORAGE_BACKEND = config.STORAGE_BACKEND, "memory"
+    try:
+        _check_current_attempt(db, LearnerState)
+    finally:
+        config.STORAGE_BACKEND = previous
+
+
+def _check_current_attempt(db, LearnerState):
+    storage = db.get_storage()
+    uid, module = "STD_TEST_HISTORY", "Ionic Bonding"
+    storage.append_event("Assessment_Logs", _row(
+        "Assessment_Logs", Timestamp="2026-01-01 10:00:00", User_ID=uid,
+        Module_ID=module, Status="INITIAL"))
+    for ts, role, text in [("2026-01-01 10:01:00", "user", "first attempt"),
+                           ("2026-01-01 10:01:05", "assistant", "old reply")]:
+        storage.append_event("Conversations", _row(
+            "Conversations", Timestamp=ts, User_ID=uid, Module_ID=module,
+            Agent="RUPAK", Turn=1, Role=role, Content=text))
+    storage.append_event("Assessment_Logs", _row(
+        "Assessment_Logs", Timestamp="2026-01-02 09:00:00", User_ID=uid,
+        Module_ID=module, Status="INITIAL"))
+    for ts, role, text in [("2026-01-02 09:02:00", "user", "my model [image]"),
+                           ("2026-01-02 09:02:07", "assistant", "new reply")]:
+        storage.append_event("Conversations", _row(
+            "Conversations", Timestamp=ts, User_ID=uid, Module_ID=module,
+            Agent="RUPAK", Turn=1, Role=role, Content=text))
+
+    everything = db.fetch_chat_history(uid, module, "RUPAK")
+    assert [m["content"] for m in everything] == [
+        "first attempt", "old reply", "my model [image]", "new reply"]
+
+    since = LearnerState.load(uid, "", storage).attempt_started(module)
+    assert since == "2026-01-02 09:00:00"
+    current = db.fetch_chat_history(uid, module, "RUPAK", since=since)
+    assert [m["content"] for m in current] == ["my model [image]", "new reply"]
+
+
+if __name__ == "__main__":
+    test_history_is_limited_to_the_current_attempt()
+    print("✅ chat history restores only the current attempt")